@@ -3,11 +3,264 @@ This module contains configuration variables and constants
 that are used across different parts of the application.
 """
             
-HEADLESS_OPTIONS = [ "--headless=new","--disable-gpu", "--disable-dev-shm-usage","--window-size=1920,1080","--disable-search-engine-choice-screen"]
+HEADLESS_OPTIONS = [ "--headless=new","--disable-gpu", "--disable-dev-shm-usage","--window-size=1920,1080","--disable-search-engine-choice-screen",
+                     "--mute-audio","--disable-extensions","--disable-background-networking","--disable-default-apps","--disable-sync","--no-first-run"]
 
 LLAMA_MODEL_FULLNAME="lmstudio-community/Meta-Llama-3.1-8B-Instruct-GGUF"
 GROQ_LLAMA_MODEL_FULLNAME="llama-3.1-70b-versatile"
 
+# Browser pool: how many Chrome sessions run at once, how many pages one session serves
+# before it is restarted, and how long a caller waits for a free session
+DRIVER_POOL_SIZE = 2
+DRIVER_MAX_PAGES_PER_SESSION = 50
+DRIVER_CHECKOUT_TIMEOUT = 300
+
+# Request blocking for rendered fetches: BROWSER_BLOCK_PROFILE picks one of BROWSER_BLOCK_PROFILES,
+# each naming the resource types (see BLOCKED_RESOURCE_PATTERNS) and whether tracker and ad
+# hosts are blocked. Patterns use the * wildcard of Chrome's Network.setBlockedURLs.
+BROWSER_BLOCK_PROFILE = "lean"
+BROWSER_BLOCK_PROFILES = {
+    "none": {"resource_types": [], "block_trackers": False},
+    "lean": {"resource_types": ["image", "font", "media"], "block_trackers": True},
+    "text": {"resource_types": ["image", "font", "media", "stylesheet"], "block_trackers": True},
+}
+BLOCKED_RESOURCE_PATTERNS = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.bmp", "*.ico", "*.svg"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.mov", "*.m3u8", "*.ts", "*.mp3", "*.m4a", "*.ogg", "*.wav"],
+    "stylesheet": ["*.css"],
+}
+BLOCKED_TRACKER_PATTERNS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*googleadservices.com*", "*adservice.google.*", "*connect.facebook.net*", "*facebook.com/tr*",
+    "*bat.bing.com*", "*hotjar.com*", "*segment.io*", "*segment.com/analytics*", "*scorecardresearch.com*",
+    "*amazon-adsystem.com*", "*criteo.*", "*taboola.com*", "*outbrain.com*", "*adnxs.com*", "*quantserve.com*",
+]
+
+# Multi-URL scraping: how many URLs are processed at once overall, and how
+# hard a single domain may be hit (requests in flight, seconds between requests)
+MAX_CONCURRENT_URLS = 4
+PER_DOMAIN_MAX_IN_FLIGHT = 2
+PER_DOMAIN_MIN_DELAY = 1.0
+
+# Page settling: a page counts as loaded once no fetch/XHR is pending and neither the DOM
+# nor the scroll height changed for SETTLE_QUIET_PERIOD seconds, or SETTLE_TIMEOUT elapsed.
+# Scrolling stops after SCROLL_MAX_STABLE_ATTEMPTS settled scrolls that add no content.
+SETTLE_TIMEOUT = 10
+SETTLE_QUIET_PERIOD = 0.5
+SETTLE_POLL_INTERVAL = 0.1
+SCROLL_SETTLE_TIMEOUT = 5
+SCROLL_MAX_STABLE_ATTEMPTS = 2
+
+# Low-memory mode, for very large and infinite-scroll pages: the browser reduces the page to
+# its main content (the first MAIN_CONTENT_SELECTORS match holding a fair share of the text,
+# else the body) without MAIN_CONTENT_DROP_TAGS, and it is streamed to a file in the run's
+# output folder LOW_MEMORY_SLICE_CHARS at a time. Scrolling stops once the page has
+# LOW_MEMORY_MAX_DOM_ELEMENTS elements, and only per-page summaries with file paths are
+# kept for the results, of which LOW_MEMORY_PREVIEW_ROWS records are shown.
+LOW_MEMORY_MODE = False
+LOW_MEMORY_SLICE_CHARS = 1024 * 1024
+LOW_MEMORY_MAX_DOM_ELEMENTS = 200000
+LOW_MEMORY_PREVIEW_ROWS = 200
+MAIN_CONTENT_SELECTORS = ["main", "[role='main']", "#main", "#content", ".content", "article"]
+MAIN_CONTENT_DROP_TAGS = ["script", "style", "noscript", "svg", "canvas", "iframe", "video", "audio", "picture",
+                          "template", "link", "meta"]
+
+# Fetch mode: "auto" tries a plain HTTP request first and falls back to the browser
+# when the page looks JavaScript-rendered, "http" and "browser" force one or the other
+FETCH_MODE = "auto"
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
+HTTP_TIMEOUT = 20
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 16
+# Pages with less visible body text than this, or containing one of the markers
+# of an empty client-side app shell, are re-fetched with the browser
+MIN_SERVER_RENDERED_TEXT_CHARS = 500
+SPA_SHELL_MARKERS = [
+    '<div id="root"></div>',
+    '<div id="app"></div>',
+    '<div id="__nuxt"></div>',
+    '<app-root></app-root>',
+    'enable javascript to run this app',
+]
+# After this many browser fallbacks (and no HTTP success) a domain goes straight to the browser
+BROWSER_PREFERENCE_THRESHOLD = 2
+
+# Page cache: fetched HTML and converted markdown are kept on disk for PAGE_CACHE_TTL
+# seconds (then revalidated with ETag/Last-Modified when possible), and the least
+# recently used entries are evicted once the cache grows beyond PAGE_CACHE_MAX_BYTES
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_DIR = ".scraper_cache/pages"
+PAGE_CACHE_TTL = 24 * 60 * 60
+PAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Job checkpoints: per-URL progress of every scrape and crawl job, for resuming them. Retrying a
+# job's failed URLs skips those already run JOB_MAX_URL_ATTEMPTS times, which keep failing for good.
+JOB_STORE_PATH = ".scraper_cache/jobs.sqlite3"
+JOB_MAX_URL_ATTEMPTS = 3
+
+# Distributed runs: a coordinator queues a job's pages in TASK_QUEUE_PATH and worker processes lease
+# them for TASK_LEASE_SECONDS (renewed while they work). Pages whose lease expires are handed to
+# another worker, and a page is given up after TASK_MAX_ATTEMPTS attempts. Workers on other hosts
+# need the queue file on a filesystem they all share.
+TASK_QUEUE_PATH = ".scraper_cache/tasks.sqlite3"
+TASK_LEASE_SECONDS = 300
+TASK_MAX_ATTEMPTS = 3
+TASK_POLL_INTERVAL = 1.0
+
+# Change detection: pages whose pruned markdown is identical to the last scrape's reuse the last
+# records instead of being extracted again. Setting CHANGE_SIMHASH_MAX_DISTANCE also treats pages
+# whose 64-bit SimHash differs by at most that many bits as unchanged; off by default, as a
+# changed price or date on a long listing barely moves the SimHash and its old records would be kept
+CHANGE_DETECTION_ENABLED = True
+CHANGE_STORE_PATH = ".scraper_cache/fingerprints.sqlite3"
+CHANGE_SIMHASH_MAX_DISTANCE = None
+
+# Selector templates: after an LLM extraction, XPath selectors for the record containers and
+# each field are learned from the page and kept per domain, then later pages of the domain
+# are extracted with them instead of the LLM. A template is kept only if its selectors find
+# at least SELECTOR_MIN_RECORDS records and reproduce SELECTOR_MIN_AGREEMENT of the LLM's
+# values for every field the LLM filled in on most records. A page falls back to the LLM
+# when a field is filled in on less than SELECTOR_MIN_FILL_RATIO of the rate seen when learning.
+SELECTOR_TEMPLATES_ENABLED = False
+SELECTOR_TEMPLATE_PATH = ".scraper_cache/selector_templates.sqlite3"
+SELECTOR_MIN_RECORDS = 3
+SELECTOR_MIN_AGREEMENT = 0.9
+SELECTOR_MIN_FILL_RATIO = 0.5
+
+# LLM response cache, keyed by system prompt, user content and model
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = ".scraper_cache/llm_responses.sqlite3"
+
+# Pages whose markdown is longer than EXTRACTION_CHUNK_TOKENS are split into chunks
+# that are extracted in parallel (at most EXTRACTION_MAX_PARALLEL_CHUNKS at a time)
+EXTRACTION_CHUNK_TOKENS = 6000
+EXTRACTION_MAX_PARALLEL_CHUNKS = 4
+
+# Pruning before extraction: HTML elements that never hold listing data, the ids and class
+# names (matched as whole tokens, so "cookie-recipes" or "trusted" are kept) of cookie/consent
+# banners and consent-manager containers, and the tracker hosts (optionally with a path prefix)
+# whose links only track users. COOKIE_BANNER_PATTERN is the looser substring pattern used to
+# scope consent buttons when accepting banners in the browser.
+PRUNE_HTML_TAGS = ["header", "footer", "nav", "script", "style", "noscript", "svg", "iframe", "template", "link", "meta"]
+COOKIE_BANNER_PATTERN = r"cookie|consent|gdpr|onetrust|didomi|usercentrics|truste|cc-banner|cc-window"
+COOKIE_BANNER_TOKENS = [
+    r"(?:cookies?|gdpr|consent)[-_]?(?:banner|bar|notice|popup|modal|dialog|overlay|wall|layer|consent|container)",
+    r"cookieconsent", r"cc-banner", r"cc-window", r"onetrust-consent-sdk", r"onetrust-banner-sdk", r"didomi-host",
+    r"didomi-notice", r"usercentrics-root", r"truste-consent-track", r"truste_box_overlay", r"CybotCookiebotDialog",
+    r"qc-cmp2-container", r"sp_message_container_\d+",
+]
+TRACKING_URL_PATTERNS = [
+    r"doubleclick\.net", r"google-analytics\.com", r"googletagmanager\.com", r"googleadservices\.com",
+    r"googlesyndication\.com", r"facebook\.com/tr", r"bat\.bing\.com", r"px\.ads\.linkedin\.com",
+    r"ct\.pinterest\.com", r"analytics\.twitter\.com", r"scorecardresearch\.com", r"mc\.yandex\.ru",
+]
+# A markdown line (up to BOILERPLATE_MAX_LINE_LENGTH chars) seen on this many pages of one site is boilerplate.
+# Off by default: what counts as boilerplate depends on which pages the process happened to see first, so
+# the same page can prune differently from run to run (missing the LLM cache and change fingerprints), and
+# data lines that repeat on every page ("In stock") are dropped too
+BOILERPLATE_PRUNING_ENABLED = False
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MAX_LINE_LENGTH = 200
+
+# HTML to markdown conversion: "lxml" parses each page once with lxml and emits markdown
+# from that tree, "html2text" is the original BeautifulSoup + html2text path
+HTML_CONVERTER = "lxml"
+
+# Rule-based pagination detection: query parameters that carry a page number, link texts
+# that mean "next" or "previous page", the confidence below which the LLM is asked instead,
+# and the most page URLs synthesized from one numbered pattern. Missing pages are only filled
+# in for links that look like a pager (labelled with their number, or next/previous); other
+# numbered links are taken as they are, and only if no two of them are more than
+# PAGINATION_MAX_PAGE_GAP pages apart (product ids are not page numbers).
+PAGE_QUERY_PARAMS = {"page", "p", "pg", "paged", "pagenum", "page_num", "pagenumber", "currentpage"}
+NEXT_LINK_TEXTS = {"next", "next page", "next »", "next ›", "next >", "»", "›", ">", ">>", "older posts", "more results"}
+PREVIOUS_LINK_TEXTS = {"previous", "prev", "previous page", "« previous", "‹ previous", "< previous", "«", "‹", "<", "<<",
+                       "newer posts"}
+PAGINATION_RULE_MIN_CONFIDENCE = 0.7
+MAX_SYNTHESIZED_PAGES = 500
+PAGINATION_MAX_PAGE_GAP = 10
+
+# Pagination crawl budget: total pages scraped and pagination hops away from a seed URL
+CRAWL_MAX_PAGES = 100
+CRAWL_MAX_DEPTH = 5
+
+# Streaming output: formats every run appends records to as pages finish ("jsonl", "csv",
+# "parquet" - the latter needs pyarrow) and the Parquet row group size
+OUTPUT_FORMATS = ["jsonl", "csv"]
+OUTPUT_ROW_GROUP_SIZE = 1000
+
+# LLM dispatcher: quotas of the Groq plan (requests and tokens per minute), requests sent
+# at once, retries with exponential backoff (seconds) on 429s and transient errors, and the
+# completion size assumed when reserving tokens before the real usage is known
+LLM_REQUESTS_PER_MINUTE = 30
+LLM_TOKENS_PER_MINUTE = 60000
+LLM_MAX_IN_FLIGHT = 8
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60.0
+LLM_EXPECTED_COMPLETION_TOKENS = 1024
+
+# Extraction backend: "groq" (hosted, rate limited) or "local", an OpenAI-compatible server
+# such as LM Studio running LLAMA_MODEL_FULLNAME. The local backend runs LOCAL_LLM_SLOTS requests
+# at once (match the server's parallel slots) and sends up to LOCAL_LLM_BATCH_SIZE prompts per
+# request, waiting at most LOCAL_LLM_BATCH_WAIT seconds to fill a batch; batched prompts go to
+# /completions and need the model's chat template. LOCAL_LLM_BASE_URL can also be set in the environment.
+EXTRACTION_BACKEND = "groq"
+LOCAL_LLM_BASE_URL = "http://localhost:1234/v1"
+LOCAL_LLM_SLOTS = 4
+LOCAL_LLM_BATCH_SIZE = 4
+LOCAL_LLM_BATCH_WAIT = 0.05
+LOCAL_LLM_MAX_TOKENS = 4096
+LOCAL_LLM_PROMPT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>"
+    "<|start_header_id|>user<|end_header_id|>\n\n{user}<|eot_id|>"
+    "<|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+
+# Structured output: ask backends for JSON (Groq's JSON mode, the local server's JSON schema
+# constraint) and stream completions so records are parsed as they arrive; a completion that breaks
+# off keeps the records parsed until then. Rows are still only written once the page succeeded.
+# Groq does not stream in JSON mode, so GROQ_JSON_MODE trades streaming for guaranteed JSON.
+LLM_JSON_MODE = True
+LLM_STREAM_RESPONSES = True
+GROQ_JSON_MODE = False
+
+# Instrumentation: durations kept per stage for quantiles, and the port of the optional
+# Prometheus /metrics endpoint (None disables it)
+METRICS_SAMPLE_SIZE = 10000
+METRICS_PORT = None
+
+# Cookie consent: accept buttons of common consent-management platforms (tried first), button
+# texts that mean "accept" in order of preference (short ones like "ok" only count inside an
+# element whose id or class matches COOKIE_BANNER_PATTERN), texts that must never be clicked,
+# iframes worth looking into, and how long to wait for a banner on a domain not seen before
+CONSENT_CMP_SELECTORS = [
+    "#onetrust-accept-btn-handler",
+    "#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll",
+    "#CybotCookiebotDialogBodyButtonAccept",
+    "#didomi-notice-agree-button",
+    "#truste-consent-button",
+    "#accept-recommended-btn-handler",
+    ".qc-cmp2-summary-buttons button[mode='primary']",
+    "[data-testid='uc-accept-all-button']",
+    ".osano-cm-accept-all",
+    ".cky-btn-accept",
+    ".cmplz-accept",
+    ".iubenda-cs-accept-btn",
+    ".cm-btn-accept-all",
+    ".cc-allow",
+    ".cc-dismiss",
+    "button.sp_choice_type_11",
+]
+CONSENT_ACCEPT_TEXTS = [
+    "accept all cookies", "accept all", "allow all cookies", "allow all", "accept cookies", "i accept",
+    "i agree", "accept", "agree", "allow", "consent", "got it", "ok", "continue",
+]
+CONSENT_REJECT_PATTERN = r"reject|decline|deny|refuse|manage|settings|preferences|customi[sz]e|options|necessary only"
+CONSENT_IFRAME_PATTERN = r"consent|cookie|cmp|gdpr|privacy|sp_message|truste"
+CONSENT_WAIT = 1.5
+
 USER_MESSAGE = f"Extract the following information from the provided text:\nPage content:\n\n"
         
 
@@ -0,0 +1,71 @@
+"""
+Compare the HTML to markdown converters on a corpus of saved pages.
+
+Usage:
+    python benchmarks/bench_conversion.py [CORPUS_DIR ...] [--repeat N]
+
+Every *.html file below the given directories is converted with each converter.
+Without arguments the HTML blobs stored in the page cache are used, so running a
+scrape once is enough to build a corpus of real pages.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets import PAGE_CACHE_DIR
+from scraper import html_to_markdown_with_readability
+
+CONVERTERS = ["html2text", "lxml"]
+
+
+def load_corpus(directories):
+    pages = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "**", "*.html"), recursive=True)):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages.append((path, f.read()))
+    return pages
+
+
+def benchmark(pages, converter, repeat):
+    timings = []
+    output_chars = 0
+    for _, html in pages:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            markdown = html_to_markdown_with_readability(html, converter=converter)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        output_chars += len(markdown)
+    return timings, output_chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="*", default=[os.path.join(PAGE_CACHE_DIR, "blobs")])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per page; the fastest one counts")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        sys.exit(f"No .html files found in {', '.join(args.corpus)}")
+    input_mb = sum(len(html) for _, html in pages) / 1e6
+    print(f"{len(pages)} pages, {input_mb:.1f} MB of HTML, best of {args.repeat} runs per page\n")
+
+    print(f"{'converter':<12}{'total s':>10}{'MB/s':>10}{'median ms':>12}{'max ms':>10}{'output MB':>12}")
+    for converter in CONVERTERS:
+        timings, output_chars = benchmark(pages, converter, args.repeat)
+        total = sum(timings)
+        print(f"{converter:<12}{total:>10.2f}{input_mb / total:>10.1f}{statistics.median(timings) * 1000:>12.1f}"
+              f"{max(timings) * 1000:>10.1f}{output_chars / 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
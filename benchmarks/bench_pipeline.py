@@ -0,0 +1,206 @@
+"""
+Benchmark the scrape pipeline offline, against the local fixture site and LLM stub.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--repeat N] [--skip-browser] [--block-profiles none,lean]
+                                        [--llm-latency S] [--json PATH]
+
+The fixture site (benchmarks/fixture_site.py) and the chat completions stub
+(llm_stub_server.py) are started on free local ports, so no network access or API
+key is needed and every run sees the same pages and answers. For each stage
+(fetch_html_selenium, html_to_markdown_with_readability, format_data and the
+end-to-end scrape_multiple_urls) it reports pages/sec, p50/p95 latency per page,
+peak RSS of the process so far and tokens per page (markdown tokens for the
+conversion, LLM tokens for extraction and the full scrape). For the full scrape it
+also reports the median time from the start of extraction to the first record
+parsed, which streaming completions bring below the full LLM latency (rows are still
+written only once a page's completion has finished). The LLM response
+cache, change detection (which would reuse the records of unchanged fixture pages from
+the second repeat on) and selector templates are disabled and the page cache is bypassed,
+so every run does the full work.
+
+fetch_html_selenium runs once per request blocking profile (see BROWSER_BLOCK_PROFILES),
+reporting the bytes the browser transferred and the requests it blocked per page, so
+the bytes saved by a profile are the difference to the "none" row.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixture_site import start_fixture_server, fixture_urls
+from llm_stub_server import start_stub_server
+
+FIELDS = ["Name", "Title", "Sport", "Email"]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def result_row(stage, latencies, wall, pages, tokens=None, **extra):
+    return {
+        "stage": stage,
+        "pages": pages,
+        "pages_per_second": pages / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "tokens_per_page": tokens / pages if tokens is not None and pages else None,
+        **extra,
+    }
+
+
+def timed_per_page(function, inputs, repeat):
+    """Call `function` on every input `repeat` times; returns (per-call latencies, wall seconds, outputs of the last run)."""
+    latencies, outputs = [], []
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = []
+        for item in inputs:
+            start = time.perf_counter()
+            outputs.append(function(item))
+            latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - wall_start, outputs
+
+
+def run_browser_benchmarks(urls, repeat, block_profiles):
+    """Time fetch_html_selenium with a fresh driver pool per blocking profile; returns (rows, pages of the last profile)."""
+    from driver_pool import DriverPool
+    from scraper import fetch_html_selenium, setup_selenium
+
+    results, pages = [], []
+    for profile in block_profiles:
+        pool = DriverPool(lambda: setup_selenium(profile))
+        usage = []
+
+        def fetch(url):
+            network = {}
+            html = fetch_html_selenium(url, pool, network=network)
+            usage.append(network)
+            return html
+
+        try:
+            latencies, wall, pages = timed_per_page(fetch, urls, repeat)
+        finally:
+            pool.close()
+        results.append(result_row(f"fetch_html_selenium ({profile})", latencies, wall, len(latencies),
+                                  kb_per_page=sum(u.get("bytes", 0) for u in usage) / 1024 / len(usage),
+                                  blocked_per_page=sum(u.get("blocked", 0) for u in usage) / len(usage)))
+    return results, pages
+
+
+def run_benchmarks(urls, repeat, skip_browser, fetch_mode, block_profiles):
+    # Imported here so GROQ_BASE_URL is set before the dispatcher reads it
+    from chunking import count_tokens
+    from http_fetcher import fetch_html_http
+    from instrumentation import read_traces
+    from change_detection import get_change_store
+    from llm_cache import get_llm_cache
+    from llm_dispatcher import get_llm_dispatcher
+    from scraper import html_to_markdown_with_readability, format_data, scrape_multiple_urls, SPANS_FILE_NAME
+    from selector_templates import get_template_store
+
+    get_llm_cache().enabled = False
+    get_change_store().enabled = False
+    get_template_store().enabled = False
+    dispatcher = get_llm_dispatcher()
+    results = []
+
+    if not skip_browser:
+        results, pages = run_browser_benchmarks(urls, repeat, block_profiles)
+    else:
+        pages = [fetch_html_http(url).text for url in urls]
+
+    latencies, wall, markdowns = timed_per_page(html_to_markdown_with_readability, pages, repeat)
+    markdown_tokens = sum(count_tokens(markdown) for markdown in markdowns) * repeat
+    results.append(result_row("html_to_markdown_with_readability", latencies, wall, len(latencies), markdown_tokens))
+
+    tokens_before = dispatcher.stats["tokens"]
+    latencies, wall, _ = timed_per_page(lambda markdown: format_data(markdown, FIELDS), markdowns, repeat)
+    llm_tokens = dispatcher.stats["tokens"] - tokens_before
+    # Zero would mean the stub's usage never reached the dispatcher and tokens/page is meaningless
+    assert llm_tokens > 0, "format_data reported no LLM token usage"
+    results.append(result_row("format_data", latencies, wall, len(latencies), llm_tokens))
+
+    latencies, first_records, wall, pages_done = [], [], 0.0, 0
+    tokens_before = dispatcher.stats["tokens"]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output_folder, all_data, _, _ = scrape_multiple_urls(urls, FIELDS, fetch_mode=fetch_mode, use_cache=False)
+        wall += time.perf_counter() - start
+        pages_done += sum(data is not None for data in all_data)
+        spans_path = os.path.join(output_folder, SPANS_FILE_NAME)
+        if os.path.exists(spans_path):
+            for trace in read_traces(spans_path):
+                latencies.append(trace["total_seconds"])
+                first_records += [span["first_record"] for span in trace["spans"]
+                                  if span["name"] == "llm" and span.get("first_record") is not None]
+    llm_tokens = dispatcher.stats["tokens"] - tokens_before
+    assert llm_tokens > 0, "scrape_multiple_urls reported no LLM token usage"
+    results.append(result_row(f"scrape_multiple_urls ({fetch_mode})", latencies, wall, pages_done, llm_tokens,
+                              first_record_p50_ms=percentile(first_records, 0.5) * 1000))
+    return results
+
+
+def print_results(results):
+    print(f"\n{'stage':<40}{'pages':>7}{'pages/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak RSS MB':>13}{'tokens/page':>13}"
+          f"{'KB/page':>10}{'blocked/page':>14}{'1st rec ms':>12}")
+    for row in results:
+        tokens = f"{row['tokens_per_page']:.0f}" if row["tokens_per_page"] is not None else "-"
+        kb = f"{row['kb_per_page']:.0f}" if "kb_per_page" in row else "-"
+        blocked = f"{row['blocked_per_page']:.1f}" if "blocked_per_page" in row else "-"
+        first_record = f"{row['first_record_p50_ms']:.1f}" if "first_record_p50_ms" in row else "-"
+        print(f"{row['stage']:<40}{row['pages']:>7}{row['pages_per_second']:>10.2f}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['peak_rss_mb']:>13.1f}{tokens:>13}{kb:>10}{blocked:>14}{first_record:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each stage over the whole corpus")
+    parser.add_argument("--skip-browser", action="store_true",
+                        help="Skip fetch_html_selenium and scrape over plain HTTP (no Chrome needed)")
+    parser.add_argument("--block-profiles", default="none,lean",
+                        help="Comma-separated request blocking profiles to time fetch_html_selenium with")
+    parser.add_argument("--fetch-mode", choices=["auto", "http", "browser"], default=None,
+                        help="Fetch mode of the end-to-end scrape (default: auto, or http with --skip-browser)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the LLM stub waits before answering")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    site, site_url = start_fixture_server()
+    stub, stub_url = start_stub_server(latency=args.llm_latency)
+    os.environ["GROQ_BASE_URL"] = stub_url
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    urls = [url for group in fixture_urls(site_url).values() for url in group]
+    fetch_mode = args.fetch_mode or ("http" if args.skip_browser else "auto")
+    print(f"Fixture site at {site_url} ({len(urls)} pages), LLM stub at {stub_url}")
+
+    try:
+        results = run_benchmarks(urls, args.repeat, args.skip_browser, fetch_mode, args.block_profiles.split(","))
+    finally:
+        site.shutdown()
+        stub.shutdown()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
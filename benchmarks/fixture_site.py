@@ -0,0 +1,201 @@
+"""
+A small local website used as a reproducible benchmark corpus.
+
+It serves four kinds of pages, each covering a different path through the scraper:
+
+    /static/<n>       server-rendered listing with header, nav and footer boilerplate
+    /scroll           listing that appends more items as the page is scrolled
+    /cookies          listing hidden behind a cookie consent banner
+    /list?page=<n>    paginated listing with numbered links and a "Next" link
+
+Every listing item has a photo and the pages use a web font, like real directory
+pages, so request blocking has something to save. Pages and assets are generated
+from a fixed seed, so every run sees exactly the same content.
+
+Usage:
+    python benchmarks/fixture_site.py --port 8766
+"""
+import argparse
+import html
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SPORTS = ["Soccer", "Basketball", "Tennis", "Swimming", "Volleyball", "Rowing", "Track and Field", "Golf"]
+TITLES = ["Head Coach", "Assistant Coach", "Athletic Director", "Trainer", "Team Manager", "Coordinator"]
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Okafor", "Novak", "Silva", "Haddad", "Larsen", "Ito", "Moreau"]
+
+STATIC_PAGES = 4
+PAGINATED_PAGES = 5
+ITEMS_PER_PAGE = 25
+SCROLL_BATCHES = 4
+PHOTO_BYTES = 40_000
+FONT_BYTES = 60_000
+
+
+def listing_items(seed, count):
+    rng = random.Random(seed)
+    items = []
+    for _ in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        items.append({
+            "name": f"{first} {last}",
+            "title": rng.choice(TITLES),
+            "sport": rng.choice(SPORTS),
+            "email": f"{first.lower()}.{last.lower()}{rng.randint(1, 99)}@example.edu",
+        })
+    return items
+
+
+def render_items(items):
+    return "\n".join(
+        f'<article class="staff"><img src="/assets/photo-{item["email"].split("@")[0]}.jpg" alt="" width="96" height="96">'
+        f'<h3>{html.escape(item["name"])}</h3>'
+        f'<p class="title">{html.escape(item["title"])} &middot; {html.escape(item["sport"])}</p>'
+        f'<a href="mailto:{item["email"]}">{item["email"]}</a></article>'
+        for item in items
+    )
+
+
+def asset_bytes(name, size):
+    """Deterministic incompressible filler for an asset, so transfer sizes are the same every run."""
+    return random.Random(name).randbytes(size)
+
+
+def render_page(title, body, extra_head=""):
+    nav = "".join(f'<li><a href="/static/{n}">Department {n}</a></li>' for n in range(1, STATIC_PAGES + 1))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>@font-face {{ font-family: "Fixture Sans"; src: url("/assets/fixture-sans.woff2") format("woff2"); }}
+body {{ font-family: "Fixture Sans", sans-serif; }} .staff {{ margin: 1em 0; }} #cookie-banner {{ position: fixed; bottom: 0; left: 0; right: 0; background: #eee; padding: 1em; }}</style>
+<script src="/assets/analytics.js"></script>
+{extra_head}</head>
+<body>
+<header><a href="/">Fixture Athletics</a><nav><ul>{nav}</ul></nav></header>
+<main><h1>{html.escape(title)}</h1>
+{body}
+</main>
+<footer><p>&copy; Fixture Athletics. All rights reserved.</p><a href="/privacy">Privacy Policy</a> <a href="/terms">Terms of Use</a></footer>
+</body>
+</html>"""
+
+
+def static_page(n):
+    return render_page(f"Department {n} Staff Directory", render_items(listing_items(f"static-{n}", ITEMS_PER_PAGE)))
+
+
+def scroll_page():
+    # The first batch is in the HTML; the rest is appended, one batch per scroll to the bottom
+    batches = [render_items(listing_items(f"scroll-{n}", ITEMS_PER_PAGE // 2)) for n in range(SCROLL_BATCHES)]
+    script = """<script>
+var batches = %s;
+var next = 1;
+window.addEventListener("scroll", function () {
+  if (next >= batches.length || window.innerHeight + window.scrollY < document.body.scrollHeight - 50) return;
+  var batch = batches[next++];
+  setTimeout(function () { document.getElementById("items").insertAdjacentHTML("beforeend", batch); }, 200);
+});
+</script>""" % json.dumps(batches).replace("</", "<\\/")
+    body = f'<div id="items">{batches[0]}</div><div style="height: 1500px"></div>{script}'
+    return render_page("Coaches (infinite scroll)", body)
+
+
+def cookies_page():
+    banner = ('<div id="cookie-banner"><p>We use cookies to improve your experience.</p>'
+              '<button onclick="this.parentNode.remove()">Accept all</button> <button>Manage preferences</button></div>')
+    body = render_items(listing_items("cookies", ITEMS_PER_PAGE)) + banner
+    return render_page("Staff (behind a cookie banner)", body)
+
+
+def paginated_page(page):
+    items = render_items(listing_items(f"list-{page}", ITEMS_PER_PAGE))
+    links = " ".join(f'<a href="/list?page={n}">{n}</a>' for n in range(1, PAGINATED_PAGES + 1))
+    if page < PAGINATED_PAGES:
+        links += f' <a href="/list?page={page + 1}" rel="next">Next</a>'
+    return render_page(f"Roster page {page}", f'{items}<nav class="pagination">{links}</nav>')
+
+
+def route(path):
+    """Return the HTML for a request path, or None for a 404."""
+    parsed = urlparse(path)
+    parts = [part for part in parsed.path.split("/") if part]
+    if parts == ["scroll"]:
+        return scroll_page()
+    if parts == ["cookies"]:
+        return cookies_page()
+    if parts == ["list"]:
+        page = parse_qs(parsed.query).get("page", ["1"])[0]
+        if page.isdigit() and 1 <= int(page) <= PAGINATED_PAGES:
+            return paginated_page(int(page))
+    if len(parts) == 2 and parts[0] == "static" and parts[1].isdigit() and 1 <= int(parts[1]) <= STATIC_PAGES:
+        return static_page(int(parts[1]))
+    return None
+
+
+def fixture_urls(base_url):
+    """Fixture page URLs grouped by page kind."""
+    return {
+        "static": [f"{base_url}/static/{n}" for n in range(1, STATIC_PAGES + 1)],
+        "scroll": [f"{base_url}/scroll"],
+        "cookies": [f"{base_url}/cookies"],
+        "paginated": [f"{base_url}/list?page={n}" for n in range(1, PAGINATED_PAGES + 1)],
+    }
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/assets/"):
+            name = urlparse(self.path).path.rsplit("/", 1)[-1]
+            if name.endswith(".jpg"):
+                self._send(200, asset_bytes(name, PHOTO_BYTES), "image/jpeg")
+            elif name.endswith(".woff2"):
+                self._send(200, asset_bytes(name, FONT_BYTES), "font/woff2")
+            else:
+                self._send(200, b"", "application/javascript")
+            return
+        page = route(self.path)
+        if page is None:
+            self._send(404, b"<h1>Not found</h1>", "text/html; charset=utf-8")
+            return
+        self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(host="127.0.0.1", port=0):
+    """Start the site in a background thread; returns (server, base_url). Call server.shutdown() to stop it."""
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    threading.Thread(target=server.serve_forever, name="fixture-site", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the benchmark fixture site")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FixtureHandler)
+    print(f"Fixture site listening on http://{args.host}:{args.port}")
+    for kind, urls in fixture_urls(f"http://{args.host}:{args.port}").items():
+        print(f"  {kind}: {urls[0]}" + (f" (+{len(urls) - 1} more)" if len(urls) > 1 else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Change detection for incremental re-scrapes.
+
+For every URL the store keeps a SimHash fingerprint of the pruned markdown that
+was sent to the LLM, together with the records extracted from it. When the same
+URL is scraped again for the same fields and model and its markdown is identical,
+the stored records are reused instead of asking the LLM again. Near-duplicates
+(within a few bits of the stored fingerprint) only count as unchanged when
+CHANGE_SIMHASH_MAX_DISTANCE is set. URLs are compared in normalized form.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from assets import CHANGE_DETECTION_ENABLED, CHANGE_STORE_PATH, CHANGE_SIMHASH_MAX_DISTANCE
+from extraction_backends import get_extraction_backend
+from page_cache import content_hash
+from url_utils import normalize_url
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+SHINGLE_SIZE = 3
+
+
+def simhash(text: str, bits: int = 64) -> int:
+    """SimHash of the text's word shingles, weighted by how often each shingle occurs."""
+    words = _WORD_RE.findall(text.lower())
+    shingles = Counter(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1)))
+    # A bit is set when the shingles having it outweigh those that don't, i.e. its weight exceeds half the total
+    weights = [0] * bits
+    for shingle, count in shingles.items():
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest()
+        for bit, flag in enumerate(format(int.from_bytes(digest, "big"), f"0{bits}b")):
+            if flag == "1":
+                weights[bit] += count
+    half = sum(shingles.values()) / 2
+    return int("".join("1" if weight > half else "0" for weight in weights), 2)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def extraction_key(fields, model=None) -> str:
+    """Records depend on what was asked for, so fingerprints are kept per fields and model (default: EXTRACTION_BACKEND's)."""
+    model = model or get_extraction_backend().model
+    return hashlib.sha256(json.dumps([list(fields), model]).encode("utf-8")).hexdigest()
+
+
+class ChangeStore:
+    def __init__(self, path=CHANGE_STORE_PATH, enabled=CHANGE_DETECTION_ENABLED, max_distance=CHANGE_SIMHASH_MAX_DISTANCE):
+        self.path = path
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.stats = Counter()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                url TEXT NOT NULL,
+                extraction_key TEXT NOT NULL,
+                simhash TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                records TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (url, extraction_key)
+            )
+        """)
+        self._db.commit()
+
+    def with_options(self, **options):
+        """
+        A view for one run or UI session: it shares the database and counters, but has
+        its own enabled and max_distance settings.
+        """
+        view = copy.copy(self)
+        for name, value in options.items():
+            if name not in ("enabled", "max_distance"):
+                raise TypeError(f"Unknown change store option: {name}")
+            setattr(view, name, value)
+        return view
+
+    def lookup(self, url, fields, markdown, model=None):
+        """
+        Compare a page with its last extraction of `fields` by `model`.
+
+        Returns (status, formatted_data): status is "new", "changed" or "unchanged", and
+        formatted_data holds the stored extraction when the page is unchanged.
+        """
+        if not self.enabled:
+            return "new", None
+        with self._lock:
+            row = self._db.execute("SELECT simhash, content_hash, records FROM fingerprints WHERE url = ? AND extraction_key = ?",
+                                   (normalize_url(url), extraction_key(fields, model))).fetchone()
+        if row is None:
+            status, formatted_data = "new", None
+        elif row[1] == content_hash(markdown) or (self.max_distance is not None and
+                                                  hamming_distance(int(row[0], 16), simhash(markdown)) <= self.max_distance):
+            status, formatted_data = "unchanged", json.loads(row[2])
+        else:
+            status, formatted_data = "changed", None
+        self.stats[status] += 1
+        return status, formatted_data
+
+    def record(self, url, fields, markdown, formatted_data, model=None):
+        if not self.enabled or formatted_data is None:
+            return
+        if hasattr(formatted_data, "dict"):
+            formatted_data = formatted_data.dict()
+        records = formatted_data if isinstance(formatted_data, str) else json.dumps(formatted_data, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fingerprints (url, extraction_key, simhash, content_hash, records, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), extraction_key(fields, model), f"{simhash(markdown):016x}", content_hash(markdown), records, time.time()))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM fingerprints")
+            self._db.commit()
+        self.stats.clear()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_change_store():
+    """Return the process-wide change store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChangeStore()
+        return _default_store
@@ -0,0 +1,128 @@
+"""
+Token-aware splitting of markdown for extraction, and merging of the per-chunk results.
+
+Long listing pages don't fit in one completion (or make it very slow), so the
+markdown is cut into chunks of at most a given number of tokens. Cuts are made
+at headings first, then at blank lines between blocks, and only as a last resort
+inside a block, so that a listing record is rarely split across two chunks.
+"""
+import json
+import re
+
+import tiktoken
+
+from assets import EXTRACTION_CHUNK_TOKENS
+
+_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6}\s|(?:-{3,}|\*{3,}|_{3,})\s*$)")
+
+_encoding = None
+
+
+def get_encoding():
+    # Llama uses its own tokenizer, but cl100k_base is close enough for budgeting
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def _split_blocks(markdown: str):
+    """Yield (block, starts_section) pairs: paragraphs separated by blank lines, headings start a section."""
+    block = []
+    starts_section = False
+    for line in markdown.splitlines():
+        if _HEADING_RE.match(line) or not line.strip():
+            if block:
+                yield "\n".join(block), starts_section
+            block = [line] if line.strip() else []
+            starts_section = bool(line.strip())
+            continue
+        block.append(line)
+    if block:
+        yield "\n".join(block), starts_section
+
+
+def _split_oversized(block: str, max_tokens: int):
+    """Split a single block that is larger than a chunk by lines, then by raw tokens."""
+    pieces, current, current_tokens = [], [], 0
+    for line in block.splitlines():
+        line_tokens = count_tokens(line) + 1
+        if line_tokens > max_tokens:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            tokens = get_encoding().encode(line, disallowed_special=())
+            pieces.extend(get_encoding().decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens))
+            continue
+        if current_tokens + line_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def split_markdown(markdown: str, max_tokens: int = EXTRACTION_CHUNK_TOKENS):
+    """Split markdown into chunks of at most `max_tokens` tokens along heading and block boundaries."""
+    if count_tokens(markdown) <= max_tokens:
+        return [markdown]
+
+    chunks, current, current_tokens = [], [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for block, starts_section in _split_blocks(markdown):
+        block_tokens = count_tokens(block) + 2
+        if block_tokens > max_tokens:
+            flush()
+            chunks.extend(_split_oversized(block, max_tokens))
+            continue
+        # Prefer cutting at a heading once the current chunk is reasonably full
+        if current_tokens + block_tokens > max_tokens or (starts_section and current_tokens > max_tokens // 2):
+            flush()
+        current.append(block)
+        current_tokens += block_tokens
+    flush()
+    return chunks
+
+
+def record_key(record):
+    """Identity of a record for deduplication: its values, ignoring case and surrounding whitespace."""
+    if isinstance(record, dict):
+        normalized = {str(k).strip().lower(): str(v).strip().lower() if v is not None else "" for k, v in record.items()}
+        return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def merge_extractions(results):
+    """
+    Merge the parsed responses of several chunks into one.
+
+    `listings` lists are concatenated in chunk order with duplicate records (same
+    values ignoring case and surrounding whitespace) removed; any other keys are
+    taken from the first chunk that has them.
+    """
+    merged = {"listings": []}
+    seen = set()
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        for record in result.get("listings") or []:
+            key = record_key(record)
+            if key not in seen:
+                seen.add(key)
+                merged["listings"].append(record)
+        for key, value in result.items():
+            if key != "listings" and key not in merged:
+                merged[key] = value
+    return merged
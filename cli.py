@@ -0,0 +1,255 @@
+"""
+Run scrapes and crawls from the command line, without Streamlit.
+
+Usage:
+    python cli.py scrape URL_FILE --fields Name Title Email [--workers 8] [--batch-size 100]
+    cat urls.txt | python cli.py scrape - --fields Name Title
+    python cli.py crawl URL_FILE --fields Name Title [--max-pages 500] [--indications "..."]
+    python cli.py resume JOB_ID [--retry-failed]
+    python cli.py jobs
+    python cli.py crawl URL_FILE --fields Name Title --distributed [--queue /shared/tasks.sqlite3]
+    python cli.py worker [--queue /shared/tasks.sqlite3] [--workers 4]
+
+URL files hold one URL per line; blank lines and lines starting with # are skipped.
+With "-" the URLs are read from stdin and scraped in batches as they arrive, so the
+command can sit at the end of a pipe. Every run is a checkpointed job (see job_store),
+so an interrupted run can be picked up with "resume". The exit status is 1 when some
+URLs of the job failed.
+
+With --distributed the command only coordinates the job: its pages are queued for
+any number of "worker" processes, on this or other hosts sharing the queue file,
+and the records they push back are saved here (see distributed).
+"""
+import argparse
+import itertools
+import os
+import sys
+
+from assets import (MAX_CONCURRENT_URLS, FETCH_MODE, PAGE_CACHE_ENABLED, CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, OUTPUT_FORMATS,
+                    EXTRACTION_BACKEND, SELECTOR_TEMPLATES_ENABLED, LOW_MEMORY_MODE, TASK_QUEUE_PATH)
+from change_detection import get_change_store
+from crawler import crawl_pagination
+from distributed import Coordinator, run_worker
+from extraction_backends import BACKENDS, get_extraction_backend
+from instrumentation import start_metrics_server
+from job_store import get_job_store
+from llm_cache import get_llm_cache
+from output_sinks import OutputSink
+from page_cache import get_page_cache
+from scraper import scrape_urls_concurrently, generate_unique_folder_name
+from selector_templates import get_template_store
+from task_queue import get_task_queue
+
+
+def read_urls(source):
+    """Yield the URLs of a file, or of stdin for "-", as they are read."""
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_scrape(job, args, batches=()):
+    """Scrape the job's outstanding URLs, then each further batch of URLs added to it."""
+    cache = get_page_cache() if args.page_cache else None
+    sink = OutputSink(job.output_folder, job.fields, args.formats)
+    try:
+        if args.distributed:
+            coordinator = Coordinator(job, get_task_queue(args.queue), sink)
+            for batch in itertools.chain([[]], batches):
+                job.add_urls(batch)
+                coordinator.enqueue_pending()
+                coordinator.poll()
+            coordinator.run()
+            return
+        for batch in itertools.chain([[]], batches):
+            job.add_urls(batch)
+            urls = job.urls_to_run()
+            if urls:
+                scrape_urls_concurrently(urls, job.fields, job.output_folder, max_workers=args.workers,
+                                         fetch_mode=args.fetch_mode, cache=cache, sink=sink, job=job, low_memory=args.low_memory,
+                                         backend=get_extraction_backend(args.backend))
+    finally:
+        sink.close()
+
+
+def run_crawl(job, args):
+    cache = get_page_cache() if args.page_cache else None
+    sink = OutputSink(job.output_folder, job.fields, args.formats)
+    try:
+        if args.distributed:
+            Coordinator(job, get_task_queue(args.queue), sink).run()
+            return
+        crawl_pagination([], job.fields, job.output_folder, job.params["indications"], max_pages=job.params["max_pages"],
+                         max_depth=job.params.get("max_depth", CRAWL_MAX_DEPTH), max_workers=args.workers,
+                         fetch_mode=args.fetch_mode, cache=cache, sink=sink, job=job, low_memory=args.low_memory,
+                         backend=get_extraction_backend(args.backend))
+    finally:
+        sink.close()
+
+
+def new_job(args, first_urls, kind, params=None):
+    output_folder = args.output_folder or os.path.join("output", generate_unique_folder_name(first_urls[0]))
+    return get_job_store().create_job(first_urls, args.fields, output_folder, kind, params)
+
+
+def command_scrape(args):
+    batches = batched(read_urls(args.urls), args.batch_size)
+    first = next(batches, None)
+    if first is None:
+        sys.exit("No URLs given")
+    job = new_job(args, first, "scrape")
+    print(f"Job {job.id} writing to {job.output_folder}")
+    run_scrape(job, args, batches)
+    return job
+
+
+def command_crawl(args):
+    seeds = list(read_urls(args.urls))
+    if not seeds:
+        sys.exit("No URLs given")
+    job = new_job(args, seeds, "crawl",
+                  {"indications": args.indications, "max_pages": args.max_pages, "max_depth": args.max_depth})
+    print(f"Job {job.id} writing to {job.output_folder}")
+    run_crawl(job, args)
+    return job
+
+
+def command_resume(args):
+    job = get_job_store().get_job(args.job_id)
+    if job is None:
+        sys.exit(f"Unknown job: {args.job_id}")
+    if args.retry_failed:
+        print(f"Retrying {job.retry_failed()} failed URL(s)")
+    print(f"Resuming {job.kind} job {job.id} in {job.output_folder}")
+    if job.kind == "crawl":
+        run_crawl(job, args)
+    else:
+        run_scrape(job, args)
+    return job
+
+
+def command_worker(args):
+    cache = get_page_cache() if args.page_cache else None
+    completed = run_worker(get_task_queue(args.queue), args.worker_id, args.workers, args.fetch_mode, cache, args.low_memory,
+                           args.idle_exit, backend=get_extraction_backend(args.backend))
+    print(f"Worker ran {completed} page(s)")
+
+
+def command_jobs(args):
+    for job in get_job_store().list_jobs(args.limit):
+        counts = job.counts()
+        print(f"{job.id:<50} {job.kind:<7} {counts['extracted']:>6}/{sum(counts.values()):<6} done "
+              f"{counts['failed']:>6} failed  {job.output_folder}")
+
+
+def add_run_options(parser):
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_URLS, help="URLs fetched and processed at once")
+    parser.add_argument("--fetch-mode", choices=["auto", "http", "browser"], default=FETCH_MODE)
+    parser.add_argument("--no-page-cache", dest="page_cache", action="store_false", default=PAGE_CACHE_ENABLED,
+                        help="Always fetch pages instead of reusing cached copies")
+    parser.add_argument("--no-llm-cache", dest="llm_cache", action="store_false", default=True,
+                        help="Always ask the model instead of reusing cached answers")
+    parser.add_argument("--refresh-llm-cache", dest="refresh_llm_cache", action="store_true",
+                        help="Ask the model again and replace the cached answers with the new ones")
+    parser.add_argument("--no-change-detection", dest="change_detection", action="store_false", default=True,
+                        help="Extract every page again, even if unchanged since the last scrape")
+    parser.add_argument("--selector-templates", dest="selector_templates", action="store_true",
+                        default=SELECTOR_TEMPLATES_ENABLED,
+                        help="Learn each domain's record layout and extract its later pages without the LLM")
+    parser.add_argument("--low-memory", dest="low_memory", action="store_true", default=LOW_MEMORY_MODE,
+                        help="Spool pages to disk and fetch only their main content, for very large pages")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=EXTRACTION_BACKEND,
+                        help="Model backend for extraction and pagination prompts")
+    parser.add_argument("--formats", nargs="+", default=OUTPUT_FORMATS, choices=["jsonl", "csv", "parquet"])
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--queue", default=TASK_QUEUE_PATH, help="Task queue file shared by the coordinator and its workers")
+
+
+def add_distributed_option(parser):
+    parser.add_argument("--distributed", action="store_true",
+                        help='Queue the pages for "worker" processes instead of running them in this one')
+
+
+def add_job_options(parser):
+    parser.add_argument("urls", help='File with one URL per line, or "-" for stdin')
+    parser.add_argument("--fields", nargs="+", required=True, help='Fields to extract from every page, optionally typed as "Name:type" or "Name:type:description" '
+                             '(types: string, number, integer, boolean, list)')
+    parser.add_argument("--output-folder", default=None, help="Defaults to output/<domain>_<timestamp>")
+    add_run_options(parser)
+    add_distributed_option(parser)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape", help="Scrape a list of URLs")
+    add_job_options(scrape)
+    scrape.add_argument("--batch-size", type=int, default=100, help="URLs read from the input per batch")
+    scrape.set_defaults(handler=command_scrape)
+
+    crawl = commands.add_parser("crawl", help="Scrape seed URLs and the pagination pages found on them")
+    add_job_options(crawl)
+    crawl.add_argument("--indications", default="", help="How to find the pagination, for the model")
+    crawl.add_argument("--max-pages", type=int, default=CRAWL_MAX_PAGES)
+    crawl.add_argument("--max-depth", type=int, default=CRAWL_MAX_DEPTH)
+    crawl.set_defaults(handler=command_crawl)
+
+    resume = commands.add_parser("resume", help="Continue an interrupted job")
+    resume.add_argument("job_id")
+    resume.add_argument("--retry-failed", action="store_true", help="Also re-run the URLs that failed")
+    add_run_options(resume)
+    add_distributed_option(resume)
+    resume.set_defaults(handler=command_resume)
+
+    worker = commands.add_parser("worker", help="Run the pages queued by distributed jobs")
+    add_run_options(worker)
+    worker.add_argument("--worker-id", default=None, help="Defaults to <hostname>-<pid>")
+    worker.add_argument("--idle-exit", type=float, default=None, help="Exit after this many seconds without queued pages")
+    worker.set_defaults(handler=command_worker)
+
+    jobs = commands.add_parser("jobs", help="List recent jobs")
+    jobs.add_argument("--limit", type=int, default=20)
+    jobs.set_defaults(handler=command_jobs)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "metrics_port", None):
+        start_metrics_server(args.metrics_port)
+    if getattr(args, "llm_cache", True) is False:
+        get_llm_cache().enabled = False
+    if getattr(args, "refresh_llm_cache", False):
+        get_llm_cache().refresh = True
+    if getattr(args, "change_detection", True) is False:
+        get_change_store().enabled = False
+    if getattr(args, "selector_templates", False):
+        get_template_store().enabled = True
+
+    job = args.handler(args)
+    if job is None:
+        return 0
+    counts = job.counts()
+    print(f"Job {job.id}: {counts['extracted']} extracted, {counts['failed']} failed, "
+          f"{counts['pending'] + counts['fetched']} not done. Output in {job.output_folder}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Cookie consent dismissal in as few WebDriver round-trips as possible.
+
+A single injected script looks for the accept button of a known consent-management
+platform first, then scans every candidate button of the page (and of same-origin
+iframes) once, ranking them by how well their text means "accept". Cross-origin
+iframes that look like consent dialogs are searched with the same script after
+switching into them. Whatever worked on a domain is remembered and tried first on
+its next page.
+"""
+import threading
+import time
+
+from assets import (CONSENT_CMP_SELECTORS, CONSENT_ACCEPT_TEXTS, CONSENT_REJECT_PATTERN, CONSENT_IFRAME_PATTERN,
+                    CONSENT_WAIT, COOKIE_BANNER_PATTERN)
+from politeness import domain_of
+
+# Clicks the best accept button it can find and returns {kind, value, label}, or null.
+# Arguments: CMP selectors, accept texts, reject pattern, banner container pattern.
+CONSENT_SCRIPT = """
+var selectors = arguments[0], texts = arguments[1];
+var reject = new RegExp(arguments[2], 'i'), container = new RegExp(arguments[3], 'i');
+var strong = /accept|agree|allow|consent/;
+var words = texts.map(function (t) { return new RegExp('\\\\b' + t + '\\\\b'); });
+
+function visible(el) {
+    var rect = el.getBoundingClientRect();
+    if (rect.width === 0 || rect.height === 0) { return false; }
+    var style = el.ownerDocument.defaultView.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none';
+}
+
+function inBanner(el) {
+    for (var node = el; node && node.nodeType === 1; node = node.parentElement) {
+        if (container.test((node.id || '') + ' ' + (node.getAttribute('class') || ''))) { return true; }
+    }
+    return false;
+}
+
+function scan(doc) {
+    for (var i = 0; i < selectors.length; i++) {
+        var el = doc.querySelector(selectors[i]);
+        if (el && visible(el)) { return {el: el, kind: 'selector', value: selectors[i]}; }
+    }
+    var best = null, bestScore = 0;
+    var candidates = doc.querySelectorAll('button, a, [role="button"], input[type="button"], input[type="submit"]');
+    for (var j = 0; j < candidates.length; j++) {
+        var el = candidates[j];
+        var text = (el.innerText || el.value || el.getAttribute('aria-label') || '').toLowerCase().replace(/\\s+/g, ' ').trim();
+        if (!text || text.length > 50 || reject.test(text)) { continue; }
+        for (var k = 0; k < texts.length; k++) {
+            var exact = text.replace(/[^a-z ]/g, '').trim() === texts[k];
+            if (!exact && !words[k].test(text)) { continue; }
+            var banner = inBanner(el);
+            if (!banner && !strong.test(texts[k])) { break; }
+            var score = (exact ? 200 : 100) + (banner ? 50 : 0) - k;
+            if (score > bestScore && visible(el)) { best = {el: el, kind: 'text', value: texts[k]}; bestScore = score; }
+            break;
+        }
+    }
+    return best;
+}
+
+var found = scan(document);
+if (!found) {
+    var frames = document.querySelectorAll('iframe');
+    for (var f = 0; f < frames.length && !found; f++) {
+        var doc = null;
+        try { doc = frames[f].contentDocument; } catch (e) {}
+        if (doc) { found = scan(doc); }
+    }
+}
+if (!found) { return null; }
+var label = (found.el.innerText || found.el.value || '').trim().slice(0, 50);
+found.el.click();
+return {kind: found.kind, value: found.value, label: label};
+"""
+
+_CONSENT_IFRAMES_SCRIPT = """
+var pattern = new RegExp(arguments[0], 'i');
+return Array.prototype.filter.call(document.querySelectorAll('iframe'), function (f) {
+    return pattern.test([f.id, f.name, f.title, f.src].join(' '));
+});
+"""
+
+
+class ConsentStrategies:
+    """Per-domain memory of how the consent banner was dismissed (or that none was found)."""
+
+    def __init__(self):
+        self._strategies = {}
+        self._lock = threading.Lock()
+
+    def get(self, domain):
+        with self._lock:
+            return self._strategies.get(domain)
+
+    def record(self, domain, strategy):
+        with self._lock:
+            self._strategies[domain] = strategy
+
+    def seen(self, domain):
+        with self._lock:
+            return domain in self._strategies
+
+
+consent_strategies = ConsentStrategies()
+
+
+def _run_scan(driver, selectors, texts):
+    return driver.execute_script(CONSENT_SCRIPT, selectors, texts, CONSENT_REJECT_PATTERN, COOKIE_BANNER_PATTERN)
+
+
+def _scan_consent_iframes(driver, selectors, texts):
+    """Search cross-origin iframes whose id, name, title or src looks like a consent dialog."""
+    frames = driver.execute_script(_CONSENT_IFRAMES_SCRIPT, CONSENT_IFRAME_PATTERN) or []
+    for frame in frames:
+        try:
+            driver.switch_to.frame(frame)
+            try:
+                found = _run_scan(driver, selectors, texts)
+            finally:
+                driver.switch_to.default_content()
+            if found:
+                return found
+        except Exception:
+            continue
+    return None
+
+
+def dismiss_consent(driver, url=None, wait=CONSENT_WAIT, poll_interval=0.25, strategies=consent_strategies):
+    """
+    Click the cookie consent accept button of the current page, if there is one.
+
+    Returns the strategy that worked ({"kind", "value", "frame", "label"}) or None.
+    """
+    domain = domain_of(url or driver.current_url)
+    cached = strategies.get(domain)
+
+    if cached:
+        # Try only what worked last time on this domain, then fall back to a full search
+        selectors = [cached["value"]] if cached["kind"] == "selector" else []
+        texts = [cached["value"]] if cached["kind"] == "text" else []
+        found = _scan_consent_iframes(driver, selectors, texts) if cached["frame"] else _run_scan(driver, selectors, texts)
+        if found:
+            return {**found, "frame": cached["frame"]}
+
+    # A domain where no banner was found before gets one quick look; a new one gets a short wait
+    deadline = time.monotonic() + (0 if strategies.seen(domain) else wait)
+    while True:
+        found = _run_scan(driver, CONSENT_CMP_SELECTORS, CONSENT_ACCEPT_TEXTS)
+        if found:
+            strategy = {**found, "frame": False}
+            break
+        if time.monotonic() >= deadline:
+            # Cross-origin frames cost a round-trip each, so they are only searched once at the end
+            found = _scan_consent_iframes(driver, CONSENT_CMP_SELECTORS, CONSENT_ACCEPT_TEXTS)
+            if not found:
+                strategies.record(domain, None)
+                return None
+            strategy = {**found, "frame": True}
+            break
+        time.sleep(poll_interval)
+
+    strategies.record(domain, {key: strategy[key] for key in ("kind", "value", "frame")})
+    return strategy
@@ -0,0 +1,172 @@
+"""
+Crawl through pagination.
+
+Starting from one or more seed URLs, every scraped page is checked for
+pagination and the page URLs found are fed back into a frontier, which
+deduplicates them by normalized URL and enforces a page and depth budget.
+Pages are fetched and extracted through the same pipeline as a multi-URL
+scrape, and new pages are scheduled as soon as they are discovered rather
+than after a whole level has finished.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from assets import CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, MAX_CONCURRENT_URLS, FETCH_MODE, LOW_MEMORY_MODE
+from driver_pool import get_driver_pool
+from pagination_detector import detect_pagination_elements
+from politeness import DomainThrottle
+from output_sinks import OutputSink
+from instrumentation import PageTrace, finish_trace
+from low_memory import spool_path, result_summary
+from scraper import fetch_page, process_page, new_report_entry, save_run_report, checkpoint, SPANS_FILE_NAME
+from url_utils import normalize_url
+
+
+class UrlFrontier:
+    """FIFO queue of (url, depth) that accepts each normalized URL once, within a page and depth budget."""
+
+    def __init__(self, max_pages=CRAWL_MAX_PAGES, max_depth=CRAWL_MAX_DEPTH):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self._seen = set()
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def add(self, url, depth) -> bool:
+        key = normalize_url(url)
+        with self._lock:
+            if key in self._seen or depth > self.max_depth or len(self._seen) >= self.max_pages:
+                return False
+            self._seen.add(key)
+            self._queue.append((url, depth))
+            return True
+
+    def mark_seen(self, url):
+        """Count a URL against the budget without queueing it (e.g. already scraped by an earlier run)."""
+        with self._lock:
+            self._seen.add(normalize_url(url))
+
+    def pop(self):
+        with self._lock:
+            return self._queue.popleft() if self._queue else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._queue)
+
+
+def crawl_pagination(seed_urls, fields, output_folder, indications="", max_pages=CRAWL_MAX_PAGES,
+                     max_depth=CRAWL_MAX_DEPTH, pool=None, max_workers=MAX_CONCURRENT_URLS, throttle=None,
+                     fetch_mode=FETCH_MODE, cache=None, sink=None, job=None, low_memory=LOW_MEMORY_MODE, backend=None,
+                     llm_cache=None, changes=None, templates=None):
+    """
+    Scrape the seed URLs and every pagination page reachable from them.
+
+    Returns (all_data, first_markdown, report) like scrape_urls_concurrently, in the
+    order the pages were discovered; each report entry also records the page's depth.
+    Records are streamed to `sink`, or to a new OutputSink in `output_folder`.
+
+    With a `job` from job_store the crawl is checkpointed: the job's URLs replace the
+    seeds (pages already extracted or failed only count against the budget) and every
+    discovered page is added to the job, so an interrupted crawl can be resumed.
+    In `low_memory` mode pages are spooled and summarized as in scrape_urls_concurrently.
+    Extraction and pagination prompts go to `backend`, by default EXTRACTION_BACKEND; `llm_cache`,
+    `changes` and `templates` are used as in scrape_urls_concurrently.
+    """
+    pool = pool or get_driver_pool()
+    throttle = throttle or DomainThrottle()
+    own_sink = sink is None
+    sink = sink or OutputSink(output_folder, fields)
+    frontier = UrlFrontier(max_pages, max_depth)
+    if job is None:
+        for url in seed_urls:
+            frontier.add(url, 0)
+    else:
+        for url, depth, state in job.urls():
+            if state in ("pending", "fetched"):
+                frontier.add(url, depth)
+            else:
+                frontier.mark_seen(url)
+
+    all_data, markdowns, report, traces = [], [], [], []
+    spans_path = os.path.join(output_folder, SPANS_FILE_NAME)
+    output_path = sink.paths.get("jsonl") or next(iter(sink.paths.values()), None)
+
+    def file_number_of(index, url):
+        return job.position(url) if job else index + 1
+
+    def process_and_discover(index, url, depth, raw_html):
+        file_number = file_number_of(index, url)
+        formatted_data, markdown = process_page(url, raw_html, fields, output_folder, file_number, report[index], cache, sink,
+                                                traces[index], backend, llm_cache, changes, templates)
+        discovered = []
+        if depth < max_depth:
+            pagination = detect_pagination_elements(url, indications, markdown, raw_html, backend, llm_cache) or {}
+            discovered = pagination.get("page_urls", [])
+        return formatted_data, markdown, discovered
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as fetchers, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as processors:
+        pending = {}
+
+        def schedule():
+            while True:
+                item = frontier.pop()
+                if item is None:
+                    return
+                url, depth = item
+                index = len(report)
+                entry = new_report_entry(url)
+                entry["depth"] = depth
+                report.append(entry)
+                traces.append(PageTrace(url))
+                all_data.append(None)
+                markdowns.append(None)
+                if job:
+                    job.begin([url])
+                spool_to = spool_path(output_folder, file_number_of(index, url)) if low_memory else None
+                future = fetchers.submit(fetch_page, url, entry, pool, throttle, fetch_mode, cache, traces[index], spool_to)
+                pending[future] = ("fetch", index, url, depth)
+
+        schedule()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index, url, depth = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"An error occurred while {'fetching' if stage == 'fetch' else 'processing'} {url}: {e}")
+                    finish_trace(traces[index], "fetch_failed" if stage == "fetch" else "extract_failed", spans_path)
+                    checkpoint(job, url, "failed", f"{stage}: {e}")
+                    continue
+
+                if stage == "fetch":
+                    checkpoint(job, url, "fetched")
+                    pending[processors.submit(process_and_discover, index, url, depth, result)] = ("process", index, url, depth)
+                    continue
+
+                all_data[index], markdown, discovered = result
+                if index == 0 or not low_memory:
+                    markdowns[index] = markdown
+                if low_memory:
+                    all_data[index] = result_summary(url, all_data[index], output_path,
+                                                     spool_path(output_folder, file_number_of(index, url)))
+                finish_trace(traces[index], "ok" if all_data[index] is not None else "extract_failed", spans_path)
+                new_urls = [page_url for page_url in discovered if frontier.add(page_url, depth + 1)]
+                if job:
+                    # Discovered pages are stored before the page is marked done, so a crash never loses them
+                    job.add_urls(new_urls, depth + 1)
+                checkpoint(job, url, "extracted" if all_data[index] is not None else "failed",
+                           None if all_data[index] is not None else "no data extracted")
+                added = len(new_urls)
+                if added:
+                    print(f"Discovered {added} new page(s) from {url}")
+            schedule()
+
+    if own_sink:
+        sink.close()
+    save_run_report(report, output_folder)
+    return all_data, markdowns[0] if markdowns else None, report
@@ -0,0 +1,225 @@
+"""
+Distributed scrapes and crawls.
+
+The coordinator owns the job: it queues the job's pages in the shared task queue
+(see task_queue), saves the records workers push back to the job's output sink,
+checkpoints every page in the job store and, for crawls, feeds the pagination
+pages workers discovered back through the crawl frontier. Workers run on any
+number of processes and hosts, each with its own driver pool, and run their
+leased pages through the same fetch and process steps as a local scrape.
+
+Politeness limits are per worker, so the total rate a site sees grows with the
+number of workers.
+"""
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from assets import CRAWL_MAX_DEPTH, MAX_CONCURRENT_URLS, FETCH_MODE, LOW_MEMORY_MODE, TASK_POLL_INTERVAL
+from crawler import UrlFrontier
+from driver_pool import get_driver_pool
+from instrumentation import PageTrace, finish_trace
+from low_memory import spool_path
+from output_sinks import records_from_formatted_data
+from pagination_detector import detect_pagination_elements
+from politeness import DomainThrottle
+from scraper import fetch_page, process_page, new_report_entry, save_run_report, SPANS_FILE_NAME
+from task_queue import get_task_queue
+
+
+class Coordinator:
+    def __init__(self, job, queue, sink):
+        self.job = job
+        self.queue = queue
+        self.sink = sink
+        self.report = []
+        self.frontier = None
+        # Pages written to the output by an earlier coordinator of the job that died before marking them
+        self.saved_urls = sink.source_urls()
+        if job.kind == "crawl":
+            # As in crawl_pagination, pages already extracted or failed only count against the budget
+            self.frontier = UrlFrontier(job.params["max_pages"], job.params.get("max_depth", CRAWL_MAX_DEPTH))
+            for url, depth, state in job.urls():
+                if state in ("pending", "fetched"):
+                    self.frontier.add(url, depth)
+                else:
+                    self.frontier.mark_seen(url)
+        queue.add_job(job)
+
+    def enqueue_pending(self):
+        """Queue the job's pages that are not done yet; returns how many were newly queued."""
+        if self.frontier is None:
+            pages = [(url, depth) for url, depth, _ in self.job.urls(("pending", "fetched"))]
+        else:
+            pages = []
+            item = self.frontier.pop()
+            while item is not None:
+                pages.append(item)
+                item = self.frontier.pop()
+        if not pages:
+            return 0
+        self.job.begin([url for url, _ in pages])
+        positions = self.job.positions()
+        return self.queue.enqueue(self.job.id, [(url, depth, positions[url]) for url, depth in pages])
+
+    def poll(self):
+        """
+        Save the results workers pushed since the last poll; returns how many there were.
+
+        Rows are written and flushed before their pages are marked and the results
+        acknowledged, so a crash never loses them. A restarted coordinator sees the
+        results it had not acknowledged again and skips the pages whose rows the
+        output already holds.
+        """
+        results = self.queue.results(self.job.id)
+        discovered = 0
+        marks = []
+        for result in results:
+            url = result["url"]
+            if self.job.state(url) == "extracted":
+                continue
+            if result["report"] is not None:
+                self.report.append(result["report"])
+            if self.frontier is not None:
+                new_urls = [page_url for page_url in result["discovered"] if self.frontier.add(page_url, result["depth"] + 1)]
+                # Discovered pages are stored before the page is marked done, so a crash never loses them
+                self.job.add_urls(new_urls, result["depth"] + 1)
+                discovered += len(new_urls)
+            if result["records"] is not None:
+                if url not in self.saved_urls:
+                    self.sink.write({"listings": result["records"]}, url)
+                marks.append((url, "extracted", None))
+            else:
+                marks.append((url, "failed", result["error"] or "no data extracted"))
+        if marks:
+            self.sink.flush()
+        for url, state, error in marks:
+            self.job.mark(url, state, error)
+        self.queue.acknowledge([result["task_id"] for result in results])
+        if discovered:
+            print(f"Discovered {discovered} new page(s)")
+            self.enqueue_pending()
+        return len(results)
+
+    def run(self, poll_interval=TASK_POLL_INTERVAL):
+        """Queue the outstanding pages and save results until every page of the job is done."""
+        self.enqueue_pending()
+        while True:
+            if self.poll():
+                continue
+            if self.queue.outstanding(self.job.id) == 0:
+                break
+            time.sleep(poll_interval)
+        save_run_report(self.report, self.job.output_folder)
+        return self.report
+
+
+class ResultBuffer:
+    """Stands in for the output sink on workers, collecting the records of one page to push with its result."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def write(self, formatted_data, source_url):
+        records = records_from_formatted_data(formatted_data)
+        with self._lock:
+            self.records.extend(records)
+        return len(records)
+
+
+def run_task(queue, task, job, worker, pool, throttle, fetch_mode=FETCH_MODE, cache=None, low_memory=LOW_MEMORY_MODE,
+             backend=None):
+    """Fetch, extract and (for crawls) check one leased page for pagination, then push its result."""
+    if job is None:
+        queue.fail(task, f"unknown job: {task.job_id}")
+        return
+    kind, fields, output_folder, params = job
+    os.makedirs(output_folder, exist_ok=True)
+    entry = new_report_entry(task.url)
+    entry.update(depth=task.depth, worker=worker, attempt=task.attempts)
+    trace = PageTrace(task.url)
+    spans_path = os.path.join(output_folder, SPANS_FILE_NAME)
+
+    try:
+        raw_html = fetch_page(task.url, entry, pool, throttle, fetch_mode, cache, trace,
+                              spool_path(output_folder, task.file_number) if low_memory else None)
+    except Exception as e:
+        print(f"An error occurred while fetching {task.url}: {e}")
+        finish_trace(trace, "fetch_failed", spans_path)
+        queue.fail(task, f"fetch: {e}")
+        return
+
+    buffer = ResultBuffer()
+    try:
+        formatted_data, markdown = process_page(task.url, raw_html, fields, output_folder, task.file_number, entry, cache,
+                                                buffer, trace, backend)
+        discovered = []
+        if kind == "crawl" and task.depth < params.get("max_depth", CRAWL_MAX_DEPTH):
+            pagination = detect_pagination_elements(task.url, params.get("indications", ""), markdown, raw_html,
+                                                    backend) or {}
+            discovered = pagination.get("page_urls", [])
+    except Exception as e:
+        print(f"An error occurred while processing {task.url}: {e}")
+        finish_trace(trace, "extract_failed", spans_path)
+        queue.fail(task, f"process: {e}")
+        return
+
+    finish_trace(trace, "ok" if formatted_data is not None else "extract_failed", spans_path)
+    if formatted_data is None:
+        saved = queue.complete(task, None, discovered, entry, "no data extracted")
+    else:
+        saved = queue.complete(task, buffer.records, discovered, entry)
+    if not saved:
+        print(f"Dropped the result of {task.url}: another worker already pushed one")
+
+
+def run_worker(queue=None, worker=None, max_workers=MAX_CONCURRENT_URLS, fetch_mode=FETCH_MODE, cache=None,
+               low_memory=LOW_MEMORY_MODE, idle_exit=None, poll_interval=TASK_POLL_INTERVAL, backend=None):
+    """
+    Lease and run pages from the task queue, up to `max_workers` at a time, renewing the
+    leases of running pages. Runs until interrupted, or until the queue has been empty
+    for `idle_exit` seconds. Prompts go to `backend`, by default EXTRACTION_BACKEND.
+    Returns how many pages were run.
+    """
+    queue = queue or get_task_queue()
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    pool = get_driver_pool()
+    throttle = DomainThrottle()
+    jobs = {}
+    running = {}
+    completed = 0
+    idle_since = last_renewal = time.monotonic()
+    print(f"Worker {worker} polling {queue.path}")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while True:
+            if len(running) < max_workers:
+                for task in queue.lease(worker, max_workers - len(running)):
+                    if task.job_id not in jobs:
+                        jobs[task.job_id] = queue.get_job(task.job_id)
+                    running[executor.submit(run_task, queue, task, jobs[task.job_id], worker, pool, throttle, fetch_mode,
+                                            cache, low_memory, backend)] = task
+            now = time.monotonic()
+            if not running:
+                if idle_exit is not None and now - idle_since >= idle_exit:
+                    break
+                time.sleep(poll_interval)
+                continue
+            idle_since = now
+            # Renewing well before expiry keeps slow pages from being handed to another worker
+            if now - last_renewal >= queue.lease_seconds / 3:
+                queue.renew(worker, [task.id for task in running.values()])
+                last_renewal = now
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                completed += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"An error occurred while running {task.url}: {e}")
+                    queue.fail(task, f"worker: {e}")
+    return completed
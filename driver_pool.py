@@ -0,0 +1,166 @@
+"""
+A bounded pool of reusable Selenium WebDriver sessions.
+
+Starting Chrome costs several seconds, so instead of launching a browser per URL
+the scraper checks a driver out of this pool, uses it for one page and hands it
+back. Drivers are health-checked on checkout, have their cookies and storage
+cleared between checkouts and are recycled after a fixed number of pages.
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+from assets import DRIVER_POOL_SIZE, DRIVER_MAX_PAGES_PER_SESSION, DRIVER_CHECKOUT_TIMEOUT
+
+
+class PooledDriver:
+    """A WebDriver plus the bookkeeping the pool needs to decide when to recycle it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+
+
+class DriverPool:
+    def __init__(self, driver_factory, size=DRIVER_POOL_SIZE, max_pages_per_session=DRIVER_MAX_PAGES_PER_SESSION,
+                 checkout_timeout=DRIVER_CHECKOUT_TIMEOUT):
+        if size < 1:
+            raise ValueError("Driver pool size must be at least 1.")
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages_per_session = max_pages_per_session
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "unhealthy": 0}
+
+    def acquire(self):
+        """Check out a healthy driver, starting a new one if the pool is not full yet."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._created >= self.size:
+                    if self._closed:
+                        raise RuntimeError("Driver pool is closed.")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No browser became available within {self.checkout_timeout} seconds.")
+                    self._condition.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed.")
+                pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    self._created += 1
+
+            if pooled is None:
+                # Start the browser outside the lock so other threads can keep checking drivers in and out
+                try:
+                    pooled = PooledDriver(self.driver_factory())
+                except Exception:
+                    self._forget()
+                    raise
+                self.stats["created"] += 1
+                return pooled
+
+            if self._is_healthy(pooled):
+                self.stats["reused"] += 1
+                return pooled
+
+            self.stats["unhealthy"] += 1
+            self._discard(pooled)
+
+    def release(self, pooled, healthy=True):
+        """Return a driver to the pool, resetting its state or recycling it."""
+        pooled.pages += 1
+        if self._closed or not healthy or pooled.pages >= self.max_pages_per_session:
+            if healthy and not self._closed:
+                self.stats["recycled"] += 1
+            self._discard(pooled)
+            return
+
+        if not self._reset_state(pooled):
+            self._discard(pooled)
+            return
+
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    @contextmanager
+    def driver(self):
+        """Context manager yielding a pooled WebDriver for the duration of one page."""
+        pooled = self.acquire()
+        healthy = True
+        try:
+            yield pooled.driver
+        except Exception:
+            # The page may have left the browser in an unknown state, so don't hand it to the next caller
+            healthy = self._is_healthy(pooled)
+            raise
+        finally:
+            self.release(pooled, healthy)
+
+    def close(self):
+        """Quit every idle driver; drivers still checked out are quit when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def _is_healthy(self, pooled):
+        try:
+            return pooled.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reset_state(self, pooled):
+        """Clear cookies and web storage so the next page starts from a clean profile."""
+        driver = pooled.driver
+        try:
+            driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+            try:
+                # Chrome can drop cookies for every domain at once, WebDriver only for the current one
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            except Exception:
+                driver.delete_all_cookies()
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            print(f"Could not reset browser state, recycling driver: {e}")
+            return False
+
+    def _discard(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        self._forget()
+
+    def _forget(self):
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_driver_pool(driver_factory=None):
+    """Return the process-wide driver pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None or _default_pool._closed:
+            if driver_factory is None:
+                from scraper import setup_selenium
+                driver_factory = setup_selenium
+            _default_pool = DriverPool(driver_factory)
+            atexit.register(_default_pool.close)
+        return _default_pool
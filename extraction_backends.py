@@ -0,0 +1,196 @@
+"""
+Pluggable backends that answer the scraper's extraction and pagination prompts.
+
+"groq" sends every prompt through the shared, rate-limited Groq dispatcher.
+"local" talks to an OpenAI-compatible server on our own hardware (LM Studio,
+llama.cpp server, vLLM): prompts arriving from concurrent workers are grouped
+into batches that are sent as one completions request, and at most
+LOCAL_LLM_SLOTS requests run at once to match the server's parallel slots.
+The backend is chosen per run: callers resolve one with get_extraction_backend
+and pass it down, so concurrent runs can use different backends.
+
+Callers may pass the JSON schema of the expected answer, which each backend turns
+into its own structured-output request, and an `on_text` callback that receives
+the answer's text as it streams in.
+"""
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from assets import (EXTRACTION_BACKEND, GROQ_LLAMA_MODEL_FULLNAME, LLAMA_MODEL_FULLNAME, LOCAL_LLM_BASE_URL,
+                    LOCAL_LLM_SLOTS, LOCAL_LLM_BATCH_SIZE, LOCAL_LLM_BATCH_WAIT, LOCAL_LLM_MAX_TOKENS,
+                    LOCAL_LLM_PROMPT_TEMPLATE, LLM_STREAM_RESPONSES, GROQ_JSON_MODE)
+
+
+class ExtractionBackend(ABC):
+    """A model that turns a system + user message pair into a response text."""
+
+    name = None
+
+    def __init__(self, model):
+        self.model = model
+        self.stats = Counter()
+
+    @abstractmethod
+    def complete(self, system_message: str, user_message: str, json_schema=None, on_text=None) -> str:
+        """
+        Return the answer to a prompt. `json_schema` asks for JSON matching it; `on_text`, if
+        given, may be called with successive pieces of the answer before it is returned.
+        """
+
+    def close(self):
+        pass
+
+
+class GroqBackend(ExtractionBackend):
+    name = "groq"
+
+    def __init__(self, model=GROQ_LLAMA_MODEL_FULLNAME):
+        super().__init__(model)
+
+    def complete(self, system_message, user_message, json_schema=None, on_text=None):
+        # Imported here so runs on the local backend never need the groq package
+        from llm_dispatcher import get_llm_dispatcher
+        self.stats["requests"] += 1
+        # Groq's JSON mode takes no schema (the prompt describes it) and cannot be streamed
+        if json_schema is not None and GROQ_JSON_MODE:
+            return get_llm_dispatcher().complete(system_message, user_message, self.model,
+                                                 response_format={"type": "json_object"})
+        return get_llm_dispatcher().complete(system_message, user_message, self.model,
+                                             on_text=on_text if LLM_STREAM_RESPONSES else None)
+
+
+class LocalOpenAIBackend(ExtractionBackend):
+    """
+    OpenAI-compatible local server with micro-batching.
+
+    With batch_size 1 every prompt is a chat completion, streamed when the caller wants
+    the text as it arrives. Otherwise prompts are formatted with LOCAL_LLM_PROMPT_TEMPLATE
+    and up to batch_size of them with the same JSON schema, collected for at most
+    batch_wait seconds, are sent as the prompt list of one /completions request.
+    """
+    name = "local"
+
+    def __init__(self, model=LLAMA_MODEL_FULLNAME, base_url=None, slots=LOCAL_LLM_SLOTS,
+                 batch_size=LOCAL_LLM_BATCH_SIZE, batch_wait=LOCAL_LLM_BATCH_WAIT, max_tokens=LOCAL_LLM_MAX_TOKENS):
+        from openai import OpenAI
+
+        super().__init__(model)
+        self.base_url = base_url or os.environ.get("LOCAL_LLM_BASE_URL", LOCAL_LLM_BASE_URL)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.max_tokens = max_tokens
+        # Local servers ignore the key, but the client insists on one
+        self._client = OpenAI(base_url=self.base_url, api_key=os.environ.get("LOCAL_LLM_API_KEY", "local"))
+        self._slots = ThreadPoolExecutor(max_workers=max(1, slots), thread_name_prefix="local-llm")
+        self._queue = queue.Queue()
+        if self.batch_size > 1:
+            threading.Thread(target=self._collect_batches, name="local-llm-batcher", daemon=True).start()
+
+    def complete(self, system_message, user_message, json_schema=None, on_text=None):
+        if self.batch_size == 1:
+            return self._slots.submit(self._chat, system_message, user_message, json_schema,
+                                      on_text if LLM_STREAM_RESPONSES else None).result()
+        future = Future()
+        self._queue.put((LOCAL_LLM_PROMPT_TEMPLATE.format(system=system_message, user=user_message), json_schema, future))
+        return future.result()
+
+    @staticmethod
+    def _response_format(json_schema):
+        if json_schema is None:
+            return None
+        return {"type": "json_schema", "json_schema": {"name": "answer", "schema": json_schema}}
+
+    def _chat(self, system_message, user_message, json_schema=None, on_text=None):
+        self.stats["requests"] += 1
+        options = {"response_format": self._response_format(json_schema)} if json_schema is not None else {}
+        completion = self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message},
+            ],
+            max_tokens=self.max_tokens,
+            temperature=0,
+            stream=on_text is not None,
+            **options,
+        )
+        if on_text is None:
+            return completion.choices[0].message.content
+        parts = []
+        for chunk in completion:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                on_text(delta)
+        return "".join(parts)
+
+    def _collect_batches(self):
+        held = None
+        while True:
+            batch = [held or self._queue.get()]
+            held = None
+            try:
+                deadline = time.monotonic() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    # One request has one schema; a prompt expecting another starts the next batch
+                    if item[1] != batch[0][1]:
+                        held = item
+                        break
+                    batch.append(item)
+                self._slots.submit(self._complete_batch, batch)
+            except Exception as e:
+                # E.g. submitting after close(): fail the batch instead of leaving its callers waiting forever
+                print(f"Local LLM batcher error: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _complete_batch(self, batch):
+        prompts = [prompt for prompt, _, _ in batch]
+        json_schema = batch[0][1]
+        try:
+            self.stats["requests"] += 1
+            self.stats["batched_prompts"] += len(prompts)
+            # Not part of the completions API, but accepted by llama.cpp server, vLLM and LM Studio
+            options = {"extra_body": {"response_format": self._response_format(json_schema)}} if json_schema is not None else {}
+            completion = self._client.completions.create(model=self.model, prompt=prompts, max_tokens=self.max_tokens,
+                                                         temperature=0, **options)
+            texts = {choice.index: choice.text for choice in completion.choices}
+            for index, (_, _, future) in enumerate(batch):
+                if index in texts:
+                    future.set_result(texts[index])
+                else:
+                    future.set_exception(RuntimeError("The server returned no completion for this prompt"))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def close(self):
+        self._slots.shutdown(wait=False)
+
+
+BACKENDS = {"groq": GroqBackend, "local": LocalOpenAIBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_extraction_backend(name=None):
+    """Return the process-wide instance of a backend, by default EXTRACTION_BACKEND, creating it on first use."""
+    name = name or EXTRACTION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend: {name}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
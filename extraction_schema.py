@@ -0,0 +1,153 @@
+"""
+Typed field schemas for extraction.
+
+Fields are given as names, optionally typed and described as "Name:type" or
+"Name:type:description" (e.g. "Price:number", "Tags:list:Keywords of the listing").
+Each set of fields is compiled once into a Pydantic model of one listing. The
+model supplies the JSON schema sent with structured-output requests and the
+schema block of the prompt, and validates every record the model returns:
+values are coerced to their field's type, and values that cannot be are
+dropped rather than failing the page.
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from pydantic import ConfigDict, Field, ValidationError, create_model
+
+FIELD_TYPES = {"string": str, "number": float, "integer": int, "boolean": bool, "list": List[str]}
+
+_NUMBER_RE = re.compile(r"-?\d(?:[\d.,]*\d)?")
+
+
+class FieldSpec:
+    def __init__(self, name, type="string", description=None):
+        if type not in FIELD_TYPES:
+            raise ValueError(f"Unknown field type {type!r} for {name!r}, expected one of {', '.join(FIELD_TYPES)}")
+        self.name = name
+        self.type = type
+        self.description = description
+
+
+def parse_field(field) -> FieldSpec:
+    """
+    A FieldSpec from "Name", "Name:type" or "Name:type:description". A label with a colon
+    that is not followed by a known type ("Start: time") is taken as the name as a whole.
+    """
+    if isinstance(field, FieldSpec):
+        return field
+    name, _, rest = str(field).partition(":")
+    type, _, description = rest.partition(":")
+    type = type.strip().lower() or "string"
+    if type not in FIELD_TYPES:
+        return FieldSpec(str(field).strip())
+    return FieldSpec(name.strip(), type, description.strip() or None)
+
+
+def parse_number(text):
+    """
+    The first number in `text` as a plain decimal string ("1.299,00 EUR" -> "1299.00"), or None.
+
+    With both "." and "," the last one is the decimal separator. A separator used more than
+    once groups thousands, and one used once is decimal unless exactly three digits follow:
+    then "," groups thousands ("1,299") while "." is ambiguous ("1.299") and gives None.
+    """
+    match = _NUMBER_RE.search(text)
+    if match is None:
+        return None
+    number = match.group()
+    separators = [char for char in number if char in ".,"]
+    if not separators:
+        return number
+    decimal = separators[-1]
+    integer, _, fraction = number.rpartition(decimal)
+    if len(set(separators)) == 1:
+        if len(separators) > 1:
+            return number.replace(decimal, "")
+        if len(fraction) == 3 and integer.lstrip("-") != "0":
+            if decimal == ".":
+                return None
+            return integer + fraction
+    if not fraction.isdigit() or decimal in integer:
+        return None
+    return integer.replace("," if decimal == "." else ".", "") + "." + fraction
+
+
+def field_names(fields):
+    """The record keys of a list of (possibly typed) fields."""
+    return [parse_field(field).name for field in fields]
+
+
+class ListingSchema:
+    def __init__(self, fields):
+        self.fields = [parse_field(field) for field in fields]
+        self.names = [spec.name for spec in self.fields]
+        # Field names are arbitrary labels ("Company Name"), so they are aliases of positional attributes
+        self.model = create_model(
+            "Listing",
+            __config__=ConfigDict(populate_by_name=True, extra="ignore"),
+            **{f"field_{i}": (Optional[FIELD_TYPES[spec.type]], Field(default=None, alias=spec.name, description=spec.description))
+               for i, spec in enumerate(self.fields)},
+        )
+
+    def json_schema(self):
+        """JSON schema of the whole answer, {"listings": [listing, ...]}."""
+        return {
+            "type": "object",
+            "properties": {"listings": {"type": "array", "items": self.model.model_json_schema(by_alias=True)}},
+            "required": ["listings"],
+        }
+
+    def prompt_structure(self):
+        """The fields as lines of the listing object shown in the system message."""
+        lines = []
+        for spec in self.fields:
+            line = f'"{spec.name}": {spec.type}'
+            lines.append(f"{line} ({spec.description})" if spec.description else line)
+        return ",\n".join(lines)
+
+    def _prepare(self, spec, value):
+        # Models write numbers as "1,299.00 $" and single tags as plain strings
+        if spec.type in ("number", "integer") and isinstance(value, str):
+            value = parse_number(value)
+            if value is not None and spec.type == "integer":
+                try:
+                    value = int(float(value))
+                except ValueError:
+                    pass
+        elif spec.type == "string" and isinstance(value, (int, float, bool)):
+            value = str(value)
+        elif spec.type == "list" and isinstance(value, str):
+            value = [value]
+        elif spec.type == "list" and isinstance(value, list):
+            value = [item if isinstance(item, str) else str(item) for item in value]
+        return value
+
+    def validate(self, record):
+        """
+        Coerce one record to the schema; returns a dict keyed by field name, or None if
+        the record is not an object or has no value for any field.
+        """
+        if not isinstance(record, dict):
+            return None
+        values = {spec.name: self._prepare(spec, record.get(spec.name)) for spec in self.fields}
+        try:
+            listing = self.model.model_validate(values)
+        except ValidationError as e:
+            for error in e.errors():
+                values[error["loc"][0]] = None
+            listing = self.model.model_validate(values)
+        validated = listing.model_dump(by_alias=True)
+        if all(value is None for value in validated.values()):
+            return None
+        return validated
+
+
+@lru_cache(maxsize=64)
+def _listing_schema(fields):
+    return ListingSchema(fields)
+
+
+def get_listing_schema(fields) -> ListingSchema:
+    """The compiled schema of a list of fields, built once per distinct list."""
+    return _listing_schema(tuple(fields))
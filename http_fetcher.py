@@ -0,0 +1,148 @@
+"""
+Lightweight HTTP fetching for server-rendered pages.
+
+Most pages don't need a browser at all. fetch_html_http downloads them with a
+pooled keep-alive session, and needs_browser decides from the response whether
+the page is a JavaScript shell that has to be rendered by Selenium instead.
+Domains that keep needing the browser are remembered and skip the HTTP attempt.
+"""
+import codecs
+import re
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from assets import (HTTP_USER_AGENT, HTTP_TIMEOUT, HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE,
+                    MIN_SERVER_RENDERED_TEXT_CHARS, SPA_SHELL_MARKERS, BROWSER_PREFERENCE_THRESHOLD)
+
+
+def _accept_encoding():
+    # urllib3 only decodes brotli when a brotli package is installed
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            return "gzip, deflate, br"
+        except ImportError:
+            return "gzip, deflate"
+
+
+def create_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "User-Agent": HTTP_USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Encoding": _accept_encoding(),
+        "Accept-Language": "en-US,en;q=0.9",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Return the shared session so connections are reused per host across calls and threads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_http_session()
+        return _session
+
+
+_CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+
+def detect_encoding(response):
+    """
+    The encoding of an HTML response: a byte-order mark, the Content-Type charset, the
+    page's <meta charset>, or else a guess from the bytes. requests alone falls back to
+    ISO-8859-1 for text/html without a charset, which turns UTF-8 pages into mojibake.
+    """
+    content = response.content
+    if content.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    candidates = []
+    header = _CHARSET_RE.search(response.headers.get("Content-Type", ""))
+    if header:
+        candidates.append(header.group(1))
+    meta = _META_CHARSET_RE.search(content[:4096])
+    if meta:
+        candidates.append(meta.group(1).decode("ascii", "ignore"))
+    for encoding in candidates:
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except LookupError:
+            continue
+    return response.apparent_encoding or "utf-8"
+
+
+def fetch_html_http(url, headers=None):
+    """Download a page and return the `requests.Response`, with its `text` decoded in the page's own encoding."""
+    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code != 304:
+        response.encoding = detect_encoding(response)
+    return response
+
+
+_SCRIPT_STYLE_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_BODY_RE = re.compile(r"<body\b[^>]*>(.*)</body\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def visible_text_length(html: str) -> int:
+    """Rough length of the text a reader would see, without building a DOM."""
+    body = _BODY_RE.search(html)
+    text = _SCRIPT_STYLE_RE.sub(" ", body.group(1) if body else html)
+    text = _TAG_RE.sub(" ", text)
+    return len(_WHITESPACE_RE.sub(" ", text).strip())
+
+
+def needs_browser(response) -> bool:
+    """Decide whether an HTTP response has to be re-fetched with a real browser."""
+    if response.status_code >= 400:
+        return True
+    content_type = response.headers.get("Content-Type", "")
+    if content_type and "html" not in content_type.lower():
+        return True
+
+    html = response.text
+    if visible_text_length(html) < MIN_SERVER_RENDERED_TEXT_CHARS:
+        return True
+
+    lowered = html.lower()
+    return any(marker in lowered for marker in SPA_SHELL_MARKERS)
+
+
+class FetchPreferences:
+    """Per-domain memory of whether HTTP fetching worked or the browser was needed."""
+
+    def __init__(self, threshold=BROWSER_PREFERENCE_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"http": 0, "browser": 0})
+
+    def prefers_browser(self, url) -> bool:
+        with self._lock:
+            counts = self._counts[urlparse(url).netloc.lower()]
+            return counts["browser"] >= self.threshold and counts["http"] == 0
+
+    def record(self, url, mode):
+        with self._lock:
+            self._counts[urlparse(url).netloc.lower()][mode] += 1
+
+
+fetch_preferences = FetchPreferences()
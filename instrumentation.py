@@ -0,0 +1,214 @@
+"""
+Per-stage timing and throughput instrumentation for the scrape pipeline.
+
+Every page gets a PageTrace made of spans (fetch, navigate, settle, cookies,
+scroll, convert, prune, selectors, llm, save) with their duration, outcome and sizes.
+Finished traces are appended to a JSON Lines file in the run's output folder
+and aggregated in a process-wide registry that can be summarised or exposed as
+Prometheus text on an optional HTTP endpoint.
+"""
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from assets import METRICS_SAMPLE_SIZE
+
+STAGES = ["fetch", "navigate", "settle", "cookies", "scroll", "convert", "prune", "selectors", "llm", "save"]
+
+
+class PageTrace:
+    def __init__(self, url):
+        self.url = url
+        self.created_at = self.started_at = time.time()
+        self.spans = []
+        self.outcome = None
+        self.attributes = {}
+
+    def begin(self):
+        """
+        Start the page's clock when work on it starts, so total_seconds does not include the
+        time it waited for a worker; that wait is kept as "queued_seconds".
+        """
+        self.started_at = time.time()
+        self.attributes["queued_seconds"] = self.started_at - self.created_at
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block of work; the yielded dict can be used to attach sizes or counts to the span."""
+        span = {"name": name, "start": time.time(), **attributes}
+        start = time.perf_counter()
+        try:
+            yield span
+            span["outcome"] = "ok"
+        except Exception:
+            span["outcome"] = "error"
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - start
+            self.spans.append(span)
+
+    def add(self, name, duration, outcome="ok", **attributes):
+        """Record a span that was timed elsewhere (e.g. waits measured inside the browser fetch)."""
+        self.spans.append({"name": name, "start": None, "duration": duration, "outcome": outcome, **attributes})
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "outcome": self.outcome,
+            "started_at": self.started_at,
+            "total_seconds": time.time() - self.started_at,
+            **self.attributes,
+            "spans": self.spans,
+        }
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_traces(traces):
+    """Per-stage count, total, mean, p50 and p95 seconds for a list of trace dicts."""
+    durations = defaultdict(list)
+    for trace in traces:
+        for span in trace.get("spans", []):
+            durations[span["name"]].append(span["duration"])
+    summary = {}
+    for stage in sorted(durations, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+        values = sorted(durations[stage])
+        summary[stage] = {
+            "count": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+        }
+    return summary
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of every finished trace; quantiles use the most recent samples."""
+
+    def __init__(self, sample_size=METRICS_SAMPLE_SIZE):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=sample_size))
+        self._stage_sum = Counter()
+        self._stage_count = Counter()
+        self._stage_errors = Counter()
+        self._pages = Counter()
+        self._totals = Counter()
+        self.started_at = time.time()
+
+    def record(self, trace: PageTrace):
+        with self._lock:
+            self._pages[trace.outcome or "unknown"] += 1
+            for key in ("bytes", "bytes_transferred", "requests_blocked", "tokens_in", "tokens_out"):
+                self._totals[key] += trace.attributes.get(key) or 0
+            for span in trace.spans:
+                name = span["name"]
+                self._samples[name].append(span["duration"])
+                self._stage_sum[name] += span["duration"]
+                self._stage_count[name] += 1
+                if span.get("outcome") == "error":
+                    self._stage_errors[name] += 1
+
+    def summary(self):
+        with self._lock:
+            pages = sum(self._pages.values())
+            elapsed = time.time() - self.started_at
+            stages = {}
+            for name in self._stage_count:
+                values = sorted(self._samples[name])
+                stages[name] = {
+                    "count": self._stage_count[name],
+                    "total": self._stage_sum[name],
+                    "mean": self._stage_sum[name] / self._stage_count[name],
+                    "p50": _percentile(values, 0.5),
+                    "p95": _percentile(values, 0.95),
+                    "errors": self._stage_errors[name],
+                }
+            return {"pages": dict(self._pages), "pages_per_second": pages / elapsed if elapsed else 0.0,
+                    "totals": dict(self._totals), "stages": stages}
+
+    def prometheus_text(self):
+        summary = self.summary()
+        lines = [
+            "# HELP scraper_pages_total Pages processed, by outcome.",
+            "# TYPE scraper_pages_total counter",
+        ]
+        lines += [f'scraper_pages_total{{outcome="{outcome}"}} {count}' for outcome, count in summary["pages"].items()]
+        lines += [
+            "# HELP scraper_stage_seconds Time spent per pipeline stage.",
+            "# TYPE scraper_stage_seconds summary",
+        ]
+        for stage, stats in summary["stages"].items():
+            lines.append(f'scraper_stage_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'scraper_stage_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'scraper_stage_seconds_sum{{stage="{stage}"}} {stats["total"]:.6f}')
+            lines.append(f'scraper_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [
+            "# HELP scraper_stage_errors_total Failed spans per pipeline stage.",
+            "# TYPE scraper_stage_errors_total counter",
+        ]
+        lines += [f'scraper_stage_errors_total{{stage="{stage}"}} {stats["errors"]}' for stage, stats in summary["stages"].items()]
+        for key, help_text in (("bytes", "HTML bytes fetched."), ("bytes_transferred", "Bytes downloaded by the browser."),
+                               ("requests_blocked", "Browser requests blocked."), ("tokens_in", "Markdown tokens before pruning."),
+                               ("tokens_out", "Markdown tokens sent to the LLM.")):
+            lines += [f"# HELP scraper_{key}_total {help_text}", f"# TYPE scraper_{key}_total counter",
+                      f"scraper_{key}_total {summary['totals'].get(key, 0)}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+_trace_file_lock = threading.Lock()
+
+
+def finish_trace(trace: PageTrace, outcome: str, jsonl_path: str = None):
+    """Mark a page's trace as done, add it to the registry and append it to the run's spans file."""
+    trace.outcome = outcome
+    metrics.record(trace)
+    if jsonl_path:
+        with _trace_file_lock, open(jsonl_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+
+
+def read_traces(jsonl_path):
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve the registry as Prometheus text on http://host:port/metrics; starts only once per process."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics available at http://{host}:{port}/metrics")
+        return _metrics_server
@@ -0,0 +1,230 @@
+"""
+Persistent checkpoints of scrape and crawl jobs.
+
+A job is a list of URLs with the fields to extract and a fixed output folder.
+Every URL moves through pending -> fetched -> extracted, or to failed with the
+error, and each change is committed to SQLite as it happens. If the process dies,
+the job can be resumed: extracted URLs are never redone, pending and fetched ones
+are run again, and failed ones only when asked to retry them (up to JOB_MAX_URL_ATTEMPTS runs).
+"""
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from assets import JOB_STORE_PATH, JOB_MAX_URL_ATTEMPTS
+
+URL_STATES = ("pending", "fetched", "extracted", "failed")
+
+
+class Job:
+    """Handle on one stored job; all state lives in the JobStore."""
+
+    def __init__(self, store, job_id, kind, fields, output_folder, params, created_at):
+        self.store = store
+        self.id = job_id
+        self.kind = kind
+        self.fields = fields
+        self.output_folder = output_folder
+        self.params = params
+        self.created_at = created_at
+
+    def add_urls(self, urls, depth=0):
+        """Add URLs the job does not know yet as pending; returns how many were new."""
+        return self.store._add_urls(self.id, urls, depth)
+
+    def urls(self, states=None):
+        """(url, depth, state) of the job's URLs in the order they were added, optionally only some states."""
+        return self.store._urls(self.id, states)
+
+    def urls_to_run(self):
+        return [url for url, _, _ in self.urls(("pending", "fetched"))]
+
+    def positions(self):
+        """1-based position of every URL, used to number its raw data file consistently across resumes."""
+        return {url: position for position, (url, _, _) in enumerate(self.urls(), start=1)}
+
+    def position(self, url):
+        return self.store._position(self.id, url)
+
+    def state(self, url):
+        """The URL's state, or None if the job does not know it."""
+        return self.store._state(self.id, url)
+
+    def begin(self, urls):
+        self.store._begin(self.id, urls)
+
+    def mark(self, url, state, error=None):
+        self.store._mark(self.id, url, state, error)
+
+    def retry_failed(self, urls=None, max_attempts=JOB_MAX_URL_ATTEMPTS):
+        """
+        Put failed URLs (all of them, or only `urls`) back to pending, except those already
+        run `max_attempts` times; returns how many.
+        """
+        return self.store._retry_failed(self.id, urls, max_attempts)
+
+    def counts(self):
+        return self.store._counts(self.id)
+
+    @property
+    def finished(self):
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["fetched"] == 0
+
+
+class JobStore:
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                output_folder TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_urls (
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                depth INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, url)
+            );
+            CREATE INDEX IF NOT EXISTS job_urls_state ON job_urls (job_id, state);
+        """)
+        self._db.commit()
+
+    def create_job(self, urls, fields, output_folder, kind="scrape", params=None):
+        """
+        Create a job whose id is the name of its output folder. If a job of that name
+        exists, e.g. one started in the same second, a counter ("_2", "_3", ...) is appended
+        to both, so the two jobs never write into the same folder. The folder is created.
+        """
+        base_folder = os.path.normpath(output_folder)
+        now = time.time()
+        with self._lock:
+            for attempt in itertools.count(1):
+                output_folder = base_folder if attempt == 1 else f"{base_folder}_{attempt}"
+                job_id = os.path.basename(output_folder)
+                try:
+                    self._db.execute("INSERT INTO jobs (id, kind, fields, output_folder, params, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                     (job_id, kind, json.dumps(list(fields)), output_folder, json.dumps(params or {}), now))
+                except sqlite3.IntegrityError:
+                    continue
+                break
+            self._db.commit()
+        os.makedirs(output_folder, exist_ok=True)
+        job = Job(self, job_id, kind, list(fields), output_folder, params or {}, now)
+        job.add_urls(urls)
+        return job
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT id, kind, fields, output_folder, params, created_at FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+        if row is None:
+            return None
+        return Job(self, row[0], row[1], json.loads(row[2]), row[3], json.loads(row[4]), row[5])
+
+    def list_jobs(self, limit=20):
+        """The most recent jobs, newest first."""
+        with self._lock:
+            ids = [row[0] for row in self._db.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))]
+        return [self.get_job(job_id) for job_id in ids]
+
+    def delete_job(self, job_id):
+        with self._lock:
+            self._db.execute("DELETE FROM job_urls WHERE job_id = ?", (job_id,))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def _add_urls(self, job_id, urls, depth):
+        now = time.time()
+        with self._lock:
+            position, = self._db.execute("SELECT COALESCE(MAX(position), 0) FROM job_urls WHERE job_id = ?",
+                                         (job_id,)).fetchone()
+            added = 0
+            for url in urls:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO job_urls (job_id, url, position, depth, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, url, position + added + 1, depth, now))
+                added += cursor.rowcount
+            self._db.commit()
+        return added
+
+    def _urls(self, job_id, states):
+        query = "SELECT url, depth, state FROM job_urls WHERE job_id = ?"
+        args = [job_id]
+        if states:
+            query += f" AND state IN ({', '.join('?' * len(states))})"
+            args += list(states)
+        with self._lock:
+            return self._db.execute(query + " ORDER BY position", args).fetchall()
+
+    def _position(self, job_id, url):
+        with self._lock:
+            row = self._db.execute("SELECT position FROM job_urls WHERE job_id = ? AND url = ?", (job_id, url)).fetchone()
+        return row[0] if row else None
+
+    def _state(self, job_id, url):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM job_urls WHERE job_id = ? AND url = ?", (job_id, url)).fetchone()
+        return row[0] if row else None
+
+    def _begin(self, job_id, urls):
+        now = time.time()
+        with self._lock:
+            self._db.executemany("UPDATE job_urls SET attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND url = ?",
+                                 [(now, job_id, url) for url in urls])
+            self._db.commit()
+
+    def _mark(self, job_id, url, state, error):
+        if state not in URL_STATES:
+            raise ValueError(f"Unknown URL state: {state}")
+        with self._lock:
+            self._db.execute("UPDATE job_urls SET state = ?, error = ?, updated_at = ? WHERE job_id = ? AND url = ?",
+                             (state, error, time.time(), job_id, url))
+            self._db.commit()
+
+    def _retry_failed(self, job_id, urls, max_attempts):
+        query = "UPDATE job_urls SET state = 'pending', error = NULL WHERE job_id = ? AND state = 'failed' AND attempts < ?"
+        with self._lock:
+            if urls is None:
+                count = self._db.execute(query, (job_id, max_attempts)).rowcount
+            else:
+                count = sum(self._db.execute(query + " AND url = ?", (job_id, max_attempts, url)).rowcount for url in urls)
+            self._db.commit()
+        return count
+
+    def _counts(self, job_id):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM job_urls WHERE job_id = ? GROUP BY state", (job_id,))
+            counts = Counter(dict(rows.fetchall()))
+        return {state: counts[state] for state in URL_STATES}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """Return the process-wide job store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = JobStore()
+        return _default_store
@@ -0,0 +1,122 @@
+"""
+Incremental parsing of extraction answers.
+
+The model answers {"listings": [{...}, {...}], ...}, token by token. ListingStream
+is fed the text as it arrives and yields every record of the "listings" array as
+soon as its closing brace is seen, so records can be written out before the
+completion finishes. Anything before the first brace (prose, a code fence) or
+after the document is ignored, and if the answer is cut off or malformed the
+records completed so far are still returned instead of failing the whole page.
+"""
+import json
+import re
+
+_LISTINGS_KEY_RE = re.compile(r'"listings"\s*:\s*$')
+
+
+class ListingStream:
+    def __init__(self, validate=None):
+        """`validate` maps each raw record to the record to yield, or None to drop it."""
+        self.validate = validate
+        self.text = ""
+        self.records = []
+        self._pos = 0
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._array_depth = None
+        self._record_start = None
+
+    def feed(self, delta):
+        """Add text to the answer; returns the records it completed."""
+        self.text += delta
+        completed = []
+        text = self.text
+        while self._pos < len(text) and self._end is None:
+            i, char = self._pos, text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if char in "{[":
+                    self._start = i
+                    self._depth = 1
+                    # A bare array is taken as the listings themselves
+                    self._array_depth = 1 if char == "[" else None
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "[" and self._depth == 1 and _LISTINGS_KEY_RE.search(text[max(self._start, i - 64):i]):
+                    self._array_depth = 2
+                elif char == "{" and self._depth == self._array_depth:
+                    self._record_start = i
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._depth == self._array_depth and self._record_start is not None:
+                    record = self._parse(text[self._record_start:i + 1])
+                    self._record_start = None
+                    if record is not None:
+                        self.records.append(record)
+                        completed.append(record)
+                elif self._array_depth is not None and self._depth < self._array_depth:
+                    self._array_depth = None
+                if self._depth == 0:
+                    self._end = i + 1
+        return completed
+
+    def _parse(self, record_text):
+        try:
+            record = json.loads(record_text)
+        except ValueError:
+            return None
+        return self._validated(record)
+
+    def document(self):
+        """The parsed top-level JSON value, or None if the answer holds no complete one."""
+        if self._start is None or self._end is None:
+            return None
+        try:
+            return json.loads(self.text[self._start:self._end])
+        except ValueError:
+            return None
+
+    def finish(self):
+        """
+        The answer as {"listings": [...], ...} once the text is complete.
+
+        Listings are the records yielded while streaming. If none were (the model used
+        another key for its list), the only list of the document is taken instead.
+        Returns None when the answer contains neither records nor a JSON document.
+        """
+        document = self.document()
+        if not isinstance(document, dict):
+            document = {} if document is None else {"listings": document}
+        listings = self.records
+        if not listings and "listings" not in document:
+            lists = [key for key, value in document.items() if isinstance(value, list)]
+            if len(lists) == 1:
+                listings = [record for record in map(self._validated, document.pop(lists[0])) if record is not None]
+        if not listings and not document:
+            return None
+        return {**document, "listings": listings}
+
+    def _validated(self, record):
+        return self.validate(record) if self.validate else record
+
+
+def extract_json(text):
+    """The first JSON object or array in `text`, ignoring prose around it; None if there is none."""
+    stream = ListingStream()
+    stream.feed(text)
+    return stream.document()
@@ -0,0 +1,109 @@
+"""
+Persistent cache of LLM responses.
+
+Responses are stored in SQLite keyed by a hash of the system prompt, the user
+content and the model name, so re-running a crawl over unchanged pages with the
+same fields and model costs neither time nor API tokens.
+"""
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from assets import LLM_CACHE_ENABLED, LLM_CACHE_PATH
+
+
+def cache_key(system_message: str, user_message: str, model: str) -> str:
+    payload = json.dumps([system_message, user_message, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=LLM_CACHE_PATH, enabled=LLM_CACHE_ENABLED):
+        self.path = path
+        # enabled=False bypasses the cache entirely; refresh=True ignores stored
+        # responses but still records the new ones, which invalidates them one by one
+        self.enabled = enabled
+        self.refresh = False
+        self.stats = Counter()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def with_options(self, **options):
+        """
+        A view for one run or UI session: it shares the database and counters, but has
+        its own enabled and refresh settings.
+        """
+        view = copy.copy(self)
+        for name, value in options.items():
+            if name not in ("enabled", "refresh"):
+                raise TypeError(f"Unknown LLM cache option: {name}")
+            setattr(view, name, value)
+        return view
+
+    def get(self, system_message, user_message, model):
+        if not self.enabled or self.refresh:
+            return None
+        # Worker threads share the counters, so they are only touched under the lock
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?",
+                                   (cache_key(system_message, user_message, model),)).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def put(self, system_message, user_message, model, response):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                             (cache_key(system_message, user_message, model), model, response, time.time()))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self.stats.clear()
+
+    def report(self):
+        """Hit/miss counters, hit rate and number of stored responses."""
+        with self._lock:
+            entries, = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            stats = Counter(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide LLM response cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
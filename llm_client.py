@@ -0,0 +1,42 @@
+"""
+Single entry point for chat completions used by the scraper and the pagination detector.
+"""
+from assets import LLM_JSON_MODE
+from extraction_backends import get_extraction_backend
+from json_stream import extract_json
+from llm_cache import get_llm_cache
+
+
+def chat_completion(system_message: str, user_message: str, validate=None, backend=None, json_schema=None,
+                    on_text=None, llm_cache=None) -> str:
+    """
+    Send a system + user message pair to the model and return the response text.
+
+    The prompt goes to `backend`, by default EXTRACTION_BACKEND (see extraction_backends). Responses
+    are served from and stored in `llm_cache` (by default the process-wide LLM cache) under
+    the backend's model. If `validate`
+    is given it is called with the response text and the response is only cached when
+    it returns True, so a malformed answer is asked again next time instead of being
+    replayed forever.
+
+    `json_schema` requests structured output from the backend (when LLM_JSON_MODE is on),
+    and `on_text` receives the answer's text as it streams in. A cached answer is returned
+    without calling `on_text`, so callers must handle any text it has not seen.
+    """
+    backend = backend or get_extraction_backend()
+    cache = llm_cache or get_llm_cache()
+    cached = cache.get(system_message, user_message, backend.model)
+    if cached is not None:
+        return cached
+
+    response_content = backend.complete(system_message, user_message,
+                                        json_schema=json_schema if LLM_JSON_MODE else None, on_text=on_text)
+
+    if validate is None or validate(response_content):
+        cache.put(system_message, user_message, backend.model, response_content)
+    return response_content
+
+
+def is_valid_json(text: str) -> bool:
+    """Whether the text holds a complete JSON document, possibly wrapped in prose or a code fence."""
+    return isinstance(text, str) and extract_json(text) is not None
@@ -0,0 +1,245 @@
+"""
+Shared asynchronous dispatcher for Groq chat completions.
+
+All LLM calls of the process go through one AsyncGroq client running on a
+background event loop. Requests are paced by token buckets matching the
+account's requests-per-minute and tokens-per-minute quotas, retried with
+exponential backoff (honouring Retry-After) on rate limits and transient
+errors, and identical prompts that are in flight at the same time are sent
+only once. Synchronous callers (worker threads) use `complete`, which can also
+stream the answer's text to a callback as it arrives.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+from groq import AsyncGroq, RateLimitError, InternalServerError, APIConnectionError
+
+from assets import (LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_IN_FLIGHT, LLM_MAX_RETRIES,
+                    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_EXPECTED_COMPLETION_TOKENS)
+from chunking import count_tokens
+from llm_cache import cache_key
+
+load_dotenv()
+
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_minute):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.available = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (requests larger than the bucket wait for a full bucket)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.available >= amount else (amount - self.available) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets, plus a global pause after a 429."""
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute)
+        self.paused_until = 0.0
+        self._lock = None
+
+    async def acquire(self, tokens):
+        # Created lazily so it belongs to the dispatcher's event loop
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens),
+                            self.paused_until - time.monotonic())
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def settle_usage(self, estimated, actual):
+        """Correct the token bucket once the real usage of a request is known."""
+        if actual < estimated:
+            self.tokens.give_back(estimated - actual)
+        elif actual > estimated:
+            self.tokens.take(actual - estimated)
+
+
+def retry_after_seconds(error):
+    """Parse the Retry-After header of an API error, in seconds, if there is one."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class LLMDispatcher:
+    def __init__(self, api_key=None, base_url=None, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_in_flight=LLM_MAX_IN_FLIGHT, max_retries=LLM_MAX_RETRIES):
+        self.api_key = api_key or os.environ.get("GROQ_API_KEY")
+        # GROQ_BASE_URL lets tests and benchmarks point the dispatcher at llm_stub_server
+        self.base_url = base_url or os.environ.get("GROQ_BASE_URL")
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.stats = Counter()
+
+        self._client = None
+        self._semaphore = None
+        self._in_flight = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-dispatcher", daemon=True)
+        self._thread.start()
+
+    def complete(self, system_message, user_message, model, timeout=None, response_format=None, on_text=None) -> str:
+        """
+        Blocking wrapper around `complete_async` for use from worker threads.
+
+        With `on_text` the completion is streamed and the callback gets each piece of text
+        in the calling thread, so slow callbacks never hold up the dispatcher's event loop.
+        """
+        if on_text is None:
+            future = asyncio.run_coroutine_threadsafe(
+                self.complete_async(system_message, user_message, model, response_format), self._loop)
+            return future.result(timeout)
+
+        deltas = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self.complete_async(system_message, user_message, model, response_format, deltas.put), self._loop)
+        future.add_done_callback(lambda _: deltas.put(None))
+        while True:
+            delta = deltas.get(timeout=timeout)
+            if delta is None:
+                return future.result()
+            on_text(delta)
+
+    async def complete_async(self, system_message, user_message, model, response_format=None, on_delta=None) -> str:
+        """
+        Answer a prompt. With `on_delta` the completion is streamed and each piece of text is
+        passed to it (a coalesced duplicate only gets the final text).
+        """
+        key = cache_key(system_message, user_message, model if response_format is None else f"{model} {response_format}")
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            # Someone is already asking exactly this; wait for their answer instead of paying twice
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(shared)
+
+        shared = self._loop.create_future()
+        self._in_flight[key] = shared
+        try:
+            result = await self._request(system_message, user_message, model, response_format, on_delta)
+            shared.set_result(result)
+            return result
+        except Exception as e:
+            shared.set_exception(e)
+            shared.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _request(self, system_message, user_message, model, response_format=None, on_delta=None):
+        if self._client is None:
+            self._client = AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        estimated = count_tokens(system_message) + count_tokens(user_message) + LLM_EXPECTED_COMPLETION_TOKENS
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            async with self._semaphore:
+                streamed = []
+                try:
+                    self.stats["requests"] += 1
+                    options = {"response_format": response_format} if response_format else {}
+                    completion = await self._client.chat.completions.create(
+                        messages=[
+                            {"role": "system", "content": system_message},
+                            {"role": "user", "content": user_message},
+                        ],
+                        model=model,
+                        stream=on_delta is not None,
+                        **options,
+                    )
+                    if on_delta is not None:
+                        usage = None
+                        async for chunk in completion:
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                streamed.append(delta)
+                                on_delta(delta)
+                            # Groq reports the usage of a stream in its last chunk
+                            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                except RETRYABLE_ERRORS as e:
+                    # Text already handed out cannot be taken back, so a broken stream is not retried
+                    if attempt == self.max_retries or streamed:
+                        self.stats["failures"] += 1
+                        raise
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    if isinstance(e, RateLimitError):
+                        # Everyone backs off, not just this request
+                        self.limiter.pause(delay)
+                        self.stats["rate_limited"] += 1
+                    self.stats["retries"] += 1
+                    print(f"LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+            if on_delta is None:
+                usage = getattr(completion, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.limiter.settle_usage(estimated, usage.total_tokens)
+                self.stats["tokens"] += usage.total_tokens
+            return "".join(streamed) if on_delta is not None else completion.choices[0].message.content
+
+    def close(self):
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_default_dispatcher = None
+_default_dispatcher_lock = threading.Lock()
+
+
+def get_llm_dispatcher():
+    """Return the process-wide dispatcher, creating it on first use."""
+    global _default_dispatcher
+    with _default_dispatcher_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = LLMDispatcher()
+        return _default_dispatcher
@@ -0,0 +1,209 @@
+"""
+A local stand-in for the Groq / OpenAI chat completions API.
+
+Answers every POST to a path ending in /chat/completions, or /completions with
+one or a list of prompts in the Llama 3 chat template, with a deterministic
+completion (streamed as server-sent events when asked to), so the scraper can be
+tested and benchmarked without network access,
+API keys or token costs. It can also simulate latency and rate limiting, or answer
+the first requests with a 429 to exercise the client's retries.
+
+Usage:
+    python llm_stub_server.py --port 8765 [--latency 0.2] [--rpm 30] [--rate-limit-first 2]
+    GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_QUOTED_FIELD_RE = re.compile(r'^\s*"([^"]+)"\s*(?::[^\n]*?)?,?\s*$', re.MULTILINE)
+_RECORD_LINE_RE = re.compile(r"^\s*(?:#{1,6}|\*|-|\d+\.)\s+(.+)$", re.MULTILINE)
+_TEMPLATE_TURN_RE = re.compile(r"<\|start_header_id\|>(system|user)<\|end_header_id\|>\n\n(.*?)<\|eot_id\|>", re.DOTALL)
+
+
+def stub_response(system_message: str, user_message: str, max_records: int = 20) -> str:
+    """
+    Build a deterministic answer for a prompt.
+
+    Pagination prompts get an empty page list; extraction prompts get one record per
+    heading or list item of the page content, with every requested field filled in
+    from that line.
+    """
+    if '"page_urls"' in system_message:
+        return json.dumps({"page_urls": []})
+
+    schema = system_message.split('"listings"', 1)[-1]
+    fields = _QUOTED_FIELD_RE.findall(schema) or ["text"]
+    lines = _RECORD_LINE_RE.findall(user_message)[:max_records]
+    return json.dumps({"listings": [{field: f"{field}: {line.strip()[:80]}" for field in fields} for line in lines]})
+
+
+def split_prompt(prompt: str):
+    """(system_message, user_message) of a prompt rendered with the chat template."""
+    turns = dict(_TEMPLATE_TURN_RE.findall(prompt))
+    return turns.get("system", ""), turns.get("user", prompt)
+
+
+class StubState:
+    def __init__(self, latency=0.0, requests_per_minute=None, rate_limit_first=0, retry_after=1.0):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.rate_limit_first = rate_limit_first
+        self.retry_after = retry_after
+        self.requests = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Return None if the request may proceed, else the seconds the client should wait."""
+        with self._lock:
+            self.requests += 1
+            if self.requests <= self.rate_limit_first:
+                return self.retry_after
+            if not self.requests_per_minute:
+                return None
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.requests_per_minute:
+                return 60 - (now - self._recent[0])
+            self._recent.append(now)
+            return None
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if not path.endswith("/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            wait = state.admit()
+            if wait is not None:
+                self._send(429, {"error": {"message": "rate limit exceeded", "type": "rate_limit_exceeded"}},
+                           {"Retry-After": f"{wait:.2f}"})
+                return
+            if state.latency and not body.get("stream"):
+                time.sleep(state.latency)
+
+            if not path.endswith("/chat/completions"):
+                self._complete_prompts(body)
+                return
+
+            messages = body.get("messages", [])
+            system_message = next((m["content"] for m in messages if m.get("role") == "system"), "")
+            user_message = "\n".join(m["content"] for m in messages if m.get("role") == "user")
+            content = stub_response(system_message, user_message)
+            prompt_tokens = (len(system_message) + len(user_message)) // 4
+            completion_tokens = len(content) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if body.get("stream"):
+                self._stream(body, content, usage)
+                return
+            self._send(200, {
+                "id": f"stub-{state.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+
+        def _complete_prompts(self, body):
+            prompts = body.get("prompt", "")
+            prompts = [prompts] if isinstance(prompts, str) else prompts
+            texts = [stub_response(*split_prompt(prompt)) for prompt in prompts]
+            prompt_tokens = sum(len(prompt) for prompt in prompts) // 4
+            completion_tokens = sum(len(text) for text in texts) // 4
+            self._send(200, {
+                "id": f"stub-{state.requests}",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": index, "finish_reason": "stop", "text": text, "logprobs": None}
+                            for index, text in enumerate(texts)],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def _stream(self, body, content, usage, piece_size=16):
+            """
+            Send the content in small deltas, spreading the simulated latency over them. Like
+            Groq, the last chunk carries the usage of the request under "x_groq".
+            """
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            pieces = [content[i:i + piece_size] for i in range(0, len(content), piece_size)]
+            for index, piece in enumerate(pieces + [None]):
+                chunk = {
+                    "id": f"stub-{state.requests}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": {"content": piece} if piece is not None else {},
+                                 "finish_reason": None if piece is not None else "stop"}],
+                }
+                if piece is None:
+                    chunk["x_groq"] = {"usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if piece is not None and state.latency:
+                    time.sleep(state.latency / len(pieces))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, requests_per_minute=None, rate_limit_first=0, retry_after=1.0):
+    """Start the stub in a background thread; returns (server, base_url). Call server.shutdown() to stop it."""
+    state = StubState(latency, requests_per_minute, rate_limit_first, retry_after)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, name="llm-stub-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--rpm", type=int, default=None, help="Answer 429 above this many requests per minute")
+    parser.add_argument("--rate-limit-first", type=int, default=0, help="Answer 429 to this many requests first")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of those 429s, in seconds")
+    args = parser.parse_args()
+
+    state = StubState(args.latency, args.rpm, args.rate_limit_first, args.retry_after)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"LLM stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Low-memory processing of very large pages.
+
+`driver.page_source` serializes the whole DOM into one Python string, which is
+then copied by every stage it passes through. In low-memory mode the browser
+instead reduces the page to its main content, dropping scripts, styles, SVGs and
+media, and Python reads that HTML in slices that go straight to a spool file in
+the run's output folder. The pipeline passes a SpooledHtml handle instead of the
+HTML, and lxml parses the file directly, so no stage holds the page as a string.
+"""
+import os
+
+from assets import LOW_MEMORY_SLICE_CHARS, MAIN_CONTENT_SELECTORS, MAIN_CONTENT_DROP_TAGS
+from output_sinks import records_from_formatted_data
+
+# A main-content candidate must hold at least this share of the page's text
+MAIN_CONTENT_MIN_TEXT_SHARE = 0.3
+
+# Picks the main content, strips it in place (the page is not used afterwards) and keeps the
+# result in a window variable, together with the <link rel="next/prev"> tags pagination needs.
+MAIN_CONTENT_SCRIPT = """
+var selectors = arguments[0], dropTags = arguments[1], minShare = arguments[2];
+var total = (document.body.innerText || '').length, root = null;
+for (var i = 0; i < selectors.length && !root; i++) {
+    var candidate = document.querySelector(selectors[i]);
+    if (candidate && (candidate.innerText || '').length >= minShare * total) root = candidate;
+}
+root = root || document.body;
+root.querySelectorAll(dropTags.join(',')).forEach(function (element) { element.remove(); });
+var links = Array.prototype.map.call(document.querySelectorAll('link[rel~="next"], link[rel~="prev"]'),
+                                     function (link) { return link.outerHTML; }).join('');
+window.__scraperMainContent = '<html><head>' + links + '</head><body>'
+    + (root === document.body ? root.innerHTML : root.outerHTML) + '</body></html>';
+return window.__scraperMainContent.length;
+"""
+
+# Returns [end, slice]; a slice never ends between the two halves of a surrogate pair
+READ_SLICE_SCRIPT = """
+var content = window.__scraperMainContent, start = arguments[0];
+var end = Math.min(content.length, start + arguments[1]);
+if (end < content.length && /[\\uD800-\\uDBFF]/.test(content.charAt(end - 1))) end -= 1;
+return [end, content.slice(start, end)];
+"""
+
+
+class SpooledHtml:
+    """A page's HTML in a file, passed through the pipeline in place of the HTML text."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def __len__(self):
+        return self.size
+
+    def read(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def __repr__(self):
+        return f"SpooledHtml({self.path!r}, {self.size} bytes)"
+
+
+def spool_html(html: str, path) -> SpooledHtml:
+    """Write HTML that is already in memory (HTTP fetches, cache hits) to a spool file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return SpooledHtml(path)
+
+
+def spool_main_content(driver, path, slice_chars=LOW_MEMORY_SLICE_CHARS) -> SpooledHtml:
+    """Reduce the driver's page to its main content and stream it to `path` in slices."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    length = driver.execute_script(MAIN_CONTENT_SCRIPT, MAIN_CONTENT_SELECTORS, MAIN_CONTENT_DROP_TAGS,
+                                   MAIN_CONTENT_MIN_TEXT_SHARE)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            start = 0
+            while start < length:
+                start, piece = driver.execute_script(READ_SLICE_SCRIPT, start, slice_chars)
+                f.write(piece)
+    finally:
+        driver.execute_script("delete window.__scraperMainContent;")
+    return SpooledHtml(path)
+
+
+def spool_path(output_folder, file_number):
+    return os.path.join(output_folder, "pages", f"page_{file_number}.html")
+
+
+def result_summary(url, formatted_data, output_path, html_path=None):
+    """What low-memory runs keep of a page's result: its record count and where the records and page are."""
+    if formatted_data is None:
+        return None
+    summary = {"url": url, "records": len(records_from_formatted_data(formatted_data)), "output": output_path}
+    if html_path is not None and os.path.exists(html_path):
+        summary["html"] = html_path
+    return summary
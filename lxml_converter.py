@@ -0,0 +1,164 @@
+"""
+Single-parse HTML to markdown conversion on top of lxml.
+
+The original path parses a page with BeautifulSoup's pure-Python html.parser,
+serializes it back to a string and lets html2text parse it a second time. Here
+the page is parsed once by lxml's C parser; unwanted elements are dropped from
+that tree and markdown is emitted from the same tree.
+"""
+import re
+
+import lxml.html
+from lxml import etree
+
+from assets import PRUNE_HTML_TAGS, COOKIE_BANNER_TOKENS
+from low_memory import SpooledHtml
+
+_PARSER = lxml.html.HTMLParser(encoding="utf-8", remove_comments=True)
+_COOKIE_BANNER_RE = re.compile("^(?:" + "|".join(COOKIE_BANNER_TOKENS) + ")$", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"[ \t\r\n\f\v]+")
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+\n")
+_LEADING_SPACE_RE = re.compile(r"\n[ \t]+(?=[^ \t*\d>|])")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCKS = {"p", "div", "section", "article", "main", "aside", "figure", "figcaption", "form", "fieldset",
+           "address", "dl", "dt", "dd", "details", "summary", "center"}
+_BOLD = {"strong", "b"}
+_ITALIC = {"em", "i"}
+
+
+def parse_html(html_content):
+    """Parse a page (HTML text, or a SpooledHtml read from its file) with lxml, returning None for empty documents."""
+    try:
+        if isinstance(html_content, SpooledHtml):
+            return lxml.html.parse(html_content.path, parser=_PARSER).getroot()
+        return lxml.html.document_fromstring(html_content.encode("utf-8", "replace"), parser=_PARSER)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def prune_tree(root, tags=PRUNE_HTML_TAGS):
+    """Drop non-content elements and cookie banners from the tree in place, in one pass."""
+    tags = set(tags)
+    doomed = []
+    for element in root.iter():
+        if not isinstance(element.tag, str) or element.tag in ("html", "body"):
+            continue
+        if element.tag in tags or _COOKIE_BANNER_RE.match(element.get("id", "")) \
+                or any(_COOKIE_BANNER_RE.match(token) for token in element.get("class", "").split()):
+            doomed.append(element)
+    for element in doomed:
+        # drop_tree keeps the element's tail text, which belongs to the parent
+        element.drop_tree()
+    return root
+
+
+class _MarkdownEmitter:
+    def __init__(self):
+        self.list_stack = []
+
+    def render(self, element):
+        parts = []
+        self._walk(element, parts)
+        return "".join(parts)
+
+    def _children(self, element, parts):
+        if element.text:
+            parts.append(_WHITESPACE_RE.sub(" ", element.text))
+        for child in element:
+            self._walk(child, parts)
+            if child.tail:
+                parts.append(_WHITESPACE_RE.sub(" ", child.tail))
+
+    def _inline(self, element):
+        parts = []
+        self._children(element, parts)
+        return "".join(parts).strip()
+
+    def _walk(self, element, parts):
+        tag = element.tag
+        if not isinstance(tag, str):
+            return
+
+        if tag in _HEADINGS:
+            parts.append(f"\n\n{'#' * _HEADINGS[tag]} {self._inline(element)}\n\n")
+        elif tag in _BLOCKS:
+            parts.append("\n\n")
+            self._children(element, parts)
+            parts.append("\n\n")
+        elif tag == "br":
+            parts.append("  \n")
+        elif tag == "hr":
+            parts.append("\n\n* * *\n\n")
+        elif tag == "a":
+            text = self._inline(element)
+            href = element.get("href")
+            if href and text:
+                parts.append(f"[{text}]({href.strip()})")
+            else:
+                parts.append(text)
+        elif tag == "img":
+            src = element.get("src")
+            if src:
+                parts.append(f"![{element.get('alt', '').strip()}]({src.strip()})")
+        elif tag in _BOLD or tag in _ITALIC:
+            text = self._inline(element)
+            if text:
+                marker = "**" if tag in _BOLD else "_"
+                parts.append(f"{marker}{text}{marker}")
+        elif tag == "code":
+            parts.append(f"`{element.text_content()}`")
+        elif tag == "pre":
+            parts.append(f"\n\n```\n{element.text_content().strip()}\n```\n\n")
+        elif tag == "blockquote":
+            text = _BLANK_LINES_RE.sub("\n\n", self._inline(element))
+            parts.append("\n\n" + "\n".join("> " + line for line in text.splitlines()) + "\n\n")
+        elif tag in ("ul", "ol"):
+            self.list_stack.append([tag, 0])
+            parts.append("\n\n" if len(self.list_stack) == 1 else "\n")
+            self._children(element, parts)
+            parts.append("\n\n" if len(self.list_stack) == 1 else "\n")
+            self.list_stack.pop()
+        elif tag == "li":
+            indent = "  " * max(len(self.list_stack) - 1, 0)
+            if self.list_stack and self.list_stack[-1][0] == "ol":
+                self.list_stack[-1][1] += 1
+                bullet = f"{self.list_stack[-1][1]}. "
+            else:
+                bullet = "* "
+            parts.append(f"\n{indent}{bullet}{self._inline(element)}\n")
+        elif tag == "table":
+            parts.append("\n\n" + self._table(element) + "\n\n")
+        else:
+            self._children(element, parts)
+
+    def _table(self, table):
+        rows = []
+        columns = 0
+        for row in table.iter("tr"):
+            cells = [self._inline(cell).replace("|", "\\|").replace("\n", " ")
+                     for cell in row if isinstance(cell.tag, str) and cell.tag in ("td", "th")]
+            if cells:
+                columns = columns or len(cells)
+                rows.append("| " + " | ".join(cells) + " |")
+        if rows:
+            # The first row is used as the header
+            rows.insert(1, "|" + "---|" * columns)
+        return "\n".join(rows)
+
+
+def tree_to_markdown(root) -> str:
+    body = root.find("body")
+    markdown = _MarkdownEmitter().render(body if body is not None else root)
+    markdown = _TRAILING_SPACE_RE.sub("\n", markdown.replace("  \n", "\ue000"))
+    markdown = _LEADING_SPACE_RE.sub("\n", markdown).replace("\ue000", "  \n")
+    return _BLANK_LINES_RE.sub("\n\n", markdown).strip() + "\n"
+
+
+def html_to_markdown_lxml(html_content) -> str:
+    """Clean a page and convert it to markdown from a single lxml parse."""
+    root = parse_html(html_content)
+    if root is None:
+        return ""
+    return tree_to_markdown(prune_tree(root))
@@ -0,0 +1,218 @@
+"""
+Append-only output sinks that write records as each page finishes.
+
+Instead of a JSON file and an Excel workbook per page, a run streams all of its
+records into one JSON Lines file and one CSV (or Parquet) file. Excel is only
+generated on demand at the end, from the JSON Lines file.
+"""
+import csv
+import json
+import os
+import threading
+
+import pandas as pd
+
+from assets import OUTPUT_FORMATS, OUTPUT_ROW_GROUP_SIZE
+from extraction_schema import field_names
+
+SOURCE_URL_COLUMN = "source_url"
+
+
+def records_from_formatted_data(formatted_data):
+    """Turn the parsed LLM response of one page into a list of record dicts."""
+    if formatted_data is None:
+        return []
+    if isinstance(formatted_data, str):
+        formatted_data = json.loads(formatted_data)
+    if hasattr(formatted_data, "dict"):
+        formatted_data = formatted_data.dict()
+
+    if isinstance(formatted_data, dict):
+        if isinstance(formatted_data.get("listings"), list):
+            records = formatted_data["listings"]
+        elif len(formatted_data) == 1 and isinstance(next(iter(formatted_data.values())), list):
+            records = next(iter(formatted_data.values()))
+        else:
+            records = [formatted_data]
+    elif isinstance(formatted_data, list):
+        records = formatted_data
+    else:
+        raise ValueError("Formatted data is neither a dictionary nor a list, cannot extract records")
+    return [record.dict() if hasattr(record, "dict") else record for record in records if record is not None]
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def source_urls(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {json.loads(line).get(SOURCE_URL_COLUMN) for line in f if line.strip()}
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink:
+    """CSV with one column per field; keys the model invents beyond the fields are dropped."""
+
+    def __init__(self, path, columns):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, records):
+        for record in records:
+            if isinstance(record, dict):
+                self._writer.writerow({k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+                                       for k, v in record.items()})
+        self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def source_urls(self):
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            return {row.get(SOURCE_URL_COLUMN) for row in csv.DictReader(f)}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Parquet file written in row groups of `row_group_size` records; needs pyarrow."""
+
+    def __init__(self, path, columns, row_group_size=OUTPUT_ROW_GROUP_SIZE, earlier_parts=()):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.earlier_parts = list(earlier_parts)
+        self.columns = columns
+        self.row_group_size = row_group_size
+        self._schema = pa.schema([(column, pa.string()) for column in columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+
+    def write(self, records):
+        for record in records:
+            if isinstance(record, dict):
+                self._buffer.append({column: None if record.get(column) is None else str(record.get(column))
+                                     for column in self.columns})
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._writer.write_table(self._pa.Table.from_pylist(self._buffer, schema=self._schema))
+            self._buffer = []
+
+    def flush(self):
+        """Write the buffered records as a row group; the file is only readable once closed."""
+        self._flush()
+
+    def source_urls(self):
+        # The part being written has no footer yet, so only finished parts can be read back
+        urls = set()
+        for path in self.earlier_parts:
+            try:
+                urls.update(self._pq.read_table(path, columns=[SOURCE_URL_COLUMN]).column(SOURCE_URL_COLUMN).to_pylist())
+            except Exception as e:
+                # A part left unfinished by a crash has no footer and lost its rows
+                print(f"Could not read {path}: {e}")
+        return urls
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class OutputSink:
+    """Fans the records of each finished page out to every configured format."""
+
+    def __init__(self, output_folder, fields, formats=OUTPUT_FORMATS, base_name="scraped_data"):
+        os.makedirs(output_folder, exist_ok=True)
+        self.output_folder = output_folder
+        self.paths = {}
+        self._lock = threading.Lock()
+        self._sinks = []
+        columns = [SOURCE_URL_COLUMN] + field_names(fields)
+        for output_format in formats:
+            path = os.path.join(output_folder, f"{base_name}.{output_format}")
+            if output_format == "jsonl":
+                sink = JsonLinesSink(path)
+            elif output_format == "csv":
+                sink = CsvSink(path, columns)
+            elif output_format == "parquet":
+                # Parquet files cannot be appended to, so a resumed job writes the next part file
+                part, earlier_parts = 1, []
+                while os.path.exists(path):
+                    earlier_parts.append(path)
+                    part += 1
+                    path = os.path.join(output_folder, f"{base_name}.part{part}.{output_format}")
+                sink = ParquetSink(path, columns, earlier_parts=earlier_parts)
+            else:
+                raise ValueError(f"Unknown output format: {output_format}")
+            self._sinks.append(sink)
+            self.paths[output_format] = path
+        self.records_written = 0
+
+    def write(self, formatted_data, source_url):
+        """Append the records of one page; returns how many were written."""
+        records = [{SOURCE_URL_COLUMN: source_url, **record} if isinstance(record, dict) else record
+                   for record in records_from_formatted_data(formatted_data)]
+        with self._lock:
+            for sink in self._sinks:
+                sink.write(records)
+            self.records_written += len(records)
+        return len(records)
+
+    def flush(self):
+        """Push everything written so far to disk, e.g. before recording that it was saved."""
+        with self._lock:
+            for sink in self._sinks:
+                sink.flush()
+
+    def source_urls(self):
+        """The source URLs of the records already in the output, preferably read from the JSONL or CSV file."""
+        with self._lock:
+            sink = next((sink for sink in self._sinks if not isinstance(sink, ParquetSink)), self._sinks[0])
+            sink.flush()
+            return sink.source_urls()
+
+    def close(self):
+        with self._lock:
+            for sink in self._sinks:
+                sink.close()
+            self._sinks = []
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def export_excel(jsonl_path, excel_path=None):
+    """Build an Excel workbook from a run's JSON Lines output, once, at the end."""
+    excel_path = excel_path or os.path.splitext(jsonl_path)[0] + ".xlsx"
+    pd.DataFrame(read_jsonl(jsonl_path)).to_excel(excel_path, index=False)
+    print(f"Formatted data saved to Excel at {excel_path}")
+    return excel_path
@@ -0,0 +1,225 @@
+"""
+On-disk cache for fetched HTML and the markdown converted from it.
+
+Pages are indexed by their normalized URL, but the HTML and markdown themselves
+are stored content-addressed (by the SHA-256 of the HTML), so an unchanged page
+is never converted twice. Entries expire after a TTL and can then be revalidated
+with ETag/Last-Modified; the blob store is kept under a size limit by evicting the
+least recently used blobs first.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from assets import PAGE_CACHE_DIR, PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES
+from url_utils import normalize_url
+
+
+class CachedPage:
+    def __init__(self, url, html, fetch_mode, etag, last_modified, fetched_at, ttl):
+        self.url = url
+        self.html = html
+        self.fetch_mode = fetch_mode
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.fetched_at < self.ttl
+
+    @property
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def revalidation_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    def __init__(self, directory=PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+        # Pages are fetched on many threads; the counters have their own lock as _evict runs under _lock
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                html_sha TEXT NOT NULL,
+                fetch_mode TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (sha, kind)
+            );
+        """)
+        self._db.commit()
+
+    # ---- HTML ----
+
+    def get(self, url):
+        """Return the cached page for `url` (fresh or stale) or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, html_sha, fetch_mode, etag, last_modified, fetched_at FROM pages WHERE url_key = ?",
+                (normalize_url(url),)).fetchone()
+            if row is None:
+                return None
+            html = self._read_blob(row[1], "html")
+            if html is None:
+                self._db.execute("DELETE FROM pages WHERE url_key = ?", (normalize_url(url),))
+                self._db.commit()
+                return None
+            return CachedPage(row[0], html, row[2], row[3], row[4], row[5], self.ttl)
+
+    def has_fresh(self, url) -> bool:
+        """Cheap check whether a fresh entry exists, without reading the HTML."""
+        with self._lock:
+            row = self._db.execute("SELECT fetched_at FROM pages WHERE url_key = ?", (normalize_url(url),)).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+
+    def put(self, url, html, fetch_mode, etag=None, last_modified=None):
+        html_sha = content_hash(html)
+        with self._lock:
+            self._write_blob(html_sha, "html", html)
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url_key, url, html_sha, fetch_mode, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), url, html_sha, fetch_mode, etag, last_modified, time.time()))
+            self._db.commit()
+            self._evict()
+
+    def refresh(self, url):
+        """Mark a stale entry as fresh again after a successful revalidation."""
+        with self._lock:
+            self._db.execute("UPDATE pages SET fetched_at = ? WHERE url_key = ?", (time.time(), normalize_url(url)))
+            self._db.commit()
+
+    # ---- Markdown ----
+
+    def get_markdown(self, html, variant="default"):
+        """Return markdown previously converted from exactly this HTML, or None."""
+        with self._lock:
+            markdown = self._read_blob(content_hash(html), "md:" + variant)
+        self.count("markdown_hits" if markdown is not None else "markdown_misses")
+        return markdown
+
+    def put_markdown(self, html, markdown, variant="default"):
+        with self._lock:
+            self._write_blob(content_hash(html), "md:" + variant, markdown)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for sha, kind in self._db.execute("SELECT sha, kind FROM blobs").fetchall():
+                self._remove_blob_file(sha, kind)
+            self._db.execute("DELETE FROM blobs")
+            self._db.execute("DELETE FROM pages")
+            self._db.commit()
+
+    def report(self):
+        """Hit/miss counters plus the current size of the cache."""
+        with self._lock:
+            pages, = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            size, = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, "pages": pages, "bytes": size}
+
+    def count(self, name, amount=1):
+        """Add to one of the hit/miss counters; safe to call from any thread."""
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    # ---- Blob storage (callers hold the lock) ----
+
+    def _blob_path(self, sha, kind):
+        extension = "html" if kind == "html" else kind.replace(":", "_")
+        return os.path.join(self.directory, "blobs", sha[:2], f"{sha}.{extension}")
+
+    def _read_blob(self, sha, kind):
+        if self._db.execute("SELECT 1 FROM blobs WHERE sha = ? AND kind = ?", (sha, kind)).fetchone() is None:
+            return None
+        try:
+            with open(self._blob_path(sha, kind), "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            self._db.execute("DELETE FROM blobs WHERE sha = ? AND kind = ?", (sha, kind))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE blobs SET last_access = ? WHERE sha = ? AND kind = ?", (time.time(), sha, kind))
+        self._db.commit()
+        return content
+
+    def _write_blob(self, sha, kind, content):
+        path = self._blob_path(sha, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = content.encode("utf-8")
+        # Write to a temporary file first so readers never see a half-written blob
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._db.execute("INSERT OR REPLACE INTO blobs (sha, kind, size, last_access) VALUES (?, ?, ?, ?)",
+                         (sha, kind, len(data), time.time()))
+        self._db.commit()
+
+    def _remove_blob_file(self, sha, kind):
+        try:
+            os.remove(self._blob_path(sha, kind))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        total, = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        if total <= self.max_bytes:
+            return
+        for sha, kind, size in self._db.execute("SELECT sha, kind, size FROM blobs ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove_blob_file(sha, kind)
+            self._db.execute("DELETE FROM blobs WHERE sha = ? AND kind = ?", (sha, kind))
+            if kind == "html":
+                self._db.execute("DELETE FROM pages WHERE html_sha = ?", (sha,))
+            total -= size
+            self.count("evictions")
+        self._db.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Return the process-wide page cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache()
+        return _default_cache
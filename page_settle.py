@@ -0,0 +1,96 @@
+"""
+Event-driven detection of when a rendered page has finished loading.
+
+Instead of sleeping for a fixed time we watch the page itself: the number of
+fetch/XHR requests still pending, the time since the DOM last changed
+(MutationObserver) and whether the scroll height has stopped growing.
+"""
+import time
+
+from assets import SETTLE_TIMEOUT, SETTLE_QUIET_PERIOD, SETTLE_POLL_INTERVAL
+
+
+# Counts in-flight fetch/XHR requests and records the last network and DOM activity in window.__settle.
+# Safe to run more than once per document; it installs itself only the first time.
+SETTLE_INSTRUMENTATION_SCRIPT = """
+(function () {
+    if (window.__settle) { return; }
+    var s = window.__settle = {pending: 0, lastActivity: Date.now()};
+    var touch = function () { s.lastActivity = Date.now(); };
+    var done = function () { s.pending = Math.max(0, s.pending - 1); touch(); };
+
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function () {
+            s.pending++; touch();
+            var p = originalFetch.apply(this, arguments);
+            p.then(done, done);
+            return p;
+        };
+    }
+
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        s.pending++; touch();
+        this.addEventListener('loadend', done);
+        return originalSend.apply(this, arguments);
+    };
+
+    var observe = function () {
+        new MutationObserver(touch).observe(document.documentElement,
+            {childList: true, subtree: true, attributes: true, characterData: true});
+    };
+    if (document.documentElement) { observe(); } else { document.addEventListener('DOMContentLoaded', observe); }
+})();
+"""
+
+_SETTLE_PROBE_SCRIPT = SETTLE_INSTRUMENTATION_SCRIPT + """
+var s = window.__settle;
+return {
+    ready: document.readyState,
+    pending: s.pending,
+    idle_ms: Date.now() - s.lastActivity,
+    height: document.body ? document.body.scrollHeight : 0
+};
+"""
+
+
+def install_settle_instrumentation(driver):
+    """Register the instrumentation so it runs before any page script on every new document."""
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": SETTLE_INSTRUMENTATION_SCRIPT})
+    except Exception:
+        # Non-Chrome drivers: the probe installs it lazily, which only misses requests made before the first probe
+        pass
+
+
+def wait_for_page_settle(driver, timeout=SETTLE_TIMEOUT, quiet_period=SETTLE_QUIET_PERIOD, poll_interval=SETTLE_POLL_INTERVAL):
+    """
+    Wait until the page is loaded, has no pending fetch/XHR requests, its DOM has not
+    changed for `quiet_period` seconds and its scroll height has been stable for as long.
+
+    Returns the number of seconds actually waited (at most roughly `timeout`).
+    """
+    start = time.monotonic()
+    last_height = None
+    height_stable_since = start
+    quiet_ms = quiet_period * 1000
+
+    while True:
+        state = driver.execute_script(_SETTLE_PROBE_SCRIPT) or {}
+        now = time.monotonic()
+
+        if state.get("height") != last_height:
+            last_height = state.get("height")
+            height_stable_since = now
+
+        settled = (
+            state.get("ready") == "complete"
+            and state.get("pending", 0) <= 0
+            and state.get("idle_ms", 0) >= quiet_ms
+            and now - height_stable_since >= quiet_period
+        )
+        if settled or now - start >= timeout:
+            return now - start
+
+        time.sleep(poll_interval)
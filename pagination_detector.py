@@ -1,13 +1,16 @@
-import os
-import json
+import re
 from typing import List, Dict, Tuple, Union
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
 from pydantic import BaseModel, Field
 
 from dotenv import load_dotenv
 
-from groq import Groq
-
-from assets import PROMPT_PAGINATION, GROQ_LLAMA_MODEL_FULLNAME
+from assets import (PROMPT_PAGINATION, PAGE_QUERY_PARAMS, NEXT_LINK_TEXTS, PREVIOUS_LINK_TEXTS,
+                    PAGINATION_RULE_MIN_CONFIDENCE, MAX_SYNTHESIZED_PAGES, PAGINATION_MAX_PAGE_GAP)
+from llm_client import chat_completion, is_valid_json
+from json_stream import extract_json
+from lxml_converter import parse_html
+from url_utils import normalize_url
 
 load_dotenv()
 import logging
@@ -16,39 +19,160 @@ class PaginationData(BaseModel):
     page_urls: List[str] = Field(default_factory=list, description="List of pagination URLs, including 'Next' button URL if present")
 
 
-def detect_pagination_elements(url: str, indications: str, markdown_content: str) -> Tuple[Union[PaginationData, Dict, str], Dict, float]:
-    try:
-        """
-        Uses AI models to analyze markdown content and extract pagination elements.
+_MARKDOWN_LINK_RE = re.compile(r"\[([^\]]*)\]\(\s*<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+# A bare /p/ is left out: shops use /p/<product-id> for product pages
+_PATH_PAGE_RE = re.compile(r"/(page|pages)/(\d+)(?=/|$)", re.IGNORECASE)
+
+
+def extract_links(url: str, html_content: str = None, markdown_content: str = None) -> List[Tuple[str, str, str]]:
+    """
+    Collect (absolute_url, text, rel) for every link on the page.
+
+    Links come from the DOM when HTML is available (including <link rel="next">),
+    otherwise from the markdown links, which carry no rel attribute.
+    """
+    links = []
+    root = parse_html(html_content) if html_content else None
+    if root is not None:
+        for element in root.iter("a", "link"):
+            href = element.get("href")
+            if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")):
+                continue
+            text = " ".join(element.text_content().split()) if element.tag == "a" else ""
+            label = element.get("aria-label") or element.get("title") or ""
+            rel = (element.get("rel") or "").lower()
+            if "next" in (element.get("class") or "").lower().split():
+                rel += " next"
+            links.append((urljoin(url, href.strip()), text or label, rel))
+    elif markdown_content:
+        for text, href in _MARKDOWN_LINK_RE.findall(markdown_content):
+            if not href.startswith(("#", "javascript:", "mailto:", "tel:")):
+                links.append((urljoin(url, href), " ".join(text.split()), ""))
+    return links
+
+
+def _page_template(link: str):
+    """Split a URL into (template, page_number) if it carries a page number, else None."""
+    parts = urlsplit(link)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for i, (name, value) in enumerate(query):
+        if name.lower() in PAGE_QUERY_PARAMS and value.isdigit():
+            templated = query[:i] + [(name, "{page}")] + query[i + 1:]
+            query_string = urlencode(templated, safe="{}")
+            return urlunsplit((parts.scheme, parts.netloc, parts.path, query_string, "")), int(value)
+
+    match = _PATH_PAGE_RE.search(parts.path)
+    if match:
+        path = parts.path[:match.start(2)] + "{page}" + parts.path[match.end(2):]
+        return urlunsplit((parts.scheme, parts.netloc, path, parts.query, "")), int(match.group(2))
+    return None
+
+
+def _is_pager_link(text, rel, number):
+    """Whether a numbered link reads like part of a pager: labelled with its page number, or next/previous."""
+    label = text.strip().lower()
+    rels = rel.split()
+    return (label == str(number) or "next" in rels or "prev" in rels
+            or label in NEXT_LINK_TEXTS or label in PREVIOUS_LINK_TEXTS)
+
 
-        Args:
-            selected_model (str): The name of the OpenAI model to use.
-            markdown_content (str): The markdown content to analyze.
+def detect_pagination_rules(url: str, html_content: str = None, markdown_content: str = None) -> Tuple[List[str], float]:
+    """
+    Detect pagination without the LLM.
+
+    Looks for numbered page links (?page=N style query parameters or /page/N paths),
+    then for rel="next" links and anchors labelled "Next". Of the numbered patterns,
+    the one the current URL follows wins, then the one with the most pager links.
+    The full range up to the highest page number is only synthesized from pager
+    links; otherwise just the pages linked are returned, and with low confidence.
+    Returns (page_urls, confidence) where confidence is between 0 (nothing found) and 1.
+    """
+    links = extract_links(url, html_content, markdown_content)
+    current = normalize_url(url)
+    seed = _page_template(url)
+
+    # Group numbered links by their URL template, counting the ones that look like a pager
+    numbers_by_template, pager_links = {}, {}
+    for link, text, rel in links:
+        templated = _page_template(link)
+        if templated and urlsplit(link).netloc == urlsplit(url).netloc:
+            template, number = templated
+            numbers_by_template.setdefault(template, set()).add(number)
+            if _is_pager_link(text, rel, number):
+                pager_links[template] = pager_links.get(template, 0) + 1
+
+    page_urls, confidence = [], 0.0
+    if numbers_by_template:
+        template, numbers = max(numbers_by_template.items(),
+                                key=lambda item: (bool(seed) and seed[0] == item[0], pager_links.get(item[0], 0), len(item[1])))
+        # The seed URL is page 1 unless it carries a number in the same pattern
+        current_number = seed[1] if seed and seed[0] == template else 1
+        seen = sorted(numbers | {current_number})
+        if pager_links.get(template, 0) >= 2:
+            # Pagers elide the middle ("1 2 3 ... 50"), so the range is filled in
+            first, last = seen[0], min(seen[-1], seen[0] + MAX_SYNTHESIZED_PAGES)
+            page_urls = [template.replace("{page}", str(n)) for n in range(first, last + 1) if n != current_number]
+            confidence = 0.9
+        elif all(b - a <= PAGINATION_MAX_PAGE_GAP for a, b in zip(seen, seen[1:])):
+            page_urls = [template.replace("{page}", str(n)) for n in seen if n != current_number]
+            confidence = 0.5
+
+    # A single "next" link is a weaker signal on its own, but still useful when no numbered pattern exists
+    if confidence < 0.9:
+        for link, text, rel in links:
+            label = text.strip().lower()
+            if "next" in rel.split() or label in NEXT_LINK_TEXTS:
+                if normalize_url(link) != current:
+                    page_urls = page_urls or [link]
+                    confidence = max(confidence, 0.9 if "next" in rel.split() else 0.7)
+                    break
+
+    # Never hand back the page we are on, and keep the order while removing duplicates
+    seen, unique_urls = {current}, []
+    for page_url in page_urls:
+        key = normalize_url(page_url)
+        if key not in seen:
+            seen.add(key)
+            unique_urls.append(page_url)
+    return unique_urls, confidence if unique_urls else 0.0
+
+
+def detect_pagination_elements(url: str, indications: str, markdown_content: str, html_content: str = None,
+                               backend=None, llm_cache=None) -> Union[Dict, None]:
+    """
+    Extract pagination URLs from a page.
+
+    Rule-based detection on the page's links runs first; the LLM is only asked when the
+    rules are not confident, or when the user gave indications about how the site paginates.
+
+    Args:
+        url (str): The URL of the page.
+        indications (str): Optional user hints about the pagination.
+        markdown_content (str): The markdown content to analyze.
+        html_content (str): The page's HTML, if available; gives the rules access to rel="next".
+
+    Returns:
+        Dict: {"page_urls": [...], "detected_by": "rules" or "llm"}
+    """
+    try:
+        if not indications:
+            page_urls, confidence = detect_pagination_rules(url, html_content, markdown_content)
+            if confidence >= PAGINATION_RULE_MIN_CONFIDENCE:
+                return {"page_urls": page_urls, "detected_by": "rules"}
 
-        Returns:
-            Tuple[PaginationData, Dict, float]: Parsed pagination data
-        """ 
         prompt_pagination = PROMPT_PAGINATION+"\n The url of the page to extract pagination from   "+url+"if the urls that you find are not complete combine them intelligently in a way that fit the pattern **ALWAYS GIVE A FULL URL**"
-        if indications != "":
-            prompt_pagination +=PROMPT_PAGINATION+"\n\n these are the users indications that, pay special attention to them: "+indications+"\n\n below are the markdowns of the website: \n\n"
+        if indications:
+            prompt_pagination +="\n\n these are the users indications that, pay special attention to them: "+indications+"\n\n below are the markdowns of the website: \n\n"
         else:
-            prompt_pagination +=PROMPT_PAGINATION+"\n There are no user indications in this case just apply the logic described. \n\n below are the markdowns of the website: \n\n"
+            prompt_pagination +="\n There are no user indications in this case just apply the logic described. \n\n below are the markdowns of the website: \n\n"
 
         
-        # Use Groq client
-        client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-        response = client.chat.completions.create(
-                model=GROQ_LLAMA_MODEL_FULLNAME,
-                messages=[
-                    {"role": "system", "content": prompt_pagination},
-                    {"role": "user", "content": markdown_content},
-                ],
-        )
-        response_content = response.choices[0].message.content.strip()
-        # Try to parse the JSON
-        try:
-            pagination_data = json.loads(response_content)
-        except json.JSONDecodeError:
+        # Only parseable answers are cached, so a bad one is asked again next time
+        response_content = chat_completion(prompt_pagination, markdown_content, validate=is_valid_json, backend=backend,
+                                           json_schema=PaginationData.model_json_schema(), llm_cache=llm_cache)
+        # Prose around the JSON is ignored
+        pagination_data = extract_json(response_content)
+        if pagination_data is None:
             pagination_data = {"page_urls": []}
             
         # Ensure the pagination_data is a dictionary
@@ -57,6 +181,7 @@ def detect_pagination_elements(url: str, indications: str, markdown_content: str
         elif not isinstance(pagination_data, dict):
             pagination_data = {"page_urls": []}
 
+        pagination_data["detected_by"] = "llm"
         return pagination_data 
 
 
@@ -0,0 +1,51 @@
+"""
+Per-domain politeness limits for concurrent scraping.
+
+A batch can contain many URLs from the same site; DomainThrottle makes sure we
+never have more than a few requests in flight against one domain and that
+consecutive requests to it are spaced by a minimum delay.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from assets import PER_DOMAIN_MAX_IN_FLIGHT, PER_DOMAIN_MIN_DELAY
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class DomainThrottle:
+    def __init__(self, max_in_flight=PER_DOMAIN_MAX_IN_FLIGHT, min_delay=PER_DOMAIN_MIN_DELAY):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        self.max_in_flight = max_in_flight
+        self.min_delay = min_delay
+        self._condition = threading.Condition()
+        self._in_flight = defaultdict(int)
+        self._next_start = defaultdict(float)
+
+    @contextmanager
+    def slot(self, url: str):
+        """Block until a request to the URL's domain is allowed, and hold the slot while it runs."""
+        domain = domain_of(url)
+        with self._condition:
+            while self._in_flight[domain] >= self.max_in_flight:
+                self._condition.wait()
+            self._in_flight[domain] += 1
+            # Reserve the next start time now so concurrent callers queue up behind each other
+            now = time.monotonic()
+            start = max(now, self._next_start[domain])
+            self._next_start[domain] = start + self.min_delay
+
+        try:
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            with self._condition:
+                self._in_flight[domain] -= 1
+                self._condition.notify_all()
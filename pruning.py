@@ -0,0 +1,132 @@
+"""
+Pruning of page content before it is sent to the LLM.
+
+Every token we send costs latency and money, so between HTML and extraction we
+drop everything that can't contain listing data: navigation, scripts, styles,
+SVGs, cookie banners, image links, tracking URLs and, if enabled, lines of
+boilerplate that repeat on every page of the same site.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from assets import (PRUNE_HTML_TAGS, COOKIE_BANNER_TOKENS, TRACKING_URL_PATTERNS,
+                    BOILERPLATE_PRUNING_ENABLED, BOILERPLATE_MIN_PAGES, BOILERPLATE_MAX_LINE_LENGTH)
+from chunking import count_tokens
+from url_utils import is_tracking_param
+
+# Anchored, so an id or a single class token must be a banner name as a whole
+_COOKIE_BANNER_RE = re.compile("^(?:" + "|".join(COOKIE_BANNER_TOKENS) + ")$", re.IGNORECASE)
+# Tracker hosts (and any of their subdomains), only at the start of the URL
+_TRACKING_URL_RE = re.compile(r"^(?:https?:)?//(?:[\w-]+\.)*(?:" + "|".join(TRACKING_URL_PATTERNS) + r")(?=[/?#:]|$)",
+                              re.IGNORECASE)
+
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_EMPTY_LINK_RE = re.compile(r"\[\s*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\(\s*<?([^)\s>]+)>?((?:\s+\"[^\"]*\")?)\s*\)")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Changes whenever the HTML pruning configuration does, so cached markdown produced
+# with a different configuration is not reused
+HTML_PRUNING_SIGNATURE = hashlib.sha1(json.dumps([PRUNE_HTML_TAGS, COOKIE_BANNER_TOKENS]).encode()).hexdigest()[:10]
+
+
+def prune_html_soup(soup, tags=PRUNE_HTML_TAGS):
+    """Remove non-content elements and cookie banners from a BeautifulSoup tree in place."""
+    for element in soup.find_all(tags):
+        element.decompose()
+
+    # BeautifulSoup matches a class regex against each class of an element separately
+    for element in soup.find_all(attrs={"id": _COOKIE_BANNER_RE}) + soup.find_all(class_=_COOKIE_BANNER_RE):
+        # decompose() on an ancestor already detached the element, skip those
+        if element.decomposed or element.name in ("html", "body"):
+            continue
+        element.decompose()
+    return soup
+
+
+def strip_tracking_params(url: str) -> str:
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def _clean_link(match):
+    text, url, title = match.group(1), match.group(2), match.group(3)
+    if _TRACKING_URL_RE.search(url):
+        # Keep what the link said, drop where it pointed
+        return text
+    return f"[{text}]({strip_tracking_params(url)}{title})"
+
+
+class BoilerplateTracker:
+    """
+    Remembers which markdown lines were seen on which pages of each site.
+
+    A line that has appeared on at least `min_pages` different pages of the same domain
+    is treated as site boilerplate (menus, sidebars, legal text) and pruned.
+    """
+
+    def __init__(self, min_pages=BOILERPLATE_MIN_PAGES, max_line_length=BOILERPLATE_MAX_LINE_LENGTH):
+        self.min_pages = min_pages
+        self.max_line_length = max_line_length
+        self._lock = threading.Lock()
+        self._pages_by_line = defaultdict(lambda: defaultdict(set))
+
+    @staticmethod
+    def _key(line):
+        return " ".join(line.split()).lower()
+
+    def observe(self, domain, page, lines):
+        with self._lock:
+            pages_by_line = self._pages_by_line[domain]
+            for line in lines:
+                key = self._key(line)
+                if key and len(key) <= self.max_line_length:
+                    pages = pages_by_line[key]
+                    if len(pages) < self.min_pages:
+                        pages.add(page)
+
+    def is_boilerplate(self, domain, line) -> bool:
+        key = self._key(line)
+        with self._lock:
+            pages = self._pages_by_line.get(domain, {}).get(key)
+            return pages is not None and len(pages) >= self.min_pages
+
+
+boilerplate_tracker = BoilerplateTracker()
+
+
+def prune_markdown(markdown: str, url: str = None, drop_images=True, strip_tracking=True,
+                   drop_boilerplate=BOILERPLATE_PRUNING_ENABLED, tracker=None):
+    """
+    Shrink markdown before extraction.
+
+    Returns (pruned_markdown, stats) where stats holds the token counts before and
+    after pruning. Boilerplate pruning (off unless BOILERPLATE_PRUNING_ENABLED) only
+    recognises a line once it has been seen on several pages of the same domain,
+    so it needs `url`.
+    """
+    tokens_in = count_tokens(markdown)
+    pruned = markdown
+
+    if drop_images:
+        pruned = _IMAGE_RE.sub("", pruned)
+        pruned = _EMPTY_LINK_RE.sub("", pruned)
+    if strip_tracking:
+        pruned = _LINK_RE.sub(_clean_link, pruned)
+
+    if drop_boilerplate and url:
+        tracker = tracker or boilerplate_tracker
+        domain = urlsplit(url).netloc.lower()
+        lines = pruned.splitlines()
+        tracker.observe(domain, url, lines)
+        pruned = "\n".join(line for line in lines if not line.strip() or not tracker.is_boilerplate(domain, line))
+
+    pruned = _BLANK_LINES_RE.sub("\n\n", pruned).strip() + "\n"
+    return pruned, {"tokens_in": tokens_in, "tokens_out": count_tokens(pruned)}
@@ -1,8 +1,10 @@
 import os
-import random
 import time
 import re
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from datetime import datetime
 from typing import List
 import pandas as pd
@@ -11,74 +13,82 @@ import html2text
 from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
-from groq import Groq
-
-
-from assets import HEADLESS_OPTIONS,USER_MESSAGE,GROQ_LLAMA_MODEL_FULLNAME
+from assets import HEADLESS_OPTIONS,USER_MESSAGE,MAX_CONCURRENT_URLS,SCROLL_SETTLE_TIMEOUT,SCROLL_MAX_STABLE_ATTEMPTS,FETCH_MODE,PAGE_CACHE_ENABLED,EXTRACTION_CHUNK_TOKENS,EXTRACTION_MAX_PARALLEL_CHUNKS,HTML_CONVERTER,BROWSER_BLOCK_PROFILE,LOW_MEMORY_MODE,LOW_MEMORY_MAX_DOM_ELEMENTS
+from driver_pool import get_driver_pool
+from politeness import DomainThrottle
+from page_settle import install_settle_instrumentation, wait_for_page_settle
+from consent import dismiss_consent
+from resource_blocking import apply_blocking_options, install_request_blocking, network_usage
+from http_fetcher import fetch_html_http, needs_browser, fetch_preferences
+from page_cache import get_page_cache
+from llm_client import chat_completion, is_valid_json
+from extraction_backends import get_extraction_backend
+from chunking import split_markdown, merge_extractions, record_key
+from extraction_schema import get_listing_schema
+from json_stream import ListingStream
+from pruning import prune_html_soup, prune_markdown, HTML_PRUNING_SIGNATURE
+from lxml_converter import html_to_markdown_lxml
+from output_sinks import OutputSink
+from instrumentation import PageTrace, finish_trace
+from job_store import get_job_store
+from change_detection import get_change_store
+from selector_templates import get_template_store
+from low_memory import SpooledHtml, spool_html, spool_main_content, spool_path, result_summary
 load_dotenv()
 
 
-def setup_selenium():
+def setup_selenium(block_profile=BROWSER_BLOCK_PROFILE):
     options = Options()
 
     # Add other options
     for option in HEADLESS_OPTIONS:
         options.add_argument(option)
+    apply_blocking_options(options, block_profile)
 
 
     # Initialize the WebDriver
     driver = webdriver.Chrome(options=options)
+    install_settle_instrumentation(driver)
+    install_request_blocking(driver, block_profile)
     return driver
 
-def click_accept_cookies(driver):
+def click_accept_cookies(driver, url=None):
     """
-    Tries to find and click on a cookie consent button. It looks for several common patterns.
+    Tries to find and click on a cookie consent button. Known consent platforms are
+    checked first, then buttons whose text means "accept"; see consent.dismiss_consent.
     """
     try:
-        # Wait for cookie popup to load
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//button | //a | //div"))
-        )
-        
-        # Common text variations for cookie buttons
-        accept_text_variations = [
-            "accept", "agree", "allow", "consent", "continue", "ok", "I agree", "got it"
-        ]
-        
-        # Iterate through different element types and common text variations
-        for tag in ["button", "a", "div"]:
-            for text in accept_text_variations:
-                try:
-                    # Create an XPath to find the button by text
-                    element = driver.find_element(By.XPATH, f"//{tag}[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{text}')]")
-                    if element:
-                        element.click()
-                        print(f"Clicked the '{text}' button.")
-                        return
-                except:
-                    continue
-
-        print("No 'Accept Cookies' button found.")
-    
+        strategy = dismiss_consent(driver, url)
+        if strategy:
+            print(f"Clicked the '{strategy['label'] or strategy['value']}' button.")
+        else:
+            print("No 'Accept Cookies' button found.")
+        return strategy
     except Exception as e:
         print(f"Error finding 'Accept Cookies' button: {e}")
 
-def scroll_to_load_full_page(driver, scroll_pause_time=2, max_attempts=10):
-    """Scroll to the end of the page until all dynamic content is loaded."""
+def scroll_to_load_full_page(driver, scroll_pause_time=SCROLL_SETTLE_TIMEOUT, max_attempts=SCROLL_MAX_STABLE_ATTEMPTS, timings=None,
+                             max_elements=None, return_html=True):
+    """
+    Scroll to the end of the page until all dynamic content is loaded.
+
+    After each scroll we wait for the page to settle (at most `scroll_pause_time` seconds)
+    and stop once `max_attempts` settled scrolls in a row did not change the scroll height,
+    or once the page has `max_elements` elements (infinite scroll never stops otherwise).
+    Returns the page source, or None with `return_html=False`.
+    """
     
     last_height = driver.execute_script("return document.body.scrollHeight")  # Get initial scroll height
     attempts = 0  # Counter for failed attempts (in case content stops loading)
+    waited = 0.0
     
     while attempts < max_attempts:
         # Scroll down by a fraction of the page height (you can adjust this if needed)
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         
-        # Pause to allow dynamic content to load
-        time.sleep(random.uniform(1.1, 1.8))  # Pause with random sleep to simulate human behavior
+        # Wait for lazy loaders to fetch and render the next batch of content
+        waited += wait_for_page_settle(driver, timeout=scroll_pause_time)
         
         # Calculate new scroll height after scrolling
         new_height = driver.execute_script("return document.body.scrollHeight")
@@ -91,39 +101,153 @@ def scroll_to_load_full_page(driver, scroll_pause_time=2, max_attempts=10):
         
         # Update last height for the next iteration
         last_height = new_height
+
+        if max_elements and driver.execute_script("return document.getElementsByTagName('*').length") >= max_elements:
+            print(f"Stopped scrolling at {max_elements} elements")
+            break
+    
+    if timings is not None:
+        timings["scroll"] = waited
     
     # After scrolling is complete and no new content is loading, return the HTML
+    if not return_html:
+        return None
     html = driver.page_source
     return html
 
-def fetch_html_selenium(url):
-    driver = setup_selenium()
-    try:
+def fetch_html_selenium(url, pool=None, timings=None, network=None, spool_to=None):
+    """
+    Fetch a fully scrolled page with a browser checked out of the driver pool.
+
+    With a `spool_to` path the page is fetched in low-memory mode: scrolling stops at
+    LOW_MEMORY_MAX_DOM_ELEMENTS, and only the page's main content is streamed from the
+    browser to that file, returned as a SpooledHtml instead of the page source.
+
+    If a `timings` dict is given, the seconds spent loading the page ("navigate"), waiting
+    for it to settle ("settle"), dismissing the cookie banner ("cookies") and scrolling
+    ("scroll") are recorded in it. If a `network` dict is given, it receives the page's
+    network usage (bytes transferred, requests blocked) from resource_blocking.network_usage.
+    """
+    timings = timings if timings is not None else {}
+    pool = pool or get_driver_pool()
+    with pool.driver() as driver:
+        # Drop log entries left over from the driver's previous page
+        network_usage(driver)
+        start = time.perf_counter()
         driver.get(url)
+        timings["navigate"] = time.perf_counter() - start
         
-        time.sleep(2)  
-        driver.maximize_window()
-        
+        timings["settle"] = wait_for_page_settle(driver)
+        print(f"{url} settled after {timings['settle']:.2f}s")
 
         # Try to find and click the 'Accept Cookies' button
-        click_accept_cookies(driver)
+        start = time.perf_counter()
+        click_accept_cookies(driver, url)
+        timings["cookies"] = time.perf_counter() - start
 
-        return scroll_to_load_full_page(driver)
-    finally:
-        driver.quit()
+        if spool_to is None:
+            html = scroll_to_load_full_page(driver, timings=timings)
+        else:
+            scroll_to_load_full_page(driver, timings=timings, max_elements=LOW_MEMORY_MAX_DOM_ELEMENTS, return_html=False)
+            html = spool_main_content(driver, spool_to)
+        usage = network_usage(driver)
+        if usage["blocked"]:
+            print(f"{url} transferred {usage['bytes'] / 1e6:.2f} MB, blocked {usage['blocked']} requests")
+        if network is not None:
+            network.update(usage)
+        return html
+
+def fetch_html(url, pool=None, timings=None, mode=FETCH_MODE, network=None, spool_to=None):
+    """
+    Fetch a page with plain HTTP when possible and with the browser when needed.
+
+    Returns a tuple (html, fetch_mode) where fetch_mode is "http" or "browser". With
+    `spool_to`, browser fetches return a SpooledHtml (see fetch_html_selenium).
+    """
+    html, fetch_mode, _ = _fetch_html_with_headers(url, pool, timings, mode, network, spool_to)
+    return html, fetch_mode
+
+def _fetch_html_with_headers(url, pool, timings, mode, network=None, spool_to=None):
+    """Like fetch_html, but also returns the HTTP response headers (empty for browser fetches)."""
+    if mode == "browser" or (mode == "auto" and fetch_preferences.prefers_browser(url)):
+        return fetch_html_selenium(url, pool, timings, network, spool_to), "browser", {}
+
+    try:
+        response = fetch_html_http(url)
+        if mode == "http" or not needs_browser(response):
+            fetch_preferences.record(url, "http")
+            return response.text, "http", response.headers
+        print(f"{url} looks JavaScript-rendered, falling back to the browser")
+    except Exception as e:
+        if mode == "http":
+            raise
+        print(f"HTTP fetch of {url} failed, falling back to the browser: {e}")
+
+    fetch_preferences.record(url, "browser")
+    return fetch_html_selenium(url, pool, timings, network, spool_to), "browser", {}
+
+def fetch_html_cached(url, cache, pool=None, timings=None, mode=FETCH_MODE, network=None, spool_to=None):
+    """
+    Fetch a page through the page cache.
+
+    Returns a tuple (html, fetch_mode, cache_status) where cache_status is "hit",
+    "revalidated" (stale entry confirmed unchanged by the server) or "miss". When the
+    server answers a revalidation with the new page, that response is used and cached
+    rather than fetching the page a second time. Pages spooled
+    to disk (see fetch_html_selenium) are not cached, as that would read them back into memory.
+    """
+    entry = cache.get(url)
+    if entry is not None and entry.is_fresh:
+        cache.count("hits")
+        return entry.html, entry.fetch_mode, "hit"
+
+    if entry is not None and entry.can_revalidate:
+        try:
+            response = fetch_html_http(url, headers=entry.revalidation_headers())
+            if response.status_code == 304:
+                cache.refresh(url)
+                cache.count("revalidated")
+                return entry.html, entry.fetch_mode, "revalidated"
+            if response.status_code == 200 and mode != "browser" and (mode == "http" or not needs_browser(response)):
+                cache.count("misses")
+                fetch_preferences.record(url, "http")
+                cache.put(url, response.text, "http", response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                return response.text, "http", "miss"
+        except Exception as e:
+            print(f"Could not revalidate cached copy of {url}: {e}")
+
+    cache.count("misses")
+    html, fetch_mode, headers = _fetch_html_with_headers(url, pool, timings, mode, network, spool_to)
+    if not isinstance(html, SpooledHtml):
+        cache.put(url, html, fetch_mode, headers.get("ETag"), headers.get("Last-Modified"))
+    return html, fetch_mode, "miss"
+
+def html_to_markdown_cached(html_content, cache=None):
+    """Convert HTML to markdown, reusing an earlier conversion of identical HTML if cached (spooled HTML never is)."""
+    if cache is None or isinstance(html_content, SpooledHtml):
+        return html_to_markdown_with_readability(html_content)
+    variant = f"{HTML_CONVERTER}-{HTML_PRUNING_SIGNATURE}"
+    markdown = cache.get_markdown(html_content, variant)
+    if markdown is None:
+        markdown = html_to_markdown_with_readability(html_content)
+        cache.put_markdown(html_content, markdown, variant)
+    return markdown
 
 def clean_html(html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
     
-    # Remove headers and footers based on common HTML tags or classes
-    for element in soup.find_all(['header', 'footer']):
-        element.decompose()  # Remove these tags and their content
+    # Remove headers, footers, navigation, scripts, styles, SVGs and cookie banners
+    prune_html_soup(soup)
 
     return str(soup)
 
 
-def html_to_markdown_with_readability(html_content):
-
+def html_to_markdown_with_readability(html_content, converter=HTML_CONVERTER):
+    if converter == "lxml":
+        # One lxml parse for both cleaning and conversion (spooled pages are parsed from their file)
+        return html_to_markdown_lxml(html_content)
+    if isinstance(html_content, SpooledHtml):
+        html_content = html_content.read()
     
     cleaned_html = clean_html(html_content)  
     
@@ -173,14 +297,8 @@ def generate_system_message(fields) -> str:
     Dynamically generate a system message based on the fields in the provided listing model.
     """
 
-    # Extract field descriptions from the schema
-    field_descriptions = []
-    for field_name in fields:
-        # Get the field type from the schema info
-        field_descriptions.append(f'"{field_name}"')
-
-    # Create the JSON schema structure for the listings
-    schema_structure = ",\n".join(field_descriptions)
+    # Field names with their types (and descriptions, if given) from the compiled schema
+    schema_structure = get_listing_schema(fields).prompt_structure()
 
     # Generate the system message dynamically
     system_message = f"""
@@ -203,29 +321,87 @@ def generate_system_message(fields) -> str:
 
 
 
-def format_data(data, fields):
+def format_data(data, fields, max_chunk_tokens=EXTRACTION_CHUNK_TOKENS, on_record=None, backend=None, llm_cache=None):
+    """
+    Extract the listings of a page as {"listings": [...]}, validated against the fields' schema.
+    The prompts go to `backend` (see extraction_backends), by default EXTRACTION_BACKEND, and
+    their answers are cached in `llm_cache`, by default the process-wide LLM cache.
+
+    If `on_record` is given it is called with every record as soon as it has been parsed
+    from the streaming answer, each distinct record once even when chunks overlap.
+    """
     # Dynamically generate the system message based on the schema
     sys_message = generate_system_message(fields)
-    # print(SYSTEM_MESSAGE)
-    # Point to the local server
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"),)
-
-    completion = client.chat.completions.create(
-    messages=[
-            {"role": "system","content": sys_message},
-            {"role": "user","content": USER_MESSAGE + data}
-    ],
-    model=GROQ_LLAMA_MODEL_FULLNAME,
-    )
-
-    # Extract the content from the response
-    response_content = completion.choices[0].message.content
-        
-    # Convert the content from JSON string to a Python dictionary
-    parsed_response = json.loads(response_content)
-        
+    schema = get_listing_schema(fields)
+
+    if on_record is not None:
+        seen, seen_lock, emit = set(), threading.Lock(), on_record
+
+        def on_record(record):
+            key = record_key(record)
+            with seen_lock:
+                if key in seen:
+                    return
+                seen.add(key)
+            emit(record)
+
+    chunks = split_markdown(data, max_chunk_tokens)
+    if len(chunks) == 1:
+        return format_chunk(chunks[0], sys_message, schema, on_record, backend, llm_cache)
+
+    # Large pages: extract every chunk concurrently, then merge and deduplicate the listings
+    print(f"Splitting page into {len(chunks)} chunks for extraction")
+    results = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=min(EXTRACTION_MAX_PARALLEL_CHUNKS, len(chunks))) as executor:
+        futures = {executor.submit(format_chunk, chunk, sys_message, schema, on_record, backend, llm_cache): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Extraction of chunk {futures[future] + 1}/{len(chunks)} failed: {e}")
+
+    if all(result is None for result in results):
+        raise ValueError("Extraction failed for every chunk of the page.")
+    return merge_extractions(results)
+
+
+def format_chunk(data, sys_message, schema, on_record=None, backend=None, llm_cache=None):
+    """
+    Extract structured data from one piece of markdown with a single completion.
+
+    The answer is parsed while it streams in, every record is validated against `schema`
+    and passed to `on_record` once complete. If the completion breaks off or ends in
+    malformed JSON, the records parsed until then are kept instead of failing the chunk.
+    """
+    stream = ListingStream(schema.validate)
+
+    def on_text(delta):
+        for record in stream.feed(delta):
+            if on_record is not None:
+                on_record(record)
+
+    try:
+        # Identical page content, fields and model are answered from the LLM cache
+        response_content = chat_completion(sys_message, USER_MESSAGE + data, validate=is_valid_json, backend=backend,
+                                           json_schema=schema.json_schema(), on_text=on_text, llm_cache=llm_cache)
+    except Exception as e:
+        if not stream.records:
+            raise
+        print(f"Completion failed after {len(stream.records)} records, keeping them: {e}")
+        return {"listings": stream.records}
+
+    # Cached and non-streamed answers arrive in one piece
+    if response_content.startswith(stream.text):
+        on_text(response_content[len(stream.text):])
+    streamed = len(stream.records)
+    parsed_response = stream.finish()
+    if parsed_response is None:
+        raise ValueError("The model's answer contains no JSON.")
+    if on_record is not None:
+        for record in parsed_response["listings"][streamed:]:
+            on_record(record)
     return parsed_response
-    
+
 
 
 
@@ -280,36 +456,310 @@ def generate_unique_folder_name(url):
     return f"{url_name}_{timestamp}"
 
 
-def scrape_multiple_urls(urls, fields, selected_model):
-    output_folder = os.path.join('output', generate_unique_folder_name(urls[0]))
+def new_report_entry(url):
+    return {"url": url, "fetch_mode": None, "cache": None, "tokens_in": None, "tokens_out": None,
+            "bytes_transferred": None, "requests_blocked": None, "change": None}
+
+
+def fetch_page(url, entry, pool, throttle, fetch_mode=FETCH_MODE, cache=None, trace=None, spool_to=None):
+    """
+    Fetch one page of a batch, recording its fetch mode and cache status in its report entry.
+
+    With a `spool_to` path (low-memory mode) the page is returned as a SpooledHtml in that file.
+    """
+    trace = trace or PageTrace(url)
+    trace.begin()
+    timings, network = {}, {}
+    with trace.span("fetch") as span:
+        if cache is None:
+            with throttle.slot(url):
+                raw_html, entry["fetch_mode"] = fetch_html(url, pool, timings, mode=fetch_mode, network=network,
+                                                           spool_to=spool_to)
+        else:
+            # Fresh cache hits never reach the site, so they skip the politeness limits
+            slot = nullcontext() if cache.has_fresh(url) else throttle.slot(url)
+            with slot:
+                raw_html, entry["fetch_mode"], entry["cache"] = fetch_html_cached(url, cache, pool, timings, mode=fetch_mode,
+                                                                                  network=network, spool_to=spool_to)
+        if spool_to is not None and not isinstance(raw_html, SpooledHtml):
+            raw_html = spool_html(raw_html, spool_to)
+        span.update(mode=entry["fetch_mode"], cache=entry["cache"], bytes=len(raw_html))
+    for stage, duration in timings.items():
+        trace.add(stage, duration)
+    if network:
+        entry["bytes_transferred"], entry["requests_blocked"] = network["bytes"], network["blocked"]
+        trace.attributes.update(bytes_transferred=network["bytes"], requests_blocked=network["blocked"])
+    trace.attributes.update(fetch_mode=entry["fetch_mode"], cache=entry["cache"], bytes=len(raw_html))
+    return raw_html
+
+
+def process_page(url, raw_html, fields, output_folder, file_number, entry, cache=None, sink=None, trace=None, backend=None,
+                 llm_cache=None, changes=None, templates=None):
+    """
+    Convert, prune, extract and save one fetched page.
+
+    Returns (formatted_data, markdown). The markdown is the unpruned conversion, which
+    pagination detection needs since "Next" links repeat on every page of a site.
+    """
+    trace = trace or PageTrace(url)
+    with trace.span("convert", bytes=len(raw_html)):
+        markdown = html_to_markdown_cached(raw_html, cache)
+    with trace.span("prune") as span:
+        pruned_markdown, pruning_stats = prune_markdown(markdown, url)
+        span.update(pruning_stats)
+    entry.update(pruning_stats)
+    trace.attributes.update(pruning_stats)
+
+    timings = {}
+    formatted_data = scrape_url(url, fields, output_folder, file_number, pruned_markdown, sink, timings, entry, raw_html,
+                                backend, llm_cache, changes, templates)
+    if "selectors" in timings:
+        trace.add("selectors", timings["selectors"])
+    if "llm" in timings:
+        trace.add("llm", timings["llm"], "ok" if formatted_data is not None else "error", tokens=pruning_stats["tokens_out"],
+                  first_record=timings.get("first_record"))
+    if "save" in timings:
+        trace.add("save", timings["save"])
+    return formatted_data, markdown
+
+
+def scrape_urls_concurrently(urls, fields, output_folder, pool=None, max_workers=MAX_CONCURRENT_URLS, throttle=None, fetch_mode=FETCH_MODE, cache=None, sink=None, job=None,
+                             low_memory=LOW_MEMORY_MODE, backend=None, llm_cache=None, changes=None, templates=None):
+    """
+    Scrape several URLs through an overlapping fetch -> markdown -> LLM -> save pipeline.
+
+    Fetches run on one set of workers (subject to per-domain politeness limits, and
+    browser fetches additionally to the size of the driver pool) while conversion and format_data calls
+    for already fetched pages run on another, so the stages overlap across URLs.
+    Results are returned in the same order as `urls`; failed URLs yield None.
+
+    Returns (all_data, first_markdown, report) where report holds one dict per URL
+    describing how it was processed (e.g. its fetch mode). When a page `cache` is
+    given, pages and their markdown are served from it when possible. Each page's records are
+    written to `sink` once it succeeded, or to a new OutputSink in `output_folder` that is closed at the end.
+    With a `job` from job_store, every URL's progress is checkpointed as it happens.
+
+    In `low_memory` mode pages are spooled to `output_folder/pages` (see low_memory) and
+    all_data holds a result_summary per URL instead of its records, which are only in the sink.
+    Extraction prompts go to `backend`, by default EXTRACTION_BACKEND. `llm_cache`, `changes` and
+    `templates` replace the process-wide LLM cache, change store and template store for this run,
+    e.g. with the settings of one UI session (see their with_options).
+    """
+    pool = pool or get_driver_pool()
+    throttle = throttle or DomainThrottle()
+    own_sink = sink is None
+    sink = sink or OutputSink(output_folder, fields)
+    # Raw data files keep the URL's position in its job, so resumed runs don't overwrite others
+    positions = job.positions() if job else {}
+    file_numbers = [positions.get(url, i + 1) for i, url in enumerate(urls)]
+    if job:
+        job.begin(urls)
+    all_data = [None] * len(urls)
+    markdowns = [None] * len(urls)
+    report = [new_report_entry(url) for url in urls]
+    traces = [PageTrace(url) for url in urls]
+    spans_path = os.path.join(output_folder, SPANS_FILE_NAME)
+    # Summaries point at the JSONL output when there is one, as it can be read back record by record
+    output_path = sink.paths.get("jsonl") or next(iter(sink.paths.values()), None)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as fetchers, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as processors:
+        pending = {fetchers.submit(fetch_page, url, report[i], pool, throttle, fetch_mode, cache, traces[i],
+                                   spool_path(output_folder, file_numbers[i]) if low_memory else None): ("fetch", i)
+                   for i, url in enumerate(urls)}
+        # One loop over both stages, so a page is checkpointed as soon as it is processed, not after the slowest fetch
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Finished futures are dropped so their pages can be freed before the batch ends
+                stage, i = pending.pop(future)
+                if stage == "fetch":
+                    try:
+                        raw_html = future.result()
+                    except Exception as e:
+                        print(f"An error occurred while fetching {urls[i]}: {e}")
+                        finish_trace(traces[i], "fetch_failed", spans_path)
+                        checkpoint(job, urls[i], "failed", f"fetch: {e}")
+                        continue
+                    checkpoint(job, urls[i], "fetched")
+                    pending[processors.submit(process_page, urls[i], raw_html, fields, output_folder, file_numbers[i], report[i],
+                                              cache, sink, traces[i], backend, llm_cache, changes, templates)] = ("process", i)
+                    continue
+
+                error = "no data extracted"
+                try:
+                    all_data[i], markdown = future.result()
+                    if i == 0 or not low_memory:
+                        markdowns[i] = markdown
+                    if low_memory:
+                        all_data[i] = result_summary(urls[i], all_data[i], output_path, spool_path(output_folder, file_numbers[i]))
+                except Exception as e:
+                    print(f"An error occurred while processing {urls[i]}: {e}")
+                    error = f"process: {e}"
+                finish_trace(traces[i], "ok" if all_data[i] is not None else "extract_failed", spans_path)
+                checkpoint(job, urls[i], "extracted" if all_data[i] is not None else "failed",
+                           None if all_data[i] is not None else error)
+
+    if own_sink:
+        sink.close()
+    save_run_report(report, output_folder)
+    return all_data, markdowns[0] if markdowns else None, report
+
+
+SPANS_FILE_NAME = 'spans.jsonl'
+
+
+def checkpoint(job, url, state, error=None):
+    """Record a URL's progress in its job, if the run belongs to one."""
+    if job is not None:
+        job.mark(url, state, error)
+
+
+def save_run_report(report, output_folder: str, file_name: str = 'run_report.json'):
+    """
+    Save the per-URL run report next to the scraped data.
+
+    An existing report in the folder (from an earlier run of a resumed job) is kept,
+    with the entries of URLs run again replaced by their new ones.
+    """
     os.makedirs(output_folder, exist_ok=True)
+    report_path = os.path.join(output_folder, file_name)
+    if os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            entries = {entry["url"]: entry for entry in json.load(f)}
+        entries.update((entry["url"], entry) for entry in report)
+        report = list(entries.values())
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    return report_path
+
+
+def scrape_multiple_urls(urls, fields, selected_model=None, pool=None, max_workers=MAX_CONCURRENT_URLS, fetch_mode=FETCH_MODE, use_cache=PAGE_CACHE_ENABLED,
+                         job_id=None, retry_failed=False, low_memory=LOW_MEMORY_MODE, backend=None, llm_cache=None,
+                         changes=None, templates=None):
+    """
+    Scrape URLs as a checkpointed job (in `low_memory` mode, see scrape_urls_concurrently).
+
+    Without a `job_id` a new job is created for `urls`; with one, that job is resumed in its
+    own output folder and with its own fields (`urls` and `fields` are ignored), skipping
+    URLs already extracted and, if `retry_failed` is set, running failed ones again.
+    Returns (output_folder, all_data, markdown, report) for the URLs run this time.
+    """
+    cache = get_page_cache() if use_cache else None
+    store = get_job_store()
+    if job_id is None:
+        output_folder = os.path.join('output', generate_unique_folder_name(urls[0]))
+        job = store.create_job(urls, fields, output_folder)
+    else:
+        job = store.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job: {job_id}")
+        if retry_failed:
+            job.retry_failed()
+    os.makedirs(job.output_folder, exist_ok=True)
+
+    urls = job.urls_to_run()
+    if not urls:
+        print(f"Job {job.id} has nothing left to run")
+        return job.output_folder, [], None, []
     
-    all_data = []
-    markdown = None  # We'll store the markdown for the first (or only) URL
-    
-    for i, url in enumerate(urls, start=1):
-        raw_html = fetch_html_selenium(url)
-        current_markdown = html_to_markdown_with_readability(raw_html)
-        if i == 1:
-            markdown = current_markdown  # Store markdown for the first URL
-        
-        formatted_data = scrape_url(url, fields, selected_model, output_folder, i, current_markdown)
-        all_data.append(formatted_data)
+    # markdown is kept for the first (or only) URL
+    all_data, markdown, report = scrape_urls_concurrently(urls, job.fields, job.output_folder, pool, max_workers, fetch_mode=fetch_mode, cache=cache, job=job,
+                                                       low_memory=low_memory, backend=backend, llm_cache=llm_cache,
+                                                       changes=changes, templates=templates)
     
-    return output_folder, all_data, markdown
+    return job.output_folder, all_data, markdown, report
 
-def scrape_url(url: str, fields: List[str], output_folder: str, file_number: int, markdown: str):
-    """Scrape a single URL and save the results."""
+def scrape_url(url: str, fields: List[str], output_folder: str, file_number: int, markdown: str, sink=None, timings=None, entry=None,
+               html=None, backend=None, llm_cache=None, changes=None, templates=None):
+    """
+    Scrape a single URL and save the results.
+
+    With an output `sink` the page's records are appended to the run's output files once the
+    whole completion has been parsed and validated, so a page that fails partway and is run
+    again never leaves rows behind; without one they are saved as a JSON file and an Excel
+    workbook for this page alone. If a `timings` dict is given, the seconds spent in the LLM
+    ("llm"), until its first record was parsed ("first_record") and saving ("save") are recorded in it.
+
+    Pages whose markdown has not changed since they were last extracted for the same
+    fields reuse those records: the LLM call and the per-page files are skipped and only
+    the records are written to the `sink`. Whether the page was "new", "changed" or
+    "unchanged" is recorded in the report `entry`, if given.
+
+    With selector templates enabled and the page's `html` given, a page of a domain with a
+    learned template is extracted with its selectors ("selectors" timing) instead of the LLM,
+    and every LLM extraction teaches the domain a new template. The report `entry` records
+    which of the two extracted the page under "extracted_by".
+
+    Extraction prompts go to `backend`, by default EXTRACTION_BACKEND; stored records are
+    only reused for the model that extracted them. `llm_cache`, `changes` and `templates`
+    default to the process-wide LLM cache, change store and template store.
+    """
+    timings = timings if timings is not None else {}
     print("fields = ", fields)
     try:
+        backend = backend or get_extraction_backend()
+        changes = changes or get_change_store()
+        change, previous_data = changes.lookup(url, fields, markdown, backend.model)
+        if entry is not None:
+            entry["change"] = change
+        if change == "unchanged":
+            print(f"{url} is unchanged since its last scrape, reusing its records")
+            if sink is not None:
+                sink.write(previous_data, url)
+            return previous_data
+
         # Save raw data
+        start = time.perf_counter()
         save_raw_data(markdown, output_folder, f'rawData_{file_number}.md')
+        timings["save"] = time.perf_counter() - start
+
+        # Domains with a learned selector template skip the LLM
+        templates = templates or get_template_store()
+        if templates.enabled and html is not None:
+            start = time.perf_counter()
+            formatted_data = templates.extract(url, fields, html)
+            timings["selectors"] = time.perf_counter() - start
+            if formatted_data is not None:
+                if entry is not None:
+                    entry["extracted_by"] = "selectors"
+                start = time.perf_counter()
+                if sink is not None:
+                    sink.write(formatted_data, url)
+                else:
+                    save_formatted_data(formatted_data, output_folder, f'sorted_data_{file_number}.json', f'sorted_data_{file_number}.xlsx')
+                changes.record(url, fields, markdown, formatted_data, backend.model)
+                timings["save"] += time.perf_counter() - start
+                return formatted_data
+
+        # Format data; records are parsed as they stream in, but only written once the page succeeded
+        start = time.perf_counter()
+
+        def note_record(record):
+            timings.setdefault("first_record", time.perf_counter() - start)
+
+        try:
+            formatted_data = format_data(markdown, fields, on_record=note_record, backend=backend, llm_cache=llm_cache)
+        finally:
+            timings["llm"] = time.perf_counter() - start
+        if formatted_data is None:
+            return None
 
-        # Format data
-        formatted_data = format_data(markdown, fields)
-        
         # Save formatted data
-        save_formatted_data(formatted_data, output_folder, f'sorted_data_{file_number}.json', f'sorted_data_{file_number}.xlsx')
+        start = time.perf_counter()
+        if sink is not None:
+            sink.write(formatted_data, url)
+        else:
+            save_formatted_data(formatted_data, output_folder, f'sorted_data_{file_number}.json', f'sorted_data_{file_number}.xlsx')
+        changes.record(url, fields, markdown, formatted_data, backend.model)
+        timings["save"] += time.perf_counter() - start
+        if entry is not None:
+            entry["extracted_by"] = "llm"
+
+        if templates.enabled and html is not None:
+            start = time.perf_counter()
+            templates.learn(url, fields, html, formatted_data)
+            timings["selectors"] = timings.get("selectors", 0.0) + time.perf_counter() - start
 
         return  formatted_data
 
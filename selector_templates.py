@@ -0,0 +1,381 @@
+"""
+Selector templates learned from LLM extractions.
+
+Sites render every record of a listing page with the same markup, and keep it
+from one day to the next. After the LLM has extracted a page, the values it
+returned are looked up in the page's DOM: the elements holding the values of one
+record share a container, and the containers of all records share an XPath. For
+each field the relative path that reproduces the LLM's values best is kept. The
+template is stored per domain only if it reproduces the LLM's output on the page
+it was learned from; later pages of the domain are then extracted with lxml in
+milliseconds, and go to the LLM again (which learns a new template) when the
+template stops finding the fields it used to.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urljoin, urlsplit
+
+from assets import (SELECTOR_TEMPLATES_ENABLED, SELECTOR_TEMPLATE_PATH, SELECTOR_MIN_RECORDS, SELECTOR_MIN_AGREEMENT,
+                    SELECTOR_MIN_FILL_RATIO)
+from extraction_schema import get_listing_schema
+from lxml_converter import parse_html
+from output_sinks import records_from_formatted_data
+
+LINK_ATTRIBUTES = ("href", "src")
+LINK_SCHEMES = ("mailto:", "tel:")
+MAX_VALUE_LENGTH = 300
+# How far above the elements of a record its container may be
+CONTAINER_LEVELS = 3
+
+_INDEX_RE = re.compile(r"\[\d+\]")
+_TRAILING_INDEX_RE = re.compile(r"\[\d+\]$")
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def _normalize(value):
+    return " ".join(str(value).split()).lower()
+
+
+def _text(element):
+    return " ".join(element.text_content().split())
+
+
+def _number(text):
+    match = _NUMBER_RE.search(text)
+    if match is None or len(text) > 40:
+        return None
+    try:
+        return float(match.group().replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _attribute_forms(value, base_url):
+    """The ways a link or image target may appear in the LLM's output, by name of the form."""
+    forms = {"raw": value, "absolute": urljoin(base_url, value)}
+    if value.lower().startswith(LINK_SCHEMES):
+        forms["bare"] = value.split(":", 1)[1].split("?", 1)[0]
+    return forms
+
+
+def _attribute_value(value, form, base_url):
+    if form == "absolute":
+        return urljoin(base_url, value)
+    if form == "bare":
+        return value.split(":", 1)[-1].split("?", 1)[0]
+    return value
+
+
+class _ValueIndex:
+    """Where each text and link target of a page is, as (element path, attribute, form) locations."""
+
+    def __init__(self, root, base_url):
+        self.tree = root.getroottree()
+        self.by_text = defaultdict(list)
+        self.by_number = defaultdict(list)
+        for element in root.iter():
+            if not isinstance(element.tag, str) or element.tag in ("html", "head", "body", "script", "style"):
+                continue
+            path = self.tree.getpath(element)
+            text = _normalize(element.text_content())
+            if text and len(text) <= MAX_VALUE_LENGTH:
+                self._add(self.by_text[text], path)
+                number = _number(text)
+                if number is not None:
+                    self._add(self.by_number[number], path)
+            for attribute in LINK_ATTRIBUTES:
+                value = element.get(attribute)
+                if value:
+                    for form, form_value in _attribute_forms(value.strip(), base_url).items():
+                        self.by_text[_normalize(form_value)].append((path, attribute, form))
+
+    @staticmethod
+    def _add(locations, path):
+        # Elements come in document order: a wrapper holding only this value gives way to its child
+        if locations and locations[-1][1] is None and path.startswith(locations[-1][0] + "/"):
+            locations[-1] = (path, None, None)
+        else:
+            locations.append((path, None, None))
+
+    def locate(self, value):
+        if isinstance(value, str):
+            return self.by_text.get(_normalize(value), []) if value.strip() else []
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return self.by_number.get(float(value), [])
+        return []
+
+
+def _steps(path):
+    return path.strip("/").split("/")
+
+
+def _common_path(paths):
+    steps = [_steps(path) for path in paths]
+    common = []
+    for parts in zip(*steps):
+        if any(part != parts[0] for part in parts):
+            break
+        common.append(parts[0])
+    return "/" + "/".join(common)
+
+
+def _class_tokens(element):
+    return (element.get("class") or "").split()
+
+
+def _class_test(token):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {token} ')"
+
+
+def _container_candidates(tree, path):
+    """XPath expressions that could select the container at `path` along with its siblings."""
+    candidates = set()
+    steps = _steps(path)
+    for level in range(min(CONTAINER_LEVELS + 1, len(steps) - 1)):
+        ancestor_path = "/" + "/".join(steps[:len(steps) - level])
+        element = tree.xpath(ancestor_path)[0]
+        candidates.add(_TRAILING_INDEX_RE.sub("", ancestor_path))
+        for token in _class_tokens(element):
+            candidates.add(f"//{element.tag}[{_class_test(token)}]")
+    return candidates
+
+
+def _field_candidates(tree, container_path, location):
+    """Relative XPath expressions that could select a field's element inside its container."""
+    path, attribute, form = location
+    relative = path[len(container_path):]
+    candidates = {"." + relative, "." + _INDEX_RE.sub("", relative)} if relative else {"."}
+    if relative:
+        element = tree.xpath(path)[0]
+        for token in _class_tokens(element):
+            candidates.add(f".//{element.tag}[{_class_test(token)}]")
+    return {(candidate, attribute, form) for candidate in candidates}
+
+
+def _extract(container, selector, base_url):
+    elements = container.xpath(selector["path"])
+    if not elements:
+        return None
+    element = elements[0]
+    if selector["attribute"] is None:
+        return _text(element) or None
+    value = element.get(selector["attribute"])
+    return _attribute_value(value.strip(), selector["form"], base_url) if value else None
+
+
+def learn_template(html, url, fields, records, min_records=SELECTOR_MIN_RECORDS, min_agreement=SELECTOR_MIN_AGREEMENT):
+    """
+    Induce a selector template from a page and the records the LLM extracted from it.
+
+    Returns (template, None), or (None, reason) when the records cannot be reproduced
+    from the page's markup.
+    """
+    schema = get_listing_schema(fields)
+    root = parse_html(html)
+    if root is None:
+        return None, "the page could not be parsed"
+    records = [record for record in records if isinstance(record, dict)]
+    if len(records) < min_records:
+        return None, f"only {len(records)} records to learn from"
+    index = _ValueIndex(root, url)
+    tree = index.tree
+
+    # Place every record: its values' elements, anchored on the rarest one, and their common ancestor
+    located = []
+    for record in records:
+        matches = {name: index.locate(record.get(name)) for name in schema.names}
+        matches = {name: locations for name, locations in matches.items() if locations}
+        if len(matches) < min(2, len(schema.names)):
+            continue
+        anchor_name = min(matches, key=lambda name: len(matches[name]))
+        anchor = matches[anchor_name][0]
+        chosen = {anchor_name: anchor}
+        for name, locations in matches.items():
+            if name != anchor_name:
+                # Closest to the anchor, then the most specific element
+                chosen[name] = max(locations, key=lambda location: (len(_steps(_common_path([anchor[0], location[0]]))),
+                                                                     len(_steps(location[0]))))
+        located.append((record, _common_path([location[0] for location in chosen.values()]), chosen))
+    if len(located) < min_records:
+        return None, f"only {len(located)} of {len(records)} records were found in the page"
+
+    # The container expression that selects a distinct element for the most records, with the fewest extras
+    best = None
+    for expression in set().union(*(_container_candidates(tree, path) for _, path, _ in located)):
+        elements = {tree.getpath(element): element for element in root.xpath(expression)}
+        assigned = {}
+        for i, (_, path, _) in enumerate(located):
+            steps = _steps(path)
+            for level in range(len(steps), 0, -1):
+                ancestor_path = "/" + "/".join(steps[:level])
+                if ancestor_path in elements:
+                    assigned.setdefault(ancestor_path, i)
+                    break
+        score = (len(assigned), -len(elements))
+        if best is None or score > best[0]:
+            best = (score, expression, elements, assigned)
+    _, container_expression, containers, assigned = best
+    if len(assigned) < max(min_records, min_agreement * len(located)):
+        return None, f"no container selector covers the records ({len(assigned)} of {len(located)})"
+
+    # For each field, the relative selector that reproduces the LLM's values on the most records
+    placed = [(containers[path], path, located[i]) for path, i in assigned.items()]
+    template_fields = {}
+    for name in schema.names:
+        expected = [(container, record[name]) for container, _, (record, _, _) in placed
+                    if record.get(name) not in (None, "", [])]
+        if not expected:
+            continue
+        candidates = set()
+        for _, path, (_, _, chosen) in placed:
+            location = chosen.get(name)
+            if location is not None and (location[0] == path or location[0].startswith(path + "/")):
+                candidates |= _field_candidates(tree, path, location)
+        best_field = None
+        # On a tie the most specific selector wins: class-based, then positional, then the container itself
+        for candidate, attribute, form in sorted(candidates, key=lambda c: (c[0] == ".", "@class" not in c[0], c[0])):
+            selector = {"path": candidate, "attribute": attribute, "form": form}
+            agreed = 0
+            for container, value in expected:
+                extracted = (schema.validate({name: _extract(container, selector, url)}) or {}).get(name)
+                agreed += extracted is not None and _normalize(extracted) == _normalize(value)
+            if best_field is None or agreed > best_field[0]:
+                best_field = (agreed, selector)
+        if best_field is not None and best_field[0] >= min_agreement * len(expected):
+            template_fields[name] = best_field[1]
+        elif len(expected) >= len(placed) / 2:
+            return None, f'no selector reproduces the values of "{name}"'
+
+    if not template_fields:
+        return None, "no field could be located"
+    template = {"container": container_expression, "fields": template_fields, "learned_from": url}
+    extracted = apply_template(template, html, url, fields)
+    for name, selector in template_fields.items():
+        selector["fill"] = sum(record.get(name) is not None for record in extracted) / max(1, len(extracted))
+    return template, None
+
+
+def apply_template(template, html, url, fields):
+    """The records the template extracts from a page, validated against the fields' schema."""
+    schema = get_listing_schema(fields)
+    root = parse_html(html)
+    if root is None:
+        return []
+    records = []
+    for container in root.xpath(template["container"]):
+        record = schema.validate({name: _extract(container, selector, url) for name, selector in template["fields"].items()})
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def _fields_key(fields) -> str:
+    return hashlib.sha256(json.dumps(list(fields)).encode("utf-8")).hexdigest()
+
+
+class TemplateStore:
+    def __init__(self, path=SELECTOR_TEMPLATE_PATH, enabled=SELECTOR_TEMPLATES_ENABLED, min_fill_ratio=SELECTOR_MIN_FILL_RATIO):
+        self.path = path
+        self.enabled = enabled
+        self.min_fill_ratio = min_fill_ratio
+        self.stats = Counter()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                domain TEXT NOT NULL,
+                fields_key TEXT NOT NULL,
+                template TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (domain, fields_key)
+            )
+        """)
+        self._db.commit()
+
+    def with_options(self, **options):
+        """
+        A view for one run or UI session: it shares the database and counters, but has
+        its own enabled and min_fill_ratio settings.
+        """
+        view = copy.copy(self)
+        for name, value in options.items():
+            if name not in ("enabled", "min_fill_ratio"):
+                raise TypeError(f"Unknown template store option: {name}")
+            setattr(view, name, value)
+        return view
+
+    def get(self, url, fields):
+        with self._lock:
+            row = self._db.execute("SELECT template FROM templates WHERE domain = ? AND fields_key = ?",
+                                   (urlsplit(url).netloc, _fields_key(fields))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def extract(self, url, fields, html):
+        """
+        Extract a page with its domain's template, as {"listings": [...]}.
+
+        Returns None, so the LLM is asked instead, when the domain has no template or the
+        template no longer finds records or fills in its fields the way it did when learned.
+        """
+        if not self.enabled or not html:
+            return None
+        template = self.get(url, fields)
+        if template is None:
+            self.stats["misses"] += 1
+            return None
+        records = apply_template(template, html, url, fields)
+        for name, selector in template["fields"].items():
+            fill = sum(record.get(name) is not None for record in records) / max(1, len(records))
+            if not records or fill < selector["fill"] * self.min_fill_ratio:
+                print(f"Selector template of {urlsplit(url).netloc} no longer matches {url}, using the LLM")
+                self.stats["fallbacks"] += 1
+                return None
+        self.stats["hits"] += 1
+        return {"listings": records}
+
+    def learn(self, url, fields, html, formatted_data):
+        """Learn (or replace) the domain's template from an LLM extraction of the page; returns it, or None."""
+        if not self.enabled or not html or formatted_data is None:
+            return None
+        template, reason = learn_template(html, url, fields, records_from_formatted_data(formatted_data))
+        if template is None:
+            print(f"No selector template learned from {url}: {reason}")
+            self.stats["rejected"] += 1
+            return None
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO templates (domain, fields_key, template, updated_at) VALUES (?, ?, ?, ?)",
+                             (urlsplit(url).netloc, _fields_key(fields), json.dumps(template), time.time()))
+            self._db.commit()
+        print(f"Learned selector template for {urlsplit(url).netloc}: {template['container']}")
+        self.stats["learned"] += 1
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM templates")
+            self._db.commit()
+        self.stats.clear()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_template_store():
+    """Return the process-wide template store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TemplateStore()
+        return _default_store
@@ -2,9 +2,22 @@ import streamlit as st
 import pandas as pd
 import json
 from datetime import datetime
-from scraper import fetch_html_selenium, save_raw_data, format_data, save_formatted_data, html_to_markdown_with_readability, scrape_url
+from scraper import fetch_html_selenium, save_raw_data, format_data, save_formatted_data, html_to_markdown_with_readability, scrape_urls_concurrently, SPANS_FILE_NAME
+from assets import MAX_CONCURRENT_URLS, FETCH_MODE, PAGE_CACHE_ENABLED, CRAWL_MAX_PAGES, METRICS_PORT, EXTRACTION_BACKEND, LOW_MEMORY_MODE, LOW_MEMORY_PREVIEW_ROWS
+from crawler import crawl_pagination
+from output_sinks import export_excel
+from page_cache import get_page_cache
+from llm_cache import get_llm_cache
+from llm_dispatcher import get_llm_dispatcher
+from extraction_backends import BACKENDS, get_extraction_backend
 from pagination_detector import detect_pagination_elements, PaginationData
+from driver_pool import get_driver_pool
+from instrumentation import read_traces, summarize_traces, start_metrics_server
+from job_store import get_job_store
+from change_detection import get_change_store
+from selector_templates import get_template_store
 import re
+from itertools import islice
 from urllib.parse import urlparse
 import os
 
@@ -13,6 +26,9 @@ import os
 st.set_page_config(page_title=" Web Scraper", page_icon="🕸")
 st.title(" Web Scraper ")
 
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
+
 # Initialize session state variables if they don't exist
 if 'results' not in st.session_state:
     st.session_state['results'] = None
@@ -33,9 +49,44 @@ st.sidebar.markdown("---")
 # Add pagination toggle and input
 use_pagination = st.sidebar.toggle("Enable Pagination")
 pagination_details = None
+crawl_pagination_pages = False
 if use_pagination:
     pagination_details = st.sidebar.text_input("Enter Pagination Details (optional)", 
         help="Describe how to navigate through pages (e.g., 'Next' button class, URL pattern)")
+    crawl_pagination_pages = st.sidebar.toggle("Crawl Detected Pages",
+        help="Scrape the detected pages too, following pagination found on them up to the page budget")
+    if crawl_pagination_pages:
+        crawl_max_pages = st.sidebar.number_input("Max Pages", min_value=1, max_value=10000, value=CRAWL_MAX_PAGES)
+
+st.sidebar.markdown("---")
+max_workers = st.sidebar.number_input("Concurrent URLs", min_value=1, max_value=32, value=MAX_CONCURRENT_URLS,
+    help="How many URLs are fetched and processed at the same time")
+fetch_mode_options = ["auto", "http", "browser"]
+fetch_mode = st.sidebar.selectbox("Fetch Mode", fetch_mode_options, index=fetch_mode_options.index(FETCH_MODE),
+    help="'auto' uses plain HTTP for server-rendered pages and the browser only when a page needs JavaScript")
+use_page_cache = st.sidebar.toggle("Use Page Cache", value=PAGE_CACHE_ENABLED,
+    help="Reuse previously fetched pages and their markdown, e.g. while iterating on the fields to extract")
+low_memory_mode = st.sidebar.toggle("Low Memory Mode", value=LOW_MEMORY_MODE,
+    help="For very large pages: keep pages on disk, only their main content, and show a preview of the results")
+backend_options = list(BACKENDS)
+extraction_backend = st.sidebar.selectbox("Extraction Backend", backend_options, index=backend_options.index(EXTRACTION_BACKEND),
+    help="'groq' uses the hosted API, 'local' an OpenAI-compatible server such as LM Studio")
+# Passed to every run of this session, so sessions choosing different backends don't interfere
+backend = get_extraction_backend(extraction_backend)
+# Like the backend, these settings only apply to this session's runs: the stores are shared, their settings are not
+use_llm_cache = st.sidebar.toggle("Use LLM Cache", value=get_llm_cache().enabled,
+    help="Reuse model answers for identical page content, fields and model")
+refresh_llm_cache = st.sidebar.toggle("Refresh LLM Cache", value=False, disabled=not use_llm_cache,
+    help="Ask the model again and replace the cached answers, e.g. after changing the prompts")
+llm_cache = get_llm_cache().with_options(enabled=use_llm_cache, refresh=refresh_llm_cache)
+if st.sidebar.button("Clear LLM Cache"):
+    llm_cache.clear()
+skip_unchanged = st.sidebar.toggle("Skip Unchanged Pages", value=get_change_store().enabled,
+    help="Reuse the records of pages whose content has not changed since they were last scraped")
+change_store = get_change_store().with_options(enabled=skip_unchanged)
+learn_templates = st.sidebar.toggle("Learn Selector Templates", value=get_template_store().enabled,
+    help="Learn each domain's record layout from LLM extractions and extract later pages of the domain without the LLM")
+template_store = get_template_store().with_options(enabled=learn_templates)
 
 st.sidebar.markdown("---")
 
@@ -57,23 +108,40 @@ def generate_unique_folder_name(url):
     
     return f"{clean_domain}_{timestamp}"
 
-def scrape_multiple_urls(urls, fields):
-    output_folder = os.path.join('output', generate_unique_folder_name(urls[0]))
-    os.makedirs(output_folder, exist_ok=True)
+def crawl_urls(urls, fields, job=None):
+    pool = get_driver_pool()
+    if job is None:
+        output_folder = os.path.join('output', generate_unique_folder_name(urls[0]))
+        job = get_job_store().create_job(urls, fields, output_folder, kind="crawl",
+                                         params={"indications": pagination_details, "max_pages": int(crawl_max_pages)})
+    os.makedirs(job.output_folder, exist_ok=True)
     
-    all_data = []
-    first_url_markdown = None
+    cache = get_page_cache() if use_page_cache else None
+    all_data, first_url_markdown, report = crawl_pagination(urls, job.fields, job.output_folder, job.params["indications"],
+                                                            max_pages=job.params["max_pages"], pool=pool,
+                                                            max_workers=int(max_workers), fetch_mode=fetch_mode, cache=cache,
+                                                            job=job, low_memory=low_memory_mode, backend=backend,
+                                                            llm_cache=llm_cache, changes=change_store,
+                                                            templates=template_store)
     
-    for i, url in enumerate(urls, start=1):
-        raw_html = fetch_html_selenium(url)
-        markdown = html_to_markdown_with_readability(raw_html)
-        if i == 1:
-            first_url_markdown = markdown
-        
-        formatted_data = scrape_url(url, fields, output_folder, i, markdown)
-        all_data.append(formatted_data)
+    return job.output_folder, all_data, first_url_markdown, report
+
+def scrape_multiple_urls(urls, fields, job=None):
+    # The pool lives at module level, so browsers survive Streamlit reruns
+    pool = get_driver_pool()
+    if job is None:
+        output_folder = os.path.join('output', generate_unique_folder_name(urls[0]))
+        job = get_job_store().create_job(urls, fields, output_folder)
+    os.makedirs(job.output_folder, exist_ok=True)
+    
+    cache = get_page_cache() if use_page_cache else None
+    all_data, first_url_markdown, report = scrape_urls_concurrently(job.urls_to_run(), job.fields, job.output_folder, pool,
+                                                                    int(max_workers), fetch_mode=fetch_mode, cache=cache,
+                                                                    job=job, low_memory=low_memory_mode, backend=backend,
+                                                                    llm_cache=llm_cache, changes=change_store,
+                                                                    templates=template_store)
     
-    return output_folder, all_data, first_url_markdown
+    return job.output_folder, all_data, first_url_markdown, report
 
 # Define the scraping function
 def perform_scrape():
@@ -86,7 +154,7 @@ def perform_scrape():
     pagination_info = None
     if use_pagination:
         pagination_data = detect_pagination_elements(
-            url_input, pagination_details, markdown
+            url_input, pagination_details, markdown, backend=backend, llm_cache=llm_cache
         )
         pagination_info = {
             "page_urls": pagination_data.page_urls
@@ -98,7 +166,7 @@ def perform_scrape():
     if show_tags:
     
         formatted_data = format_data(
-            markdown,fields
+            markdown,fields, backend=backend, llm_cache=llm_cache
         )
         df = save_formatted_data(formatted_data, timestamp)
     else:
@@ -107,18 +175,61 @@ def perform_scrape():
 
     return df, formatted_data, markdown, timestamp, pagination_info
 
+# Jobs interrupted (or with failed URLs) can be picked up where they stopped
+resume_job = None
+resumable_jobs = [(job, job.counts()) for job in get_job_store().list_jobs()]
+resumable_jobs = [(job, counts) for job, counts in resumable_jobs if counts["pending"] or counts["fetched"] or counts["failed"]]
+if resumable_jobs:
+    job_labels = {f"{job.id} ({counts['extracted']}/{sum(counts.values())} done, {counts['failed']} failed)": job
+                  for job, counts in resumable_jobs}
+    selected_job = st.sidebar.selectbox("Resume Job", list(job_labels),
+        help="Continue an earlier scrape in its own output folder; pages already extracted are not redone")
+    retry_failed = st.sidebar.toggle("Retry Failed URLs")
+    if st.sidebar.button("Resume"):
+        resume_job = job_labels[selected_job]
+
+if resume_job is not None:
+    with st.spinner('Please wait... Job is being resumed.'):
+        if retry_failed:
+            resume_job.retry_failed()
+        if resume_job.kind == "crawl":
+            output_folder, all_data, first_url_markdown, run_report = crawl_urls([], resume_job.fields, resume_job)
+            pagination_info = {
+                "page_urls": [url for url, depth, _ in resume_job.urls() if depth > 0],
+                "detected_by": "crawl"
+            }
+        else:
+            output_folder, all_data, first_url_markdown, run_report = scrape_multiple_urls([], resume_job.fields, resume_job)
+            pagination_info = None
+        # Low-memory runs don't keep the markdown around between reruns
+        st.session_state['results'] = (all_data, None, None if low_memory_mode else first_url_markdown, output_folder,
+                                       pagination_info, run_report)
+        st.session_state['low_memory'] = low_memory_mode
+        st.session_state['perform_scrape'] = True
+
 if st.sidebar.button("Scrape"):
     with st.spinner('Please wait... Data is being scraped.'):
         urls = url_input.split()
         field_list = fields
-        output_folder, all_data, first_url_markdown = scrape_multiple_urls(urls, field_list)
+        pagination_info = None
+        if use_pagination and crawl_pagination_pages:
+            # Pagination is followed while scraping; report every page reached beyond the seeds
+            output_folder, all_data, first_url_markdown, run_report = crawl_urls(urls, field_list)
+            pagination_info = {
+                "page_urls": [entry["url"] for entry in run_report if entry.get("depth", 0) > 0],
+                "detected_by": "crawl"
+            }
+        else:
+            output_folder, all_data, first_url_markdown, run_report = scrape_multiple_urls(urls, field_list)
         
         # Perform pagination if enabled and only one URL is provided
-        pagination_info = None
-        if use_pagination and len(urls) == 1:
+        if use_pagination and not crawl_pagination_pages and len(urls) == 1:
             try:
+                # The page cache still holds the seed's HTML, which lets the rules see rel="next" links
+                cached_page = get_page_cache().get(urls[0]) if use_page_cache else None
                 pagination_result = detect_pagination_elements(
-                    urls[0], pagination_details, first_url_markdown
+                    urls[0], pagination_details, first_url_markdown,
+                    cached_page.html if cached_page else None, backend, llm_cache
                 )
                 
                 if pagination_result is not None:
@@ -133,7 +244,8 @@ if st.sidebar.button("Scrape"):
                         page_urls = []
                     
                     pagination_info = {
-                        "page_urls": page_urls
+                        "page_urls": page_urls,
+                        "detected_by": pagination_data.get("detected_by") if isinstance(pagination_data, dict) else "llm"
                     }
                 else:
                     st.warning("Pagination detection returned None. No pagination information available.")
@@ -144,12 +256,79 @@ if st.sidebar.button("Scrape"):
                     
                 }
         
-        st.session_state['results'] = (all_data, None, first_url_markdown, output_folder, pagination_info)
+        # Low-memory runs don't keep the markdown around between reruns
+        st.session_state['results'] = (all_data, None, None if low_memory_mode else first_url_markdown, output_folder,
+                                       pagination_info, run_report)
+        st.session_state['low_memory'] = low_memory_mode
         st.session_state['perform_scrape'] = True
 
 # Display results if they exist in session state
 if st.session_state['results']:
-    all_data, _, _,  output_folder, pagination_info = st.session_state['results']
+    all_data, _, _,  output_folder, pagination_info, run_report = st.session_state['results']
+
+    # Show how each URL was fetched
+    if run_report:
+        st.sidebar.markdown("---")
+        st.sidebar.markdown("### Fetch Modes")
+        fetch_modes = pd.Series([entry["fetch_mode"] or "failed" for entry in run_report]).value_counts()
+        for mode, count in fetch_modes.items():
+            st.sidebar.markdown(f"**{mode}:** {count}")
+
+        if use_page_cache:
+            st.sidebar.markdown("### Page Cache")
+            cache_statuses = pd.Series([entry.get("cache") or "not fetched" for entry in run_report]).value_counts()
+            for status, count in cache_statuses.items():
+                st.sidebar.markdown(f"**{status}:** {count}")
+
+        tokens_in = sum(entry.get("tokens_in") or 0 for entry in run_report)
+        tokens_out = sum(entry.get("tokens_out") or 0 for entry in run_report)
+        if tokens_in:
+            st.sidebar.markdown("### Pruning")
+            st.sidebar.markdown(f"**Tokens:** {tokens_in:,} → {tokens_out:,} ({1 - tokens_out / tokens_in:.0%} saved)")
+
+        changes = pd.Series([entry.get("change") for entry in run_report if entry.get("change")]).value_counts()
+        if not changes.empty:
+            st.sidebar.markdown("### Page Changes")
+            for change, count in changes.items():
+                st.sidebar.markdown(f"**{change}:** {count}")
+
+        extracted_by = pd.Series([entry.get("extracted_by") for entry in run_report if entry.get("extracted_by")]).value_counts()
+        if "selectors" in extracted_by:
+            st.sidebar.markdown("### Extracted By")
+            for extractor, count in extracted_by.items():
+                st.sidebar.markdown(f"**{extractor}:** {count}")
+
+        transferred = sum(entry.get("bytes_transferred") or 0 for entry in run_report)
+        blocked = sum(entry.get("requests_blocked") or 0 for entry in run_report)
+        if transferred or blocked:
+            st.sidebar.markdown("### Browser Traffic")
+            st.sidebar.markdown(f"**Transferred:** {transferred / 1e6:.1f} MB / **Requests blocked:** {blocked:,}")
+
+        spans_path = os.path.join(output_folder, SPANS_FILE_NAME)
+        if os.path.exists(spans_path):
+            stage_summary = summarize_traces(read_traces(spans_path))
+            if stage_summary:
+                st.sidebar.markdown("### Stage Timings (s)")
+                st.sidebar.dataframe(pd.DataFrame(stage_summary).T[["count", "mean", "p50", "p95"]].round(2),
+                                     use_container_width=True)
+
+    if extraction_backend == "groq":
+        llm_stats = get_llm_dispatcher().stats
+        if llm_stats["requests"]:
+            st.sidebar.markdown("### LLM Requests")
+            st.sidebar.markdown(f"**Sent:** {llm_stats['requests']} / **Retried:** {llm_stats['retries']} / "
+                                f"**Rate limited:** {llm_stats['rate_limited']} / **Coalesced:** {llm_stats['coalesced']}")
+    else:
+        llm_stats = backend.stats
+        if llm_stats["requests"]:
+            st.sidebar.markdown("### LLM Requests")
+            st.sidebar.markdown(f"**Sent:** {llm_stats['requests']} / **Batched prompts:** {llm_stats['batched_prompts']}")
+
+    if llm_cache.enabled:
+        llm_cache_report = llm_cache.report()
+        st.sidebar.markdown("### LLM Cache")
+        st.sidebar.markdown(f"**Hits:** {llm_cache_report['hits']} / **Misses:** {llm_cache_report['misses']} "
+                            f"({llm_cache_report['hit_rate']:.0%} hit rate)")
     
     # Display scraping details in sidebar only if scraping was performed and the toggle is on
     if all_data and show_tags:
@@ -158,7 +337,16 @@ if st.session_state['results']:
 
         # Display scraped data in main area
         st.subheader("Scraped/Parsed Data")
-        for i, data in enumerate(all_data, start=1):
+        jsonl_path = os.path.join(output_folder, "scraped_data.jsonl")
+        if st.session_state.get('low_memory'):
+            # all_data only holds summaries; the records are previewed from the streamed output
+            st.dataframe(pd.DataFrame([summary for summary in all_data if summary]), use_container_width=True)
+            if os.path.exists(jsonl_path):
+                st.write(f"First {LOW_MEMORY_PREVIEW_ROWS} records:")
+                with open(jsonl_path, "r", encoding="utf-8") as f:
+                    preview = [json.loads(line) for line in islice(f, LOW_MEMORY_PREVIEW_ROWS)]
+                st.dataframe(pd.DataFrame(preview), use_container_width=True)
+        for i, data in enumerate([] if st.session_state.get('low_memory') else all_data, start=1):
             st.write(f"Data from URL {i}:")
             
             # Handle string data (convert to dict if it's JSON)
@@ -190,34 +378,41 @@ if st.session_state['results']:
         st.subheader("Download Options")
         col1, col2 = st.columns(2)
         with col1:
-            json_data = json.dumps(all_data, default=lambda o: o.dict() if hasattr(o, 'dict') else str(o), indent=4)
-            st.download_button(
-                "Download JSON",
-                data=json_data,
-                file_name="scraped_data.json"
-            )
+            if st.session_state.get('low_memory'):
+                if os.path.exists(jsonl_path):
+                    with open(jsonl_path, "rb") as f:
+                        st.download_button(
+                            "Download JSON Lines",
+                            data=f,
+                            file_name="scraped_data.jsonl"
+                        )
+            else:
+                json_data = json.dumps(all_data, default=lambda o: o.dict() if hasattr(o, 'dict') else str(o), indent=4)
+                st.download_button(
+                    "Download JSON",
+                    data=json_data,
+                    file_name="scraped_data.json"
+                )
         with col2:
-            # Convert all data to a single DataFrame
-            all_listings = []
-            for data in all_data:
-                if isinstance(data, str):
-                    try:
-                        data = json.loads(data)
-                    except json.JSONDecodeError:
-                        continue
-                if isinstance(data, dict) and 'listings' in data:
-                    all_listings.extend(data['listings'])
-                elif hasattr(data, 'listings'):
-                    all_listings.extend([item.dict() for item in data.listings])
-                else:
-                    all_listings.append(data)
-            
-            combined_df = pd.DataFrame(all_listings)
-            st.download_button(
-                "Download CSV",
-                data=combined_df.to_csv(index=False),
-                file_name="scraped_data.csv"
-            )
+            # The run already streamed every record to CSV, so serve that file instead of rebuilding it
+            csv_path = os.path.join(output_folder, "scraped_data.csv")
+            if os.path.exists(csv_path):
+                with open(csv_path, "rb") as f:
+                    st.download_button(
+                        "Download CSV",
+                        data=f,
+                        file_name="scraped_data.csv"
+                    )
+
+        # Excel is slow to build, so it is only generated when asked for
+        if os.path.exists(jsonl_path) and st.button("Generate Excel"):
+            excel_path = export_excel(jsonl_path)
+            with open(excel_path, "rb") as f:
+                st.download_button(
+                    "Download Excel",
+                    data=f,
+                    file_name="scraped_data.xlsx"
+                )
 
         st.success(f"Scraping completed. Results saved in {output_folder}")
 
@@ -226,6 +421,8 @@ if st.session_state['results']:
         st.sidebar.markdown("---")
         st.sidebar.markdown("### Pagination Details")
         st.sidebar.markdown(f"**Number of Page URLs:** {len(pagination_info['page_urls'])}")
+        if pagination_info.get("detected_by"):
+            st.sidebar.markdown(f"**Detected by:** {pagination_info['detected_by']}")
 
         st.markdown("---")
         st.subheader("Pagination Information")
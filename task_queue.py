@@ -0,0 +1,256 @@
+"""
+Shared queue of page tasks for distributed runs.
+
+A coordinator adds a job's pages as pending tasks; worker processes lease them,
+run them and push back a result. A lease lasts TASK_LEASE_SECONDS unless the
+worker renews it, so the pages of a worker that crashed or was cut off are
+handed to another worker once their lease expires. Delivery is at least once:
+a page can be run twice, but only its first result is kept, and a page is
+failed for good after TASK_MAX_ATTEMPTS leases.
+
+The queue is one SQLite file, which every process opens on its own and locks
+for the duration of each transaction, so workers on several hosts only need to
+share a filesystem with working file locks.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from assets import TASK_QUEUE_PATH, TASK_LEASE_SECONDS, TASK_MAX_ATTEMPTS
+
+TASK_STATES = ("pending", "leased", "done", "failed")
+
+
+class Task:
+    """One leased page of a job."""
+
+    def __init__(self, task_id, job_id, url, depth, file_number, attempts, worker=None):
+        self.id = task_id
+        self.job_id = job_id
+        self.url = url
+        self.depth = depth
+        self.file_number = file_number
+        self.attempts = attempts
+        self.worker = worker
+
+
+class TaskQueue:
+    def __init__(self, path=TASK_QUEUE_PATH, lease_seconds=TASK_LEASE_SECONDS, max_attempts=TASK_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Transactions are explicit, and other processes holding the lock are waited for
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS queue_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    fields TEXT NOT NULL,
+                    output_folder TEXT NOT NULL,
+                    params TEXT NOT NULL
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    depth INTEGER NOT NULL DEFAULT 0,
+                    file_number INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (job_id, url)
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS task_results (
+                    task_id INTEGER PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    depth INTEGER NOT NULL,
+                    records TEXT,
+                    discovered TEXT NOT NULL,
+                    report TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS task_results_job ON task_results (job_id)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never lease the same task
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def add_job(self, job):
+        """Publish a job's fields, output folder and parameters for the workers."""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO queue_jobs (id, kind, fields, output_folder, params) VALUES (?, ?, ?, ?, ?)",
+                       (job.id, job.kind, json.dumps(job.fields), job.output_folder, json.dumps(job.params)))
+
+    def get_job(self, job_id):
+        """(kind, fields, output_folder, params) of a published job, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT kind, fields, output_folder, params FROM queue_jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2], json.loads(row[3])
+
+    def enqueue(self, job_id, pages):
+        """
+        Add (url, depth, file_number) pages as pending tasks; returns how many were queued.
+
+        Pages already queued are left alone unless they failed, in which case they are
+        queued again with a fresh attempt budget (the job was asked to retry them).
+        """
+        now = time.time()
+        queued = 0
+        with self._transaction() as db:
+            for url, depth, file_number in pages:
+                queued += db.execute("""
+                    INSERT INTO tasks (job_id, url, depth, file_number, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (job_id, url) DO UPDATE SET state = 'pending', attempts = 0, error = NULL,
+                        worker = NULL, lease_expires = NULL, updated_at = excluded.updated_at
+                    WHERE tasks.state = 'failed'""", (job_id, url, depth, file_number, now)).rowcount
+        return queued
+
+    def lease(self, worker, limit=1):
+        """Lease up to `limit` pending tasks (or tasks whose lease expired) to `worker`."""
+        now = time.time()
+        with self._transaction() as db:
+            self._expire(db, now)
+            rows = db.execute("SELECT id, job_id, url, depth, file_number, attempts FROM tasks "
+                              "WHERE state = 'pending' AND attempts < ? ORDER BY id LIMIT ?", (self.max_attempts, limit)).fetchall()
+            db.executemany("UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                           "updated_at = ? WHERE id = ?",
+                           [(worker, now + self.lease_seconds, now, row[0]) for row in rows])
+        return [Task(*row[:5], row[5] + 1, worker) for row in rows]
+
+    def renew(self, worker, task_ids):
+        """Extend the leases `worker` still holds on `task_ids`; returns the ids it still holds."""
+        if not task_ids:
+            return []
+        now = time.time()
+        held = []
+        with self._transaction() as db:
+            for task_id in task_ids:
+                if db.execute("UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                              (now + self.lease_seconds, now, task_id, worker)).rowcount:
+                    held.append(task_id)
+        return held
+
+    def complete(self, task, records, discovered=(), report=None, error=None):
+        """
+        Push the result of a task: its records (None if nothing was extracted, with the
+        `error`), the page URLs discovered on it and its run report entry. Returns False
+        if the task already has a result, e.g. from a worker whose lease had expired.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            updated = db.execute("UPDATE tasks SET state = ?, error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                                 "WHERE id = ? AND state IN ('pending', 'leased')",
+                                 ("done" if records is not None else "failed", error, now, task.id)).rowcount
+            if updated:
+                self._add_result(db, task.id, task.job_id, task.url, task.depth, records, discovered, report, error, now)
+        return bool(updated)
+
+    def fail(self, task, error):
+        """
+        Give a task back after an error; it is retried until it has used up its attempts.
+        Does nothing if the task's lease has expired and it was leased again since.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            if task.attempts < self.max_attempts:
+                db.execute("UPDATE tasks SET state = 'pending', error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                           "WHERE id = ? AND state = 'leased' AND worker = ?", (error, now, task.id, task.worker))
+                return
+            if db.execute("UPDATE tasks SET state = 'failed', error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                          "WHERE id = ? AND state = 'leased' AND worker = ?", (error, now, task.id, task.worker)).rowcount:
+                self._add_result(db, task.id, task.job_id, task.url, task.depth, None, (), None, error, now)
+
+    def _expire(self, db, now):
+        """Requeue tasks whose lease expired, and fail those (and pending ones) that have used up their attempts."""
+        expired = db.execute("SELECT id, job_id, url, depth, attempts FROM tasks "
+                             "WHERE (state = 'leased' AND lease_expires < ?) OR (state = 'pending' AND attempts >= ?)",
+                             (now, self.max_attempts)).fetchall()
+        for task_id, job_id, url, depth, attempts in expired:
+            if attempts < self.max_attempts:
+                db.execute("UPDATE tasks SET state = 'pending', worker = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                           (now, task_id))
+            else:
+                error = f"gave up after {attempts} attempts"
+                db.execute("UPDATE tasks SET state = 'failed', error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                           "WHERE id = ?", (error, now, task_id))
+                self._add_result(db, task_id, job_id, url, depth, None, (), None, error, now)
+        if expired:
+            print(f"Requeued or gave up on {len(expired)} expired or exhausted task(s)")
+
+    def _add_result(self, db, task_id, job_id, url, depth, records, discovered, report, error, now):
+        db.execute("INSERT OR REPLACE INTO task_results (task_id, job_id, url, depth, records, discovered, report, error, created_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   (task_id, job_id, url, depth, None if records is None else json.dumps(records, default=str),
+                    json.dumps(list(discovered)), None if report is None else json.dumps(report, default=str), error, now))
+
+    def results(self, job_id, limit=100):
+        """
+        The oldest results of a job not yet acknowledged, as dicts. Expired leases are
+        swept first, so a job still finishes when all its workers are gone.
+        """
+        with self._transaction() as db:
+            self._expire(db, time.time())
+            rows = db.execute("SELECT task_id, url, depth, records, discovered, report, error FROM task_results "
+                              "WHERE job_id = ? ORDER BY created_at LIMIT ?", (job_id, limit)).fetchall()
+        return [{"task_id": row[0], "url": row[1], "depth": row[2],
+                 "records": None if row[3] is None else json.loads(row[3]), "discovered": json.loads(row[4]),
+                 "report": None if row[5] is None else json.loads(row[5]), "error": row[6]} for row in rows]
+
+    def acknowledge(self, task_ids):
+        """Drop results the coordinator has saved."""
+        with self._transaction() as db:
+            db.executemany("DELETE FROM task_results WHERE task_id = ?", [(task_id,) for task_id in task_ids])
+
+    def counts(self, job_id):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY state", (job_id,))
+            counts = Counter(dict(rows.fetchall()))
+        return {state: counts[state] for state in TASK_STATES}
+
+    def outstanding(self, job_id):
+        """How many of the job's tasks are still queued or running, plus results not yet acknowledged."""
+        with self._lock:
+            running, = self._db.execute("SELECT COUNT(*) FROM tasks WHERE job_id = ? AND state IN ('pending', 'leased')",
+                                        (job_id,)).fetchone()
+            unsaved, = self._db.execute("SELECT COUNT(*) FROM task_results WHERE job_id = ?", (job_id,)).fetchone()
+        return running + unsaved
+
+
+_default_queues = {}
+_default_queues_lock = threading.Lock()
+
+
+def get_task_queue(path=TASK_QUEUE_PATH):
+    """Return this process's queue at `path`, opening it on first use."""
+    with _default_queues_lock:
+        if path not in _default_queues:
+            _default_queues[path] = TaskQueue(path)
+        return _default_queues[path]
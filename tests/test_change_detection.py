@@ -0,0 +1,56 @@
+import pytest
+
+from change_detection import ChangeStore, hamming_distance, simhash
+
+FIELDS = ["Name", "Price"]
+MODEL = "test-model"
+PAGE = "\n".join(f"## Product {n}\n\nA sturdy oak table, seats six.\n\nPrice: ${n}99.00" for n in range(1, 21))
+RECORDS = {"listings": [{"Name": f"Product {n}", "Price": f"{n}99.00"} for n in range(1, 21)]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChangeStore(str(tmp_path / "fingerprints.sqlite3"), enabled=True)
+
+
+def test_page_is_new_until_recorded_then_unchanged(store):
+    url = "https://shop.example.com/tables"
+    assert store.lookup(url, FIELDS, PAGE, MODEL) == ("new", None)
+    store.record(url, FIELDS, PAGE, RECORDS, MODEL)
+    assert store.lookup(url, FIELDS, PAGE, MODEL) == ("unchanged", RECORDS)
+    assert store.stats == {"new": 1, "unchanged": 1}
+
+
+def test_price_change_is_a_change(store):
+    url = "https://shop.example.com/tables"
+    store.record(url, FIELDS, PAGE, RECORDS, MODEL)
+    repriced = PAGE.replace("Price: $599.00", "Price: $549.00")
+    # Near-identical pages still count as changed unless near-duplicate matching is turned on
+    assert hamming_distance(simhash(PAGE), simhash(repriced)) <= 3
+    assert store.lookup(url, FIELDS, repriced, MODEL) == ("changed", None)
+
+
+def test_near_duplicates_are_unchanged_when_enabled(tmp_path):
+    store = ChangeStore(str(tmp_path / "fingerprints.sqlite3"), enabled=True, max_distance=3)
+    store.record("https://shop.example.com/tables", FIELDS, PAGE, RECORDS, MODEL)
+    status, _ = store.lookup("https://shop.example.com/tables", FIELDS, PAGE + "\n\nUpdated today.", MODEL)
+    assert status == "unchanged"
+
+
+def test_urls_are_compared_normalized(store):
+    store.record("https://Shop.example.com/tables/?utm_source=mail#top", FIELDS, PAGE, RECORDS, MODEL)
+    assert store.lookup("https://shop.example.com/tables", FIELDS, PAGE, MODEL)[0] == "unchanged"
+    assert store.lookup("https://shop.example.com/tables?page=2", FIELDS, PAGE, MODEL)[0] == "new"
+
+
+def test_fingerprints_are_kept_per_fields_and_model(store):
+    url = "https://shop.example.com/tables"
+    store.record(url, FIELDS, PAGE, RECORDS, MODEL)
+    assert store.lookup(url, ["Name"], PAGE, MODEL)[0] == "new"
+    assert store.lookup(url, FIELDS, PAGE, "other-model")[0] == "new"
+
+
+def test_disabled_store_treats_every_page_as_new(tmp_path):
+    store = ChangeStore(str(tmp_path / "fingerprints.sqlite3"), enabled=False)
+    store.record("https://shop.example.com/tables", FIELDS, PAGE, RECORDS, MODEL)
+    assert store.lookup("https://shop.example.com/tables", FIELDS, PAGE, MODEL) == ("new", None)
@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from chunking import count_tokens, merge_extractions, record_key, split_markdown
+
+
+def listing_page(sections=8, items=12):
+    return "\n\n".join(
+        f"## Department {s}\n\n" + "\n\n".join(f"- Coach {s}.{i}, Head Coach, coach{s}{i}@example.edu" for i in range(items))
+        for s in range(sections))
+
+
+def test_small_page_is_one_chunk():
+    page = listing_page(1, 3)
+    assert split_markdown(page, 1000) == [page]
+
+
+def test_chunks_stay_within_the_token_budget():
+    page = listing_page()
+    chunks = split_markdown(page, 200)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    # Nothing is lost or reordered
+    assert "".join(chunks).replace("\n", "") == page.replace("\n", "")
+
+
+def test_chunks_are_cut_at_headings():
+    page = listing_page()
+    chunks = split_markdown(page, 300)
+    assert all(chunk.startswith("## Department") for chunk in chunks)
+
+
+def test_records_are_not_split_across_chunks():
+    page = listing_page()
+    records = {line for line in page.splitlines() if line.startswith("- ")}
+    chunked = [{line for line in chunk.splitlines() if line.startswith("- ")} for chunk in split_markdown(page, 150)]
+    assert all(lines <= records for lines in chunked)
+    assert set().union(*chunked) == records
+
+
+def test_oversized_block_is_split_by_tokens():
+    block = "word " * 1000
+    chunks = split_markdown(block, 100)
+    assert len(chunks) >= 10
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_record_key_ignores_case_and_whitespace():
+    assert record_key({"Name": " Alex Smith ", "Email": "ALEX@example.edu"}) == \
+        record_key({"name": "alex smith", "email": "alex@example.edu"})
+    assert record_key({"Name": "Alex"}) != record_key({"Name": "Sam"})
+
+
+def test_merge_deduplicates_records_from_overlapping_chunks():
+    merged = merge_extractions([
+        {"listings": [{"Name": "Alex"}, {"Name": "Sam"}], "page": 1},
+        None,
+        {"listings": [{"Name": "sam "}, {"Name": "Jordan"}], "page": 2},
+    ])
+    assert merged == {"listings": [{"Name": "Alex"}, {"Name": "Sam"}, {"Name": "Jordan"}], "page": 1}
@@ -0,0 +1,66 @@
+from json_stream import ListingStream, extract_json
+
+ANSWER = '{"listings": [{"Name": "Alex Smith", "Email": "alex@example.edu"}, {"Name": "Sam {Chen}"}], "total": 2}'
+
+
+def feed_in_pieces(stream, text, size):
+    completed = []
+    for i in range(0, len(text), size):
+        completed.append(stream.feed(text[i:i + size]))
+    return completed
+
+
+def test_records_are_yielded_as_soon_as_they_close():
+    stream = ListingStream()
+    completed = feed_in_pieces(stream, ANSWER, 1)
+    # The first record comes out well before the answer ends
+    first = next(i for i, records in enumerate(completed) if records)
+    assert first < ANSWER.index("Sam")
+    assert [record for records in completed for record in records] == [
+        {"Name": "Alex Smith", "Email": "alex@example.edu"}, {"Name": "Sam {Chen}"}]
+    assert stream.finish() == {"listings": stream.records, "total": 2}
+
+
+def test_prose_and_code_fences_around_the_answer_are_ignored():
+    stream = ListingStream()
+    stream.feed("Here are the listings:\n```json\n" + ANSWER + "\n```\nLet me know if you need more.")
+    assert stream.finish()["total"] == 2
+    assert len(stream.records) == 2
+
+
+def test_cut_off_answer_keeps_the_completed_records():
+    stream = ListingStream()
+    stream.feed(ANSWER[:ANSWER.index("Sam") + 5])
+    assert stream.document() is None
+    assert stream.finish() == {"listings": [{"Name": "Alex Smith", "Email": "alex@example.edu"}]}
+
+
+def test_bare_array_is_taken_as_the_listings():
+    stream = ListingStream()
+    stream.feed('[{"Name": "a"}, {"Name": "b"}]')
+    assert stream.finish() == {"listings": [{"Name": "a"}, {"Name": "b"}]}
+
+
+def test_list_under_another_key_is_used_when_no_listings_were_streamed():
+    stream = ListingStream()
+    stream.feed('{"staff": [{"Name": "a"}]}')
+    assert stream.records == []
+    assert stream.finish() == {"listings": [{"Name": "a"}]}
+
+
+def test_validate_drops_and_transforms_records():
+    stream = ListingStream(lambda record: None if "Name" not in record else {"Name": record["Name"].upper()})
+    stream.feed('{"listings": [{"Name": "a"}, {"Title": "coach"}, {"Name": "b"}]}')
+    assert stream.finish() == {"listings": [{"Name": "A"}, {"Name": "B"}]}
+
+
+def test_answer_without_json_finishes_as_none():
+    stream = ListingStream()
+    stream.feed("I could not find any listings on this page.")
+    assert stream.finish() is None
+
+
+def test_extract_json_skips_prose():
+    assert extract_json('Sure! {"page_urls": ["https://example.com/?page=2"]} Hope this helps.') == {
+        "page_urls": ["https://example.com/?page=2"]}
+    assert extract_json("no json here") is None
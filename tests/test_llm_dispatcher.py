@@ -0,0 +1,95 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("groq")
+pytest.importorskip("dotenv")
+pytest.importorskip("tiktoken")
+
+from groq import RateLimitError
+
+from llm_dispatcher import LLMDispatcher, retry_after_seconds
+
+SYSTEM = 'Extract {"listings": [{\n"Name": "..."\n}]}'
+PAGE = "## Alex Smith\n\n## Sam Chen"
+
+
+@pytest.fixture
+def make_dispatcher():
+    dispatchers = []
+
+    def make(base_url, **options):
+        dispatcher = LLMDispatcher(api_key="test", base_url=base_url, **options)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.close()
+
+
+def error_with_retry_after(value):
+    return SimpleNamespace(response=SimpleNamespace(headers={"retry-after": value} if value is not None else {}))
+
+
+def test_retry_after_is_read_in_seconds_or_as_a_date():
+    assert retry_after_seconds(error_with_retry_after("1.5")) == 1.5
+    assert 8 <= retry_after_seconds(error_with_retry_after(formatdate(time.time() + 10, usegmt=True))) <= 10
+    assert retry_after_seconds(error_with_retry_after(None)) is None
+    assert retry_after_seconds(error_with_retry_after("soon")) is None
+    assert retry_after_seconds(Exception("no response")) is None
+
+
+def test_rate_limited_request_is_retried_after_retry_after(stub_server, make_dispatcher):
+    server, base_url = stub_server(rate_limit_first=1, retry_after=0.5)
+    dispatcher = make_dispatcher(base_url, max_retries=2)
+    start = time.monotonic()
+    answer = dispatcher.complete(SYSTEM, PAGE, "stub-model", timeout=10)
+    assert time.monotonic() - start >= 0.5
+    assert '"Name: Alex Smith"' in answer
+    assert server.state.requests == 2
+    assert (dispatcher.stats["rate_limited"], dispatcher.stats["retries"]) == (1, 1)
+
+
+def test_gives_up_after_max_retries(stub_server, make_dispatcher):
+    server, base_url = stub_server(rate_limit_first=10, retry_after=0.1)
+    dispatcher = make_dispatcher(base_url, max_retries=2)
+    with pytest.raises(RateLimitError):
+        dispatcher.complete(SYSTEM, PAGE, "stub-model", timeout=10)
+    assert server.state.requests == 3
+    assert dispatcher.stats["failures"] == 1
+
+
+def test_identical_prompts_in_flight_are_sent_once(stub_server, make_dispatcher):
+    server, base_url = stub_server(latency=0.5)
+    dispatcher = make_dispatcher(base_url)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        answers = list(executor.map(lambda _: dispatcher.complete(SYSTEM, PAGE, "stub-model", timeout=10), range(4)))
+    assert len(set(answers)) == 1
+    assert server.state.requests == 1
+    assert dispatcher.stats["coalesced"] == 3
+
+
+def test_different_prompts_are_not_merged(stub_server, make_dispatcher):
+    server, base_url = stub_server(latency=0.2)
+    dispatcher = make_dispatcher(base_url)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        answers = list(executor.map(lambda page: dispatcher.complete(SYSTEM, page, "stub-model", timeout=10),
+                                    [PAGE, "## Jordan Ito"]))
+    assert answers[0] != answers[1]
+    assert server.state.requests == 2
+    assert dispatcher.stats["coalesced"] == 0
+
+
+def test_streamed_answer_is_passed_on_in_pieces(stub_server, make_dispatcher):
+    _, base_url = stub_server()
+    dispatcher = make_dispatcher(base_url)
+    pieces = []
+    answer = dispatcher.complete(SYSTEM, PAGE, "stub-model", timeout=10, on_text=pieces.append)
+    assert len(pieces) > 1
+    assert "".join(pieces) == answer
+    # The usage of a stream arrives with its last chunk
+    assert dispatcher.stats["tokens"] > 0
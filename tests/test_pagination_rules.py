@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from fixture_site import PAGINATED_PAGES, paginated_page, static_page
+from pagination_detector import detect_pagination_rules
+
+BASE = "http://fixture.test"
+
+
+def test_fixture_pager_yields_the_other_pages():
+    page_urls, confidence = detect_pagination_rules(f"{BASE}/list?page=1", paginated_page(1))
+    assert page_urls == [f"{BASE}/list?page={n}" for n in range(2, PAGINATED_PAGES + 1)]
+    assert confidence == 0.9
+
+
+def test_current_page_is_left_out():
+    page_urls, _ = detect_pagination_rules(f"{BASE}/list?page=3", paginated_page(3))
+    assert f"{BASE}/list?page=3" not in page_urls
+    assert f"{BASE}/list?page=1" in page_urls
+
+
+def test_page_without_pagination_finds_nothing():
+    assert detect_pagination_rules(f"{BASE}/static/1", static_page(1)) == ([], 0.0)
+
+
+def test_elided_pager_is_filled_in():
+    html = " ".join(f'<a href="/results?page={n}">{n}</a>' for n in (1, 2, 3, 20))
+    page_urls, confidence = detect_pagination_rules(f"{BASE}/results", html)
+    assert page_urls == [f"{BASE}/results?page={n}" for n in range(2, 21)]
+    assert confidence == 0.9
+
+
+def test_product_links_under_p_are_not_pages():
+    products = " ".join(f'<a href="/p/{product_id}">Oak table {product_id}</a>' for product_id in (48213, 48977, 50112))
+    pager = '<a href="/shop?page=2">2</a> <a href="/shop?page=3">3</a>'
+    page_urls, confidence = detect_pagination_rules(f"{BASE}/shop", products + pager)
+    assert page_urls == [f"{BASE}/shop?page=2", f"{BASE}/shop?page=3"]
+    assert confidence == 0.9
+
+
+def test_page_paths_are_recognised():
+    html = " ".join(f'<a href="/blog/page/{n}/">{n}</a>' for n in (2, 3, 4))
+    page_urls, _ = detect_pagination_rules(f"{BASE}/blog/", html)
+    assert page_urls == [f"{BASE}/blog/page/{n}/" for n in (2, 3, 4)]
+
+
+def test_numbered_links_that_are_not_a_pager_are_not_filled_in():
+    # Numbers far apart in links labelled with titles look like ids, not pages
+    html = " ".join(f'<a href="/news?page={n}">Story {n}</a>' for n in (1, 250, 900))
+    assert detect_pagination_rules(f"{BASE}/news", html) == ([], 0.0)
+
+
+def test_rel_next_alone_is_followed():
+    html = '<link rel="next" href="/feed?cursor=abc123"><a href="/about">About</a>'
+    assert detect_pagination_rules(f"{BASE}/feed", html) == ([f"{BASE}/feed?cursor=abc123"], 0.9)
+
+
+def test_next_label_without_rel_is_a_weaker_signal():
+    html = '<a href="/archive?offset=20">Next</a>'
+    assert detect_pagination_rules(f"{BASE}/archive", html) == ([f"{BASE}/archive?offset=20"], 0.7)
+
+
+def test_markdown_links_are_used_without_html():
+    markdown = "[1](/list?page=1) [2](/list?page=2) [3](/list?page=3)"
+    page_urls, _ = detect_pagination_rules(f"{BASE}/list?page=1", markdown_content=markdown)
+    assert page_urls == [f"{BASE}/list?page=2", f"{BASE}/list?page=3"]
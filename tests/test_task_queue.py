@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from task_queue import TaskQueue
+
+
+class Job:
+    def __init__(self, job_id="job-1"):
+        self.id = job_id
+        self.kind = "scrape"
+        self.fields = ["Name"]
+        self.output_folder = "output/job-1"
+        self.params = {}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = TaskQueue(str(tmp_path / "tasks.sqlite3"), lease_seconds=0.2, max_attempts=2)
+    queue.add_job(Job())
+    queue.enqueue("job-1", [("https://example.com/a", 0, 1)])
+    return queue
+
+
+def test_expired_lease_is_handed_to_another_worker(queue):
+    task, = queue.lease("worker-a")
+    assert queue.lease("worker-b") == []
+    time.sleep(0.3)
+    retried, = queue.lease("worker-b")
+    assert (retried.id, retried.attempts, retried.worker) == (task.id, 2, "worker-b")
+
+
+def test_renewed_lease_does_not_expire(queue):
+    task, = queue.lease("worker-a")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.renew("worker-a", [task.id]) == [task.id]
+    assert queue.lease("worker-b") == []
+
+
+def test_only_the_first_result_is_kept(queue):
+    stale, = queue.lease("worker-a")
+    time.sleep(0.3)
+    current, = queue.lease("worker-b")
+    assert queue.complete(current, [{"Name": "a"}])
+    assert not queue.complete(stale, [{"Name": "stale"}])
+    result, = queue.results("job-1")
+    assert result["records"] == [{"Name": "a"}]
+
+
+def test_late_fail_from_an_expired_lease_leaves_the_new_lease_alone(queue):
+    stale, = queue.lease("worker-a")
+    time.sleep(0.3)
+    current, = queue.lease("worker-b")
+    queue.fail(stale, "fetch: timed out")
+    assert queue.counts("job-1")["leased"] == 1
+    assert queue.renew("worker-b", [current.id]) == [current.id]
+
+
+def test_task_is_given_up_after_its_attempts(queue):
+    task, = queue.lease("worker-a")
+    queue.fail(task, "fetch: timed out")
+    task, = queue.lease("worker-a")
+    queue.fail(task, "fetch: timed out")
+    assert queue.lease("worker-a") == []
+    assert queue.counts("job-1")["failed"] == 1
+    result, = queue.results("job-1")
+    assert result["records"] is None and result["error"] == "fetch: timed out"
+
+
+def test_expired_last_attempt_fails_the_task(queue):
+    queue.lease("worker-a")
+    time.sleep(0.3)
+    queue.lease("worker-a")
+    time.sleep(0.3)
+    assert queue.lease("worker-b") == []
+    result, = queue.results("job-1")
+    assert result["error"] == "gave up after 2 attempts"
+    assert queue.outstanding("job-1") == 1
+    queue.acknowledge([result["task_id"]])
+    assert queue.outstanding("job-1") == 0
+
+
+def test_failed_task_is_queued_again_with_a_fresh_budget(queue):
+    for _ in range(2):
+        task, = queue.lease("worker-a")
+        queue.fail(task, "process: bad answer")
+    assert queue.enqueue("job-1", [("https://example.com/a", 0, 1)]) == 1
+    task, = queue.lease("worker-a")
+    assert task.attempts == 1
+    # Pages that are not failed are left alone
+    assert queue.enqueue("job-1", [("https://example.com/a", 0, 1)]) == 0